@@ -1,5 +1,6 @@
 from .agents import (
     code_generator_agent,
+    code_editor_agent,
     write_code_to_file_agent,
     execute_code_agent,
     debug_code_agent,
@@ -8,11 +9,20 @@ from .agents import (
     execute_docker_agent,
     debug_code_execution_agent,
     debug_docker_execution_agent,
-    log_docker_container_errors
+    log_docker_container_errors,
+    hot_reload_agent,
+    release_docker_resources,
+    remember_successful_project,
+    verify_pending_fix,
+    test_agent,
+    take_snapshot,
+    rate_snapshot,
+    restore_best_snapshot,
 )
 
 __all__ = [
     "code_generator_agent",
+    "code_editor_agent",
     "write_code_to_file_agent",
     "execute_code_agent",
     "debug_code_agent",
@@ -21,5 +31,13 @@ __all__ = [
     "execute_docker_agent",
     "debug_code_execution_agent",
     "debug_docker_execution_agent",
-    "log_docker_container_errors"
+    "log_docker_container_errors",
+    "hot_reload_agent",
+    "release_docker_resources",
+    "remember_successful_project",
+    "verify_pending_fix",
+    "test_agent",
+    "take_snapshot",
+    "rate_snapshot",
+    "restore_best_snapshot",
 ]
@@ -1,13 +1,12 @@
 import inspect
 import asyncio
+import logging
 import subprocess
 import shlex
+import re
 import os
-import docker
-import chainlit as cl
 import time
-from docker.errors import APIError, ContainerError
-from typing import List
+from typing import Dict, List, Optional
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage, AIMessage
 
@@ -21,31 +20,201 @@ from schemas import (
     Documentation,
     DockerFile,
     DockerFiles,
+    TestSuite,
+    PlannedFile,
+    ProjectPlan,
+    ProjectEdit,
 )
 from prompts.prompts import (
     CODE_GENERATOR_AGENT_PROMPT,
+    CODE_ADAPTER_AGENT_PROMPT,
+    CODE_EDITOR_AGENT_PROMPT,
+    CODE_PLANNER_AGENT_PROMPT,
+    FILE_GENERATOR_AGENT_PROMPT,
     CODE_FIXER_AGENT_PROMPT,
     README_DEVELOPER_WRITER_AGENT_PROMPT,
     DOCKERFILE_GENERATOR_AGENT_PROMPT,
     DEBUG_DOCKER_FILES_AGENT_PROMPT,
+    TEST_GENERATOR_AGENT_PROMPT,
+    TEST_RUNNER_INSTRUCTIONS,
 )
+from prompts.rendering import render_prompt
+from utils.docker_templates import detect_runtime, render_docker_files, scope_docker_files
+from utils.settings import get_bool_setting, get_int_setting
+from executor import (
+    ExecutionJob,
+    container_logs,
+    container_state,
+    get_backend,
+    get_event_watcher,
+    get_lifecycle_manager,
+    get_worker_pool,
+    run_tests,
+    select_backend,
+    sync_into_container,
+)
+from executor.snapshots import get_snapshot_store
+from executor.build_context import MANIFESTS, order_manifests_first, write_dockerignore
+from executor.testing import detect_test_files
+from utils.log_pipeline import excerpt
+from utils.artifacts import artifact_filenames, get_artifact_store, prompt_excerpt
+from utils.events import emit
+from knowledge import (
+    ProjectEntry,
+    get_project_index,
+    reuse_threshold,
+    adapt_threshold,
+    get_fix_cache,
+    tokenize,
+)
+from agents.routing import ERROR_CLASSES, classify_error, execution_score
+
+logger = logging.getLogger(__name__)
+
+
+def plan_description(plan: ProjectPlan) -> str:
+    lines = [plan.description, f"Execution command: {plan.execution_command}", "Files:"]
+    for planned in plan.files:
+        role = ", executable" if planned.executable_code else ""
+        lines.append(
+            f"- {planned.filename} ({planned.programming_language}{role}): {planned.description}\n"
+            f"  Interface: {planned.interface}"
+        )
+    return "\n".join(lines)
+
+
+# Plan the files first, then write them concurrently
+async def generate_planned_project(requirement: str, llm, planner_llm) -> Optional[Codes]:
+    """
+    Plan the project's files and their interfaces in one call, then write every file
+    in its own concurrent call with the plan as shared context, so generation time
+    follows the largest file instead of the sum of all files.
+    Returns None when the plan has no files.
+
+    [GENERATION]
+    parallel = true
+    max_parallel = 8
+    """
+    started_at = time.monotonic()
+    plan = await planner_llm.with_structured_output(ProjectPlan).ainvoke(
+        render_prompt(CODE_PLANNER_AGENT_PROMPT, requirement=requirement)
+    )
+    planned_files = []
+    for planned in plan.files:
+        if planned.filename not in {other.filename for other in planned_files}:
+            planned_files.append(planned)
+    if not planned_files:
+        logger.warning("The plan has no files, generating the project in one call")
+        return None
+    logger.info(
+        "Planned %d files in %.1fs: %s",
+        len(planned_files),
+        time.monotonic() - started_at,
+        ", ".join(planned.filename for planned in planned_files),
+    )
+
+    plan_text = plan_description(plan)
+    structured_llm = llm.with_structured_output(Code)
+    slots = asyncio.Semaphore(max(1, get_int_setting("GENERATION", "max_parallel", 8)))
+
+    async def write_file(planned: PlannedFile) -> Code:
+        async with slots:
+            file_started_at = time.monotonic()
+            code = await structured_llm.ainvoke(
+                render_prompt(
+                    FILE_GENERATOR_AGENT_PROMPT,
+                    requirement=requirement,
+                    plan=plan_text,
+                    file=f"{planned.filename}: {planned.description}",
+                )
+            )
+        logger.info("Wrote %s in %.1fs", planned.filename, time.monotonic() - file_started_at)
+        # The plan decides the file's name and role
+        code.filename = planned.filename
+        code.executable_code = planned.executable_code
+        return code
+
+    codes = await asyncio.gather(*(write_file(planned) for planned in planned_files))
+    logger.info(
+        "Generated %d planned files in %.1fs", len(codes), time.monotonic() - started_at
+    )
+    return Codes(
+        description=plan.description,
+        codes=list(codes),
+        execution_command=plan.execution_command,
+    )
+
+
+# Large files go to the artifact store, the state keeps a reference with an excerpt
+def offload_large_codes(codes: List[Code]):
+    store = get_artifact_store()
+    for code in codes:
+        code.code = store.offload(code.code)
+
+
+# Files the LLM returned, without the offloaded ones: it only saw their excerpt
+def without_artifact_rewrites(state: GraphState, codes: List[Code]) -> List[Code]:
+    protected = artifact_filenames(state["codes"].codes)
+    kept = []
+    for code in codes:
+        if os.path.normpath(code.filename) in protected:
+            logger.warning("Ignoring the LLM's version of %s, a stored artifact", code.filename)
+        else:
+            kept.append(code)
+    return kept
 
 
 # Generate code from user input
-async def code_generator_agent(state: GraphState, llm) -> GraphState:
-    print("\n**CODE GENERATOR AGENT**")
+async def code_generator_agent(state: GraphState, llm, planner_llm=None) -> GraphState:
+    logger.info("**CODE GENERATOR AGENT**")
     # print(state)
     structured_llm = llm.with_structured_output(Codes)
 
     # get first message from state
     requirement = state["messages"][0].content
-    print("Requirement:", requirement)
-    prompt = CODE_GENERATOR_AGENT_PROMPT.format(requirement=requirement)
-
-    # Invoke the coder with the formatted prompt
-    generated_code = structured_llm.invoke(prompt)
-
-    print("\nGenerated code:", generated_code)
+    logger.info("Requirement: %s", excerpt(requirement))
+
+    # Look for a previously successful project with a similar requirement
+    match = get_project_index().best_match(requirement)
+    if match and match.score >= reuse_threshold():
+        logger.info("Reusing stored project (similarity %.2f)", match.score)
+        generated_code = Codes.parse_obj(match.entry.codes)
+        if match.entry.dockerfile:
+            state["reference_docker_files"] = DockerFile(
+                description="Docker setup of a previously successful project.",
+                dockerfile=match.entry.dockerfile,
+                docker_compose=match.entry.docker_compose,
+                docker_image_name=match.entry.docker_image_name,
+                docker_container_name=match.entry.docker_container_name,
+            )
+    else:
+        generated_code = None
+        if match and match.score >= adapt_threshold():
+            logger.info("Adapting stored project (similarity %.2f)", match.score)
+            prompt = render_prompt(
+                CODE_ADAPTER_AGENT_PROMPT,
+                requirement=requirement,
+                reference_requirement=match.entry.requirement,
+                reference_code=match.entry.codes,
+            )
+        else:
+            if get_bool_setting("GENERATION", "parallel", True):
+                generated_code = await generate_planned_project(
+                    requirement, llm, planner_llm or llm
+                )
+            if generated_code is None:
+                prompt = render_prompt(CODE_GENERATOR_AGENT_PROMPT, requirement=requirement)
+
+        # Invoke the coder with the formatted prompt
+        if generated_code is None:
+            generated_code = structured_llm.invoke(prompt)
+
+    logger.info(
+        "Generated %d files: %s",
+        len(generated_code.codes),
+        ", ".join(code.filename for code in generated_code.codes),
+    )
+    offload_large_codes(generated_code.codes)
 
     # Update the state with the generated code
 
@@ -59,40 +228,121 @@ async def code_generator_agent(state: GraphState, llm) -> GraphState:
                 content=f"Description of code: {code.description} \n Programming language used: {code.programming_language} \n {code.code}"
             )
         ]
-        await cl.Message(content=code.code, language=code.programming_language).send()
+        await emit(
+            code.code, kind="code", language=code.programming_language, name=code.filename
+        )
+
+    return state
+
+
+# Requirement of the project: the first request and every follow-up change
+def project_requirement(state: GraphState) -> str:
+    return "\n".join(
+        message.content for message in state["messages"] if isinstance(message, HumanMessage)
+    )
+
+
+# Files of the project the change request is most likely about
+def relevant_files(codes: List[Code], change_request: str, limit: int) -> List[Code]:
+    request_tokens = set(tokenize(change_request))
+    scored = []
+    for index, code in enumerate(codes):
+        # A match on the file's name or description weighs more than one in its code
+        name_tokens = set(tokenize(f"{code.filename} {code.description}"))
+        code_tokens = set(tokenize(code.code.replace("\\n", "\n")))
+        score = 3 * len(request_tokens & name_tokens) + len(request_tokens & code_tokens)
+        if score:
+            scored.append((score, -index, code))
+    if not scored:
+        return list(codes)
+    scored.sort(key=lambda item: item[:2], reverse=True)
+    return [code for _, _, code in scored[:limit]]
+
+
+# Apply a follow-up change request to the session's existing project
+async def code_editor_agent(state: GraphState, llm, file_path: str):
+    """
+    Sends the change request with the project's file list and only the relevant
+    files to the LLM, and writes back only the files it changed.
+
+    [EDITS]
+    max_files = 6
+    """
+    logger.info("**CODE EDITOR AGENT**")
+    change_request = state["messages"][-1].content
+    codes = state["codes"].codes
+    relevant = relevant_files(codes, change_request, get_int_setting("EDITS", "max_files", 6))
+    logger.info(
+        "Change request: %s (relevant files: %s)",
+        excerpt(change_request),
+        ", ".join(code.filename for code in relevant),
+    )
 
+    structured_llm = llm.with_structured_output(ProjectEdit)
+    edit = structured_llm.invoke(
+        render_prompt(
+            CODE_EDITOR_AGENT_PROMPT,
+            project=state["codes"].description,
+            files="\n".join(f"- {code.filename}: {code.description}" for code in codes),
+            relevant_code="\n\n".join(
+                f"**{code.filename}**\n{code.code}" for code in relevant
+            ),
+            change_request=change_request,
+        )
+    )
+
+    edit.files = without_artifact_rewrites(state, edit.files)
+    offload_large_codes(edit.files)
+    existing = {code.filename: code for code in codes}
+    for edited in edit.files:
+        if edited.filename in ("Dockerfile", "compose.yaml"):
+            continue
+        if edited.filename in existing:
+            existing[edited.filename].description = edited.description
+        else:
+            edited.executable_code = False
+            codes.append(edited)
+        await emit(
+            edited.code,
+            kind="code",
+            language=edited.programming_language,
+            name=edited.filename,
+        )
+
+    # Writes the files, keeps the state in sync and marks them for the hot reload
+    apply_file_patch(
+        state,
+        file_path,
+        {edited.filename: get_artifact_store().normalized(edited.code) for edited in edit.files},
+    )
+    logger.info("Edited %d files: %s", len(edit.files), ", ".join(state["changed_files"]))
+    state["messages"] += [AIMessage(content=edit.description)]
+    # Tests of the previous requirement are written again for the changed one
+    state["tests"] = None
+    state["tested_iteration"] = None
     return state
 
 
 # Save generated code to file
 def write_code_to_file_agent(state: GraphState, code_file):
-    print("\n**WRITE CODE TO FILE**")
+    logger.info("**WRITE CODE TO FILE**")
     # print(state)
 
     # Loop through the codes and write them to file
+    store = get_artifact_store()
     for code in state["codes"].codes:
         if code.executable_code:
             state["executable_file_name"] = code.filename
 
-        # Construct the full file path
-        full_file_path = os.path.join(code_file, code.filename)
-
-        # Ensure the directory exists
-        directory = os.path.dirname(full_file_path)
-        if not os.path.exists(directory):
-            os.makedirs(directory)
-
-        # Write the formatted code to the file
-        formatted_code = code.code.replace("\\n", "\n")
-        with open(full_file_path, "w") as f:
-            f.write(formatted_code)
+        # Write the formatted code (or copy the stored artifact) to the file
+        store.write(code.code, os.path.join(code_file, code.filename))
 
     return state
 
 
 # Execute code from folder (will be replaced with dockerizer agent?)
 async def execute_code_agent(state: GraphState, code_file):
-    print("\n**EXECUTE CODE**")
+    logger.info("**EXECUTE CODE**")
     # print(state)
 
     error = None
@@ -109,30 +359,42 @@ async def execute_code_agent(state: GraphState, code_file):
         # Execute the command
         result = subprocess.run(execution_command, capture_output=True, text=True)
         if result.returncode != 0:
-            print(result)
+            logger.warning("Execution failed: %s", excerpt(result.stderr))
             error = f"Execution failed with error: {result.stderr}"
-        print(result.stdout)
+        logger.debug("Execution output: %s", excerpt(result.stdout))
 
     except Exception as e:
-        print("Found Error While Running")
+        logger.exception("Found Error While Running")
         error = f"Execution Error : {e}"
 
     if error:
-        await cl.Message(content=error).send()
+        await emit(error, kind="error")
 
     return {"error": error}
 
 
 # Debug codes if error occurs
 async def debug_code_agent(state: GraphState, llm):
-    print("\n **DEBUG CODE**")
+    logger.info("**DEBUG CODE**")
     # print(state)
     error = state["error"]
     code = state["codes"].codes
     structured_llm = llm.with_structured_output(Codes)
-    prompt = CODE_FIXER_AGENT_PROMPT.format(original_code=code, error_message=error)
+    prompt = render_prompt(
+        CODE_FIXER_AGENT_PROMPT, original_code=code, error_message=error, tests="None"
+    )
     fixed_code = structured_llm.invoke(prompt)
-    print("\nNEW FIXED CODE:", fixed_code)
+    logger.info(
+        "Fixed code: %s", ", ".join(code.filename for code in fixed_code.codes)
+    )
+    # Offloaded files stay as they were, the LLM only saw their excerpt
+    kept = without_artifact_rewrites(state, fixed_code.codes)
+    originals = {os.path.normpath(original.filename): original for original in code}
+    fixed_code.codes = [
+        fixed if fixed in kept else originals[os.path.normpath(fixed.filename)]
+        for fixed in fixed_code.codes
+    ]
+    offload_large_codes(fixed_code.codes)
 
     # Update the state with the fixed code
     state["codes"] = fixed_code
@@ -144,7 +406,9 @@ async def debug_code_agent(state: GraphState, llm):
                 content=f"Description of code: {code.description} \n Programming language used: {code.programming_language} \n {code.code}"
             )
         ]
-        await cl.Message(content=code.code, language=code.programming_language).send()
+        await emit(
+            code.code, kind="code", language=code.programming_language, name=code.filename
+        )
 
     # update iterations to state
     state["iterations"] += 1
@@ -152,6 +416,25 @@ async def debug_code_agent(state: GraphState, llm):
     return state
 
 
+# Store a successful project so similar requirements can reuse it
+def remember_successful_project(state: GraphState):
+    try:
+        docker_files = state.get("docker_files")
+        get_project_index().add(
+            ProjectEntry(
+                requirement=project_requirement(state),
+                codes=state["codes"].dict(),
+                dockerfile=docker_files.dockerfile if docker_files else "",
+                docker_compose=docker_files.docker_compose if docker_files else "",
+                docker_image_name=state.get("docker_image_name", ""),
+                docker_container_name=state.get("docker_container_name", ""),
+                iterations=state.get("iterations", 0),
+            )
+        )
+    except Exception as e:
+        logger.warning("Failed to store the project in the project index: %s", e)
+
+
 # TODO: move this to utils?
 # Generate code descriptions for prompt
 def generate_code_descriptions(codes: List[Code]) -> str:
@@ -176,45 +459,63 @@ def generate_code_descriptions(codes: List[Code]) -> str:
 
 # Create readme and developer files
 async def read_me_agent(state: GraphState, llm, file_path):
-    print("\n **GENERATING README & DEVELOPER FILES **")
+    logger.info("**GENERATING README & DEVELOPER FILES **")
     # print(state)
 
     structured_llm = llm.with_structured_output(Documentation)
     code_descriptions = generate_code_descriptions(state["codes"].codes)
-    prompt = README_DEVELOPER_WRITER_AGENT_PROMPT.format(
+    prompt = render_prompt(
+        README_DEVELOPER_WRITER_AGENT_PROMPT,
         messages=state["messages"], code_descriptions=code_descriptions
     )
 
     docs = structured_llm.invoke(prompt)
-    readme = docs.readme
-    developer = docs.developer
 
-    # Use os.path.join to construct full file paths
-    readme_path = os.path.join(file_path, "README.md")
-    developer_path = os.path.join(file_path, "DEVELOPER.md")
-    # save files for root
-    with open(readme_path, "w", encoding="utf-8") as f:
-        f.write(readme)
-    with open(developer_path, "w", encoding="utf-8") as f:
-        f.write(developer)
+    # save files for root, but not over a stored artifact of the project with that name
+    protected = artifact_filenames(state["codes"].codes)
+    for filename, content in (("README.md", docs.readme), ("DEVELOPER.md", docs.developer)):
+        if filename in protected:
+            logger.warning("Not writing %s over the project's stored artifact", filename)
+            continue
+        with open(os.path.join(file_path, filename), "w", encoding="utf-8") as f:
+            f.write(content)
 
     return state
 
 
 # Dockerizer the project
 async def dockerizer_agent(state: GraphState, llm, file_path):
-    print("\n **DOCKERIZER AGENT **")
-
-    structured_llm = llm.with_structured_output(DockerFile)
-    code_descriptions = generate_code_descriptions(state["codes"].codes)
+    logger.info("**DOCKERIZER AGENT **")
 
-    prompt = DOCKERFILE_GENERATOR_AGENT_PROMPT.format(
-        executable_file_name=state["executable_file_name"],
-        code_descriptions=code_descriptions,
-        messages=state["messages"],
+    # Containers and images are named after the session's compose project
+    project_name = get_lifecycle_manager().project_name(state.get("session_id"))
+    # Known runtimes get a deterministic template, the LLM is only used for unrecognized stacks
+    docker_things = render_docker_files(
+        state["codes"], state.get("executable_file_name"), project_name
     )
 
-    docker_things = structured_llm.invoke(prompt)
+    if docker_things is None and state.get("reference_docker_files"):
+        logger.info("Reusing the Docker files of the stored project.")
+        docker_things = state["reference_docker_files"]
+    elif docker_things is None:
+        logger.info("No Docker template for this project, asking the LLM.")
+        structured_llm = llm.with_structured_output(DockerFile)
+        code_descriptions = generate_code_descriptions(state["codes"].codes)
+
+        prompt = render_prompt(
+            DOCKERFILE_GENERATOR_AGENT_PROMPT,
+            executable_file_name=state["executable_file_name"],
+            code_descriptions=code_descriptions,
+            messages=state["messages"],
+        )
+
+        docker_things = structured_llm.invoke(prompt)
+        docker_things.dockerfile = order_manifests_first(
+            docker_things.dockerfile, project_manifests(state)
+        )
+    else:
+        logger.info("Using Docker template for the project.")
+    docker_things = scope_docker_files(docker_things, project_name)
 
     # Store the Dockerfile and Docker Compose configuration in the state
     # Create an instance of DockerFiles
@@ -251,8 +552,9 @@ async def dockerizer_agent(state: GraphState, llm, file_path):
 
 
 async def execute_docker_agent(state: GraphState, file_path: str):
-    print("\n **EXECUTE DOCKER AGENT **")
+    logger.info("**EXECUTE DOCKER AGENT **")
     error = None
+    backend_name = "compose"
     current_function = inspect.currentframe().f_code.co_name
     current_file = __file__
 
@@ -261,57 +563,93 @@ async def execute_docker_agent(state: GraphState, file_path: str):
 
     try:
         # Phase 1: Docker Setup and Build
-        print(f"Building and starting Docker container: {container_name}...")
-
-        # Run docker-compose up --build
-        compose_file_path = os.path.join(file_path, "compose.yaml")
-        compose_command = ["docker-compose", "-f", compose_file_path, "up", "--build"]
-
-        setup_process = await asyncio.create_subprocess_exec(
-            *compose_command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
+        logger.info("Building and starting Docker container: %s...", container_name)
+        # Only the generated code goes into the build context
+        tracked_files = [code.filename for code in state["codes"].codes]
+        write_dockerignore(file_path, tracked_files)
+
+        # Build and run the project, on an execution worker when a pool is configured
+        worker_pool = get_worker_pool()
+        if worker_pool is not None:
+            result = await worker_pool.run(
+                file_path,
+                container_name,
+                state.get("docker_image_name"),
+                session_id=state.get("session_id"),
+            )
+        else:
+            # Compose project per session, so its resources can be tracked and removed
+            lifecycle = get_lifecycle_manager()
+            session_id = state.get("session_id")
+            job = ExecutionJob(
+                file_path,
+                container_name,
+                lifecycle.project_name(session_id),
+                tracked_files,
+                runtime=detect_runtime(state["codes"], state.get("executable_file_name")),
+            )
+            # Compose, a single container or the local sandbox (see [BACKENDS])
+            backend = select_backend(job)
+            logger.info("Running the project with the %s backend", backend.name)
+            result = await backend.run(job)
+            if backend.keeps_container:
+                await lifecycle.track(session_id, file_path, result.images)
+        backend_name = result.backend
+
+        if result.timed_out:
+            error = ErrorMessage(
+                type="Timeout",
+                message="The build or the program exceeded its time limit and was stopped.",
+                details=prompt_excerpt((result.logs or result.build_stderr).strip()),
+                code_reference=f"{current_file} - {current_function}",
+            )
+            logger.warning("Execution timed out in container: %s", container_name)
+            return {"error": error, "execution_backend": backend_name}
 
-        setup_stdout, setup_stderr = await setup_process.communicate()
+        if result.oom_killed:
+            error = ErrorMessage(
+                type="OOM",
+                message="The program exceeded its memory limit and was killed.",
+                details=prompt_excerpt(result.logs.strip()),
+                code_reference=f"{current_file} - {current_function}",
+            )
+            logger.warning("Container ran out of memory: %s", container_name)
+            return {"error": error, "execution_backend": backend_name}
 
-        if setup_process.returncode != 0:
+        if result.build_returncode != 0:
             error = ErrorMessage(
                 type="Docker Configuration Error",
                 message="Error during Docker setup or build process.",
-                details=setup_stderr.decode().strip(),
+                details=prompt_excerpt(result.build_stderr.strip()),
                 code_reference=f"{current_file} - {current_function}",
             )
-            print(f"Error during Docker setup: {setup_stderr.decode()}")
-            return {"error": error}
-
-        print("Docker setup and build completed successfully.")
-        print("Docker Setup Output:\n", setup_stdout.decode())
-
-        # Phase 2: Fetch logs from the container
-        print(f"Fetching logs from the container: {container_name}...")
-
-        log_process = await asyncio.create_subprocess_exec(
-            "docker",
-            "logs",
-            container_name,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-
-        log_stdout, log_stderr = await log_process.communicate()
-        logs = log_stdout.decode()
-
-        if "Traceback" in logs or "Error" in logs or log_stderr.decode().strip():
+            logger.warning("Error during Docker setup: %s", excerpt(result.build_stderr))
+            return {"error": error, "execution_backend": backend_name}
+
+        logger.info("Docker setup and build completed successfully.")
+        logger.debug("Docker Setup Output:\n%s", excerpt(result.build_stdout))
+
+        # Phase 2: Logs from the container (fetched right after the build)
+        logger.info("Fetching logs from the container: %s...", container_name)
+        logs = result.logs
+
+        # A program can fail without writing to stderr, its exit code is checked too
+        failed = result.exit_code not in (0, None)
+        if "Traceback" in logs or "Error" in logs or result.logs_stderr.strip() or failed:
+            details = result.logs_stderr.strip() or logs.strip()
+            if failed:
+                details = f"Exit code {result.exit_code}\n{details}".strip()
             error = ErrorMessage(
                 type="Docker Execution Error",
                 message="The code inside the container encountered an error.",
-                details=log_stderr.decode().strip(),
+                details=prompt_excerpt(details),
                 code_reference=f"{current_file} - {current_function}",
             )
-            print(f"Error during container execution: {log_stderr.decode()}")
+            logger.warning(
+                "Error during container execution: %s", excerpt(result.logs_stderr)
+            )
         else:
-            print("Container Logs:\n", logs)
+            logger.debug("Container Logs:\n%s", excerpt(logs))
 
     except Exception as e:
         error = ErrorMessage(
@@ -320,50 +658,330 @@ async def execute_docker_agent(state: GraphState, file_path: str):
             details=str(e),
             code_reference=f"{current_file} - {current_function}",
         )
-        print(error.json())
+        logger.exception("Unexpected Docker error")
 
     if error:
-        await cl.Message(content=error.json()).send()
+        await emit(error.json(), kind="error")
+
+    return {"error": error, "execution_backend": backend_name}
 
-    return {"error": error}
 
+# Run the project's tests (generated when the project has none) inside its image
+async def test_agent(state: GraphState, llm, file_path: str, test_path: str):
+    logger.info("**TEST AGENT**")
+    skipped = {"error": None, "tested_iteration": state["iterations"]}
+    runtime = detect_runtime(state["codes"], state.get("executable_file_name"))
+    if not get_bool_setting("TESTS", "enabled", True) or runtime is None:
+        logger.info("Skipping tests")
+        return skipped
+
+    existing_tests = detect_test_files(
+        [code.filename for code in state["codes"].codes], runtime.runtime
+    )
+    tests = state.get("tests")
+    if not existing_tests and tests is None:
+        structured_llm = llm.with_structured_output(TestSuite)
+        prompt = render_prompt(
+            TEST_GENERATOR_AGENT_PROMPT,
+            runner_instructions=TEST_RUNNER_INSTRUCTIONS[runtime.runtime],
+            requirement=project_requirement(state),
+            code=generate_code_descriptions(state["codes"].codes),
+        )
+        tests = structured_llm.invoke(prompt)
+        logger.info(
+            "Generated %d test files: %s",
+            len(tests.tests),
+            ", ".join(test.filename for test in tests.tests),
+        )
+        # Tests of a previous run must not be picked up
+        os.makedirs(test_path, exist_ok=True)
+        for filename in os.listdir(test_path):
+            if os.path.isfile(os.path.join(test_path, filename)):
+                os.remove(os.path.join(test_path, filename))
+        for test in tests.tests:
+            full_file_path = os.path.join(test_path, os.path.basename(test.filename))
+            with open(full_file_path, "w") as f:
+                f.write(test.code.replace("\\n", "\n"))
 
-async def stop_docker_containers(file_path: str):
     try:
-        await asyncio.create_subprocess_exec(
-            "docker-compose",
-            "-f",
-            f"{file_path}/compose.yaml",
-            "down",
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
+        worker_pool = get_worker_pool()
+        if worker_pool is not None:
+            # The workspace and image of the project are on its execution worker
+            report = await worker_pool.test(
+                state["docker_container_name"],
+                test_path,
+                runtime.runtime,
+                generated=not existing_tests,
+            )
+        else:
+            lifecycle = get_lifecycle_manager()
+            session_id = state.get("session_id")
+            report = await run_tests(
+                file_path,
+                test_path,
+                runtime.runtime,
+                state["docker_container_name"],
+                generated=not existing_tests,
+                tracked_files=[code.filename for code in state["codes"].codes],
+                project_name=lifecycle.project_name(session_id),
+            )
+            if report.image:
+                await lifecycle.track(session_id, file_path, [report.image])
+    except Exception as e:
+        logger.exception("Could not run the tests")
+        return {
+            "error": ErrorMessage(
+                type="Unexpected Docker Error",
+                details=str(e),
+                code_reference=f"{__file__} - test_agent",
+            ),
+            "tests": tests,
+            "tested_iteration": state["iterations"],
+        }
+
+    if report.build_failed:
+        # The project itself built, so this is the test runner's install (no network, ...)
+        error = ErrorMessage(
+            type="Unexpected Docker Error",
+            message="The test image could not be built.",
+            details=prompt_excerpt(report.output.strip()),
+            code_reference=f"{__file__} - test_agent",
         )
+        await emit(error.json(), kind="error")
+        return {"error": error, "tests": tests, "tested_iteration": state["iterations"]}
+
+    await emit(f"Tests: {report.summary()}")
+    error = None
+    if not report.ok:
+        error = ErrorMessage(
+            type="Test Failure",
+            details=report.failure_details(),
+            file=report.failures[0].name.split("::")[0] if report.failures else None,
+            code_reference=f"{__file__} - test_agent",
+        )
+        await emit(error.json(), kind="error")
+    return {"error": error, "tests": tests, "tested_iteration": state["iterations"]}
+
+
+# Dependency manifests of the project, in the order they should be copied
+def project_manifests(state: GraphState) -> List[str]:
+    filenames = {code.filename for code in state["codes"].codes}
+    return [manifest for manifest in MANIFESTS if manifest in filenames]
+
+
+# Snapshot the workspace after a node changed it, together with the state to restore
+def take_snapshot(state: GraphState, file_path: str, node: str) -> dict:
+    session = re.sub(r"[^A-Za-z0-9_-]+", "-", state.get("session_id") or "local")
+    snapshot_id = f"{session}-{state['iterations']:02d}-{node}"
+    get_snapshot_store(file_path).take(file_path, snapshot_id)
+    docker_files = state.get("docker_files")
+    record = {
+        "id": snapshot_id,
+        "node": node,
+        "iteration": state["iterations"],
+        "score": None,
+        "error": None,
+        "codes": state["codes"].dict(),
+        "docker_files": docker_files.dict() if docker_files else None,
+        "docker_image_name": state.get("docker_image_name"),
+        "docker_container_name": state.get("docker_container_name"),
+        "executable_file_name": state.get("executable_file_name"),
+    }
+    return {"snapshots": (state.get("snapshots") or []) + [record]}
+
+
+# Record how the execution of the latest snapshot went
+def rate_snapshot(state: GraphState, error) -> dict:
+    snapshots = [dict(record) for record in state.get("snapshots") or []]
+    if snapshots:
+        snapshots[-1]["score"] = execution_score(error)
+        snapshots[-1]["error"] = error.dict() if error else None
+    return {"snapshots": snapshots}
+
+
+# Put the best snapshot of the run back when the run ends without success
+def restore_best_snapshot(state: GraphState, file_path: str) -> dict:
+    rated = [
+        (record["score"], index, record)
+        for index, record in enumerate(state.get("snapshots") or [])
+        if record["score"] is not None
+    ]
+    if not rated:
+        return {}
+    # Latest of the best, it has the most fixes in it
+    _, index, best = max(rated, key=lambda item: (item[0], item[1]))
+    if index == len(state["snapshots"]) - 1:
+        return {}
+
+    logger.info(
+        "Restoring snapshot %s (score %s) as the best attempt of the run",
+        best["id"],
+        best["score"],
+    )
+    restored = get_snapshot_store(file_path).restore(best["id"], file_path)
+    # The session's container still runs the last attempt: the next execution of the
+    # project (a follow-up request) syncs the restored files, or rebuilds
+    changed_files = sorted(
+        set(state.get("changed_files") or [])
+        | {path.replace(os.sep, "/") for path in restored}
+    )
+    return {
+        "changed_files": changed_files,
+        "codes": Codes.parse_obj(best["codes"]),
+        "docker_files": DockerFiles.parse_obj(best["docker_files"]) if best["docker_files"] else None,
+        "docker_image_name": best["docker_image_name"],
+        "docker_container_name": best["docker_container_name"],
+        "executable_file_name": best["executable_file_name"],
+        "error": ErrorMessage.parse_obj(best["error"]) if best["error"] else None,
+    }
+
+
+# Release containers and networks when a run ends (success, failure or abort)
+async def release_docker_resources(session_id: str, end_session: bool = False):
+    try:
+        worker_pool = get_worker_pool()
+        if worker_pool is not None:
+            await worker_pool.release_session(session_id)
+        elif end_session:
+            await get_lifecycle_manager().end_session(session_id)
+        else:
+            await get_lifecycle_manager().release_run(session_id)
     except Exception as stop_error:
-        print(f"Failed to stop Docker container: {str(stop_error)}")
+        logger.warning("Failed to stop Docker container: %s", stop_error)
+
+
+# Files of the project as written on disk, used to look up and learn known fixes
+def project_files(state: GraphState) -> Dict[str, str]:
+    store = get_artifact_store()
+    files = {code.filename: store.normalized(code.code) for code in state["codes"].codes}
+    docker_files = state.get("docker_files")
+    if docker_files:
+        files["Dockerfile"] = docker_files.dockerfile
+        files["compose.yaml"] = docker_files.docker_compose
+    return files
+
+
+# Write the patched files and keep the state in sync with them
+def apply_file_patch(state: GraphState, file_path: str, patch: Dict[str, str]):
+    if "compose.yaml" in patch:
+        # Edited compose files keep their containers and images in the session's project
+        docker_files = scope_docker_files(
+            DockerFile(
+                description="",
+                dockerfile=patch.get("Dockerfile", state["docker_files"].dockerfile),
+                docker_compose=patch["compose.yaml"],
+                docker_image_name=state.get("docker_image_name") or "",
+                docker_container_name=state.get("docker_container_name") or "",
+            ),
+            get_lifecycle_manager().project_name(state.get("session_id")),
+        )
+        patch = {**patch, "compose.yaml": docker_files.docker_compose}
+        state["docker_image_name"] = docker_files.docker_image_name
+        state["docker_container_name"] = docker_files.docker_container_name
+    # Files not in the container yet (restored at the end of the last run) stay marked
+    state["changed_files"] = list(dict.fromkeys((state.get("changed_files") or []) + list(patch)))
+    store = get_artifact_store()
+    for filename, content in patch.items():
+        full_file_path = os.path.join(file_path, filename)
+        if filename in ("Dockerfile", "compose.yaml"):
+            with open(full_file_path, "w", encoding="utf-8") as f:
+                f.write(content)
+        else:
+            content = store.offload(store.normalized(content))
+            store.write(content, full_file_path)
+
+        if filename == "Dockerfile":
+            state["docker_files"].dockerfile = content
+        elif filename == "compose.yaml":
+            state["docker_files"].docker_compose = content
+        else:
+            for code in state["codes"].codes:
+                if code.filename == filename:
+                    code.code = content
+                    break
+            else:
+                state["codes"].codes.append(
+                    Code(
+                        description="Added by a known fix.",
+                        filename=filename,
+                        executable_code=False,
+                        code=content,
+                        programming_language=os.path.splitext(filename)[1].lstrip(".")
+                        or "text",
+                    )
+                )
+
+
+# Try a known fix for the error before asking the LLM
+def apply_known_fix(state: GraphState, file_path: str) -> bool:
+    error = state["error"]
+    known_fix = get_fix_cache().lookup(error.type, error.details, project_files(state))
+    if known_fix is None:
+        return False
+    apply_file_patch(state, file_path, known_fix.patch)
+    state["pending_fix"] = {"key": known_fix.key, "signature": known_fix.signature}
+    state["iterations"] += 1
+    return True
+
+
+# Remember the fix the LLM made, it is verified by the next execution
+def learn_fix(state: GraphState, files_before: Dict[str, str], patch: Dict[str, str]):
+    error = state["error"]
+    learned = get_fix_cache().learn(error.type, error.details, files_before, patch)
+    state["pending_fix"] = (
+        {"key": learned.key, "signature": learned.signature} if learned else None
+    )
+
+
+# Called after an execution: did the last known/learned fix make the error go away?
+def verify_pending_fix(state: GraphState, error: ErrorMessage) -> dict:
+    pending_fix = state.get("pending_fix")
+    if not pending_fix:
+        return {}
+    # The fix worked when no error of the same class follows it
+    fixed_type = pending_fix["signature"].split("|", 1)[0]
+    fixed = error is None or classify_error(error) != ERROR_CLASSES.get(fixed_type, "general")
+    fix_cache = get_fix_cache()
+    fix_cache.record_outcome(pending_fix["key"], pending_fix["signature"], fixed)
+    logger.info("Fix cache stats: %s", fix_cache.stats())
+    return {"pending_fix": None}
 
 
 # DEBUGGING FOR SPECIFIC USE CASES
 # Debug codes if error occurs
 async def debug_docker_execution_agent(state: GraphState, llm, file_path):
-    print("\n **DEBUG DOCKER AGENT**")
+    logger.info("**DEBUG DOCKER AGENT**")
     # update docker file so that will run successfully
     # 1. Check the error message and identify the issue in the Docker configuration.
     # 2. Update the Dockerfile and Docker Compose configuration to fix the error.
     # 3. Save the updated Docker files to the project directory.
     # 4. Re-run the Docker setup to verify the fix.
 
+    if apply_known_fix(state, file_path):
+        logger.info("Applied a known fix to the Docker files")
+        return state
+
     error = state["error"]
+    files_before = project_files(state)
     docker_files = state["docker_files"]
     dockerFile = docker_files.dockerfile
     dockerCompose = docker_files.docker_compose
     structured_llm = llm.with_structured_output(DockerFile)
-    prompt = DEBUG_DOCKER_FILES_AGENT_PROMPT.format(
+    prompt = render_prompt(
+        DEBUG_DOCKER_FILES_AGENT_PROMPT,
         dockerfile=dockerFile,
         docker_compose=dockerCompose,
         error_messages=error.details,
         messages=state["messages"],
     )
     fixed_docker_files = structured_llm.invoke(prompt)
+    fixed_docker_files.dockerfile = order_manifests_first(
+        fixed_docker_files.dockerfile, project_manifests(state)
+    )
+    # The LLM may rename the container or image, they stay in the session's project
+    fixed_docker_files = scope_docker_files(
+        fixed_docker_files, get_lifecycle_manager().project_name(state.get("session_id"))
+    )
 
     # update iterations to state
     state["iterations"] += 1
@@ -375,25 +993,54 @@ async def debug_docker_execution_agent(state: GraphState, llm, file_path):
         f.write(fixed_docker_files.dockerfile)
     with open(docker_compose_path, "w", encoding="utf-8") as f:
         f.write(fixed_docker_files.docker_compose)
+
+    state["docker_files"] = DockerFiles(
+        dockerfile=fixed_docker_files.dockerfile,
+        docker_compose=fixed_docker_files.docker_compose,
+    )
+    state["docker_image_name"] = fixed_docker_files.docker_image_name
+    state["docker_container_name"] = fixed_docker_files.docker_container_name
+    learn_fix(
+        state,
+        files_before,
+        {
+            "Dockerfile": fixed_docker_files.dockerfile,
+            "compose.yaml": fixed_docker_files.docker_compose,
+        },
+    )
     return state
 
 
 # Debug code used in docker if error occurs
 async def debug_code_execution_agent(state: GraphState, llm, file_path):
-    print("\n **DEBUG CODE**")
+    logger.info("**DEBUG CODE**")
+    if apply_known_fix(state, file_path):
+        logger.info("Applied a known fix to the code")
+        return state
+
     error = state["error"]
+    files_before = project_files(state)
     code_list = state["codes"].codes
     structured_llm = llm.with_structured_output(Code)
 
+    # Generated tests live outside the project, the fixer needs them to fix a failure
+    tests = state.get("tests") if error.type == "Test Failure" else None
     # Create the prompt for the LLM to suggest a fix
-    prompt = CODE_FIXER_AGENT_PROMPT.format(
-        original_code=code_list, error_message=error
+    prompt = render_prompt(
+        CODE_FIXER_AGENT_PROMPT,
+        original_code=code_list,
+        error_message=error,
+        tests=tests.tests if tests else "None",
     )
     fixed_code = structured_llm.invoke(prompt)
+    if not without_artifact_rewrites(state, [fixed_code]):
+        # The attempt counts, the same error comes back from the unchanged project
+        state["iterations"] += 1
+        return state
+    store = get_artifact_store()
+    fixed_code.code = store.offload(fixed_code.code)
 
-    print("\nOriginal Codes, one should be replaced:", code_list)
-    print("\nNew Fixed Code:", fixed_code)
-    print("\n\nAbove is the code to be updated.")
+    logger.info("Replacing %s with the fixed code", fixed_code.filename)
 
     # Directly updating the relevant code in the list by matching filenames
     for code in code_list:
@@ -405,82 +1052,167 @@ async def debug_code_execution_agent(state: GraphState, llm, file_path):
     state["codes"].codes = code_list
     state["iterations"] += 1
 
-    # Save the fixed code to the respective file
-    full_file_path = os.path.join(file_path, fixed_code.filename)
-
     # Write the updated code to the file, replacing '\n' placeholders with actual newlines
-    formatted_code = fixed_code.code.replace("\\n", "\n")
-    with open(full_file_path, "w") as f:
-        f.write(formatted_code)
+    formatted_code = store.normalized(fixed_code.code)
+    store.write(formatted_code, os.path.join(file_path, fixed_code.filename))
 
+    state["changed_files"] = list(
+        dict.fromkeys((state.get("changed_files") or []) + [fixed_code.filename])
+    )
+
+    learn_fix(state, files_before, {fixed_code.filename: formatted_code})
     return state
 
 
+# Push the fixed files into the running container, rebuild only when that is not enough
+async def hot_reload_agent(state: GraphState, file_path: str):
+    logger.info("**HOT RELOAD AGENT**")
+    changed_files = state.get("changed_files") or []
+    container_name = state["docker_container_name"]
+
+    # Remote containers live on their execution worker, so they are rebuilt there,
+    # and programs of the local sandbox leave no container behind
+    if (
+        get_worker_pool() is None
+        and get_backend(state.get("execution_backend")).keeps_container
+        and get_bool_setting("HOT_RELOAD", "enabled", True)
+    ):
+        sync = await sync_into_container(
+            file_path, container_name, changed_files, state["docker_files"].dockerfile
+        )
+        if sync.reloaded:
+            result = await log_docker_container_errors(state, since=sync.restarted_at)
+            return {**result, "changed_files": []}
+        logger.info("Rebuilding instead of hot reloading: %s", sync.reason)
+
+    result = await execute_docker_agent(state, file_path)
+    return {**result, "changed_files": []}
+
+
 # Agent for logging container for errors using docker logs (code related errors!)
-async def log_docker_container_errors(state: GraphState):
-    print("\n** LOG DOCKER CONTAINER ERRORS AGENT **")
+async def log_docker_container_errors(state: GraphState, since: Optional[float] = None):
+    logger.info("** LOG DOCKER CONTAINER ERRORS AGENT **")
 
     container_name = state["docker_container_name"]
-    client = docker.from_env()
+    worker_pool = get_worker_pool()
     error = None  # Initialize error as None
-    check_interval = 1  # Check every 1 second
-    monitor_duration = 3  # Total time to monitor for errors (in seconds)
-    start_time = time.time()
+    monitor_duration = 3  # Total time to wait for the container (in seconds)
 
     try:
-        # Get the Docker container by name
-        container = client.containers.get(container_name)
-        print(
-            f"Monitoring logs for container: {container_name} for {monitor_duration} seconds."
-        )
-
-        while True:
-            try:
-                # Fetch the last 20 lines of logs from the container
-                logs = container.logs(tail=20).decode("utf-8")
-                print("\nContainer Logs:\n", logs)
-
-                # Check for real errors in the logs (stack traces, exceptions, etc.)
-                error_message = parse_error_from_logs(logs)
-                if error_message:
-                    print(f"Error detected: {error_message.details}")
-
-                    # Set the error variable
-                    error = error_message
-                    break  # Stop monitoring after detecting the error
-
-                # If no real errors, continue monitoring
-                print("No critical errors detected in the logs.")
-
-                # Check if 3 seconds have passed since monitoring started
-                elapsed_time = time.time() - start_time
-                if elapsed_time >= monitor_duration:
-                    print(f"No errors detected after {monitor_duration} seconds.")
-                    error = None  # No errors detected
-                    break  # Stop monitoring after the timeout
-
-            except Exception as e:
-                print(f"Failed to retrieve logs or process container: {e}")
-                error = ErrorMessage(type="Internal Code Error", details=str(e))
-                break  # Stop monitoring after encountering an internal error
-
-            # Wait for the specified interval before checking logs again
-            await asyncio.sleep(check_interval)
-
-    except docker.errors.NotFound:
-        print(f"Error: Container '{container_name}' not found.")
-        error = ErrorMessage(
-            type="Container Not Found",
-            details=f"Container '{container_name}' not found.",
-        )
+        if worker_pool is not None:
+            # The container lives on the execution worker that built it
+            error = await _poll_remote_container_errors(
+                worker_pool, container_name, monitor_duration
+            )
+        else:
+            error = await _watch_local_container_errors(
+                container_name, monitor_duration, since
+            )
     except Exception as e:
-        print(f"An error occurred: {e}")
+        logger.exception("An error occurred: %s", e)
         error = ErrorMessage(type="Internal Code Error", details=str(e))
 
     # Return the error variable, which may be None if no error was found
     return {"error": error}
 
 
+# Wait for the local container to exit (Docker events, no polling) and check its logs
+async def _watch_local_container_errors(
+    container_name: str, monitor_duration: float, since: Optional[float] = None
+):
+    watch = get_event_watcher().watch(container_name)
+    try:
+        container = await container_state(container_name)
+        if container is None:
+            logger.warning("Container '%s' not found.", container_name)
+            return ErrorMessage(
+                type="Container Not Found",
+                details=f"Container '{container_name}' not found.",
+            )
+        exit_code = container["exit_code"]
+        if container["running"]:
+            logger.info(
+                "Waiting up to %s seconds for container: %s", monitor_duration, container_name
+            )
+            event = await watch.wait(
+                ["die"], timeout=monitor_duration, container_id=container["id"]
+            )
+            exit_code = event.exit_code if event else None
+        oom_killed = container["oom_killed"] or any(
+            event.action == "oom" for event in watch.history
+        )
+    finally:
+        watch.close()
+
+    returncode, stdout, stderr = await container_logs(container_name, tail=20, since=since)
+    if returncode != 0:
+        raise RuntimeError(stderr.strip())
+    logs = stdout + stderr
+    logger.debug("Container Logs:\n%s", excerpt(logs))
+
+    if oom_killed:
+        return ErrorMessage(
+            type="OOM",
+            details="The program exceeded its memory limit and was killed.\n"
+            + prompt_excerpt(logs.strip()),
+        )
+    # Check for real errors in the logs (stack traces, exceptions, etc.)
+    error = parse_error_from_logs(logs)
+    if error is None and exit_code:
+        # Crashes that print no error keyword
+        error = ErrorMessage(
+            type="Docker Execution Error",
+            details=f"The program exited with code {exit_code}.\n"
+            + prompt_excerpt(stderr.strip()),
+        )
+    if error:
+        logger.warning("Error detected: %s", excerpt(error.details))
+    else:
+        logger.info("No errors detected in container: %s", container_name)
+    return error
+
+
+# Fetch the remote container's logs every second until an error shows up or time runs out
+async def _poll_remote_container_errors(worker_pool, container_name: str, monitor_duration: float):
+    check_interval = 1  # Check every 1 second
+    start_time = time.time()
+    logger.info(
+        "Monitoring logs for container: %s for %s seconds.",
+        container_name,
+        monitor_duration,
+    )
+
+    while True:
+        try:
+            # Fetch the last 20 lines of logs from the container
+            returncode, stdout, stderr = await worker_pool.logs(container_name, tail=20)
+            if returncode != 0:
+                raise RuntimeError(stderr.strip())
+            logs = stdout + stderr
+            logger.debug("Container Logs:\n%s", excerpt(logs))
+
+            # Check for real errors in the logs (stack traces, exceptions, etc.)
+            error_message = parse_error_from_logs(logs)
+            if error_message:
+                logger.warning("Error detected: %s", excerpt(error_message.details))
+                return error_message
+
+            # If no real errors, continue monitoring
+            logger.debug("No critical errors detected in the logs.")
+
+            # Check if 3 seconds have passed since monitoring started
+            if time.time() - start_time >= monitor_duration:
+                logger.info("No errors detected after %s seconds.", monitor_duration)
+                return None
+
+        except Exception as e:
+            logger.warning("Failed to retrieve logs or process container: %s", e)
+            return ErrorMessage(type="Internal Code Error", details=str(e))
+
+        # Wait for the specified interval before checking logs again
+        await asyncio.sleep(check_interval)
+
+
 def parse_error_from_logs(logs: str) -> ErrorMessage:
     """
     Parse the logs to extract error details and return an ErrorMessage object.
@@ -512,7 +1244,7 @@ def parse_error_from_logs(logs: str) -> ErrorMessage:
     ]
 
     if error_lines:
-        error_details = "\n".join(error_lines)
+        error_details = prompt_excerpt("\n".join(error_lines))
         return ErrorMessage(type=error_type, details=error_details)
 
     return None  # No real error detected
@@ -0,0 +1,217 @@
+import contextvars
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# own imports
+from schemas import ErrorMessage, GraphState
+from knowledge import error_signature
+from utils.settings import get_float_setting, get_int_setting
+
+logger = logging.getLogger(__name__)
+
+# Error types grouped by the node that can fix them
+ERROR_CLASSES = {
+    "Docker Configuration Error": "docker",
+    "Container Not Found": "docker",
+    "Docker Execution Error": "code",
+    "Execution Error": "code",
+    "Timeout": "code",
+    "OOM": "code",
+    "Test Failure": "code",
+    # Problems talking to Docker, not with the project: run it again as it is
+    "Unexpected Docker Error": "infra",
+    "Internal Code Error": "infra",
+}
+
+# Graph node each error class is routed to
+CLASS_ROUTES = {
+    "docker": "debug_docker",
+    "code": "debug_code",
+    "infra": "retry",
+    "general": "debugger",
+}
+
+
+def classify_error(error: ErrorMessage) -> str:
+    return ERROR_CLASSES.get(error.type, "general")
+
+
+@dataclass
+class RunBudget:
+    """
+    Time and token budget of one graph run.
+
+    Attributes:
+        max_seconds: Wall-clock seconds the run may take (0 = unlimited).
+        max_tokens: LLM tokens the run may use (0 = unlimited).
+        token_usage: Object with a `total_tokens` attribute (e.g. the OpenAI callback).
+    """
+
+    max_seconds: float = 0
+    max_tokens: int = 0
+    token_usage: Optional[object] = None
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def tokens_used(self) -> int:
+        return getattr(self.token_usage, "total_tokens", 0) if self.token_usage else 0
+
+    def exceeded(self) -> Optional[str]:
+        elapsed = time.monotonic() - self.started_at
+        if self.max_seconds and elapsed > self.max_seconds:
+            return f"time budget of {self.max_seconds:.0f}s used ({elapsed:.0f}s)"
+        if self.max_tokens and self.tokens_used > self.max_tokens:
+            return f"token budget of {self.max_tokens} used ({self.tokens_used})"
+        return None
+
+
+# Budget of the run being executed, set by the caller of the graph
+current_budget: contextvars.ContextVar = contextvars.ContextVar(
+    "current_budget", default=None
+)
+
+
+@dataclass
+class RoutingPolicy:
+    """
+    Decides what to do after an execution.
+
+    - Each error class has its own budget of fix attempts.
+    - The same error signature showing up `repeat_limit` times in a row means the
+      fixes are not making progress, the run is stopped early.
+    - `max_iterations` caps the total number of fixes, and the run's time / token
+      budget is checked on every decision.
+    - A project that runs is tested once per iteration before it is documented.
+    """
+
+    class_budgets: Dict[str, int] = field(
+        default_factory=lambda: {"docker": 3, "code": 4, "infra": 1, "general": 2}
+    )
+    repeat_limit: int = 3
+    max_iterations: int = 6
+
+    @classmethod
+    def from_settings(cls) -> "RoutingPolicy":
+        """
+        [ROUTING]
+        docker_budget = 3
+        code_budget = 4
+        infra_budget = 1
+        general_budget = 2
+        repeat_limit = 3
+        max_iterations = 6
+        """
+        defaults = cls()
+        return cls(
+            class_budgets={
+                name: get_int_setting("ROUTING", f"{name}_budget", budget)
+                for name, budget in defaults.class_budgets.items()
+            },
+            repeat_limit=get_int_setting("ROUTING", "repeat_limit", defaults.repeat_limit),
+            max_iterations=get_int_setting(
+                "ROUTING", "max_iterations", defaults.max_iterations
+            ),
+        )
+
+    def decide(self, state: GraphState) -> str:
+        error = state["error"]
+        if not error:
+            if state.get("tested_iteration") != state["iterations"]:
+                return "tester"
+            return "readme"
+
+        budget = current_budget.get()
+        reason = budget.exceeded() if budget else None
+        if reason:
+            logger.warning("Ending the process, %s.", reason)
+            return "end"
+
+        if state["iterations"] >= self.max_iterations:
+            logger.warning("Too many iterations! Ending the process.")
+            return "end"
+
+        history: List[str] = state.get("error_history") or []
+        recent = history[-self.repeat_limit :]
+        if len(recent) == self.repeat_limit and len(set(recent)) == 1 and recent[0]:
+            logger.warning(
+                "Same error %d times in a row, the fixes make no progress. Ending the process.",
+                self.repeat_limit,
+            )
+            return "end"
+
+        error_class = classify_error(error)
+        # Errors of this class before the current one were each followed by a fix attempt
+        attempts = sum(
+            1
+            for signature in history[:-1]
+            if signature and ERROR_CLASSES.get(signature.split("|", 1)[0], "general")
+            == error_class
+        )
+        if attempts >= self.class_budgets.get(error_class, 0):
+            logger.warning(
+                "Budget of %d attempts for %s errors used. Ending the process.",
+                self.class_budgets.get(error_class, 0),
+                error_class,
+            )
+            return "end"
+
+        route = CLASS_ROUTES[error_class]
+        logger.info("Routing %s error (%s) to %s", error_class, error.type, route)
+        return route
+
+
+def record_execution_outcome(state: GraphState, error: Optional[ErrorMessage]) -> dict:
+    """State update appending the signature of the execution's error ('' for success)."""
+    history = list(state.get("error_history") or [])
+    history.append(error_signature(error.type, error.details) if error else "")
+    return {"error_history": history}
+
+
+# How close an execution got to success, to pick the best snapshot of a run
+CLASS_SCORES = {"docker": 1, "infra": 1, "general": 1, "code": 2}
+
+
+def execution_score(error: Optional[ErrorMessage]) -> int:
+    if error is None:
+        return 4
+    if error.type == "Test Failure":
+        # The project builds and runs, only some tests fail
+        return 3
+    return CLASS_SCORES[classify_error(error)]
+
+
+def failed_fixes(state: GraphState) -> int:
+    """Fixes in a row that were followed by another error."""
+    history: List[str] = state.get("error_history") or []
+    errors_in_a_row = 0
+    for signature in reversed(history):
+        if not signature:
+            break
+        errors_in_a_row += 1
+    # The first error of the streak came before any fix
+    return max(errors_in_a_row - 1, 0)
+
+
+_routing_policy: Optional[RoutingPolicy] = None
+
+
+def get_routing_policy() -> RoutingPolicy:
+    global _routing_policy
+    if _routing_policy is None:
+        _routing_policy = RoutingPolicy.from_settings()
+    return _routing_policy
+
+
+def run_budget_from_settings(token_usage: Optional[object] = None) -> RunBudget:
+    """
+    [ROUTING]
+    max_seconds = 900
+    max_tokens = 200000
+    """
+    return RunBudget(
+        max_seconds=get_float_setting("ROUTING", "max_seconds", 900),
+        max_tokens=get_int_setting("ROUTING", "max_tokens", 200000),
+        token_usage=token_usage,
+    )
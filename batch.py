@@ -0,0 +1,156 @@
+"""
+Headless batch runner: runs requirements from a JSONL file through the agents
+graph, without Chainlit, and streams one result line per requirement.
+
+    python batch.py requirements.jsonl --output results.jsonl --concurrency 4
+
+Input lines are {"id": "...", "requirement": "..."} ("id" is optional).
+Each requirement gets its own workspace under --workdir.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+# own imports
+from agents import release_docker_resources
+from graph import build_graph, run_requirement
+from utils.events import CollectingEventSink, current_event_sink
+from utils.log_pipeline import setup_logging
+from utils.settings import get_int_setting, get_setting
+
+logger = logging.getLogger(__name__)
+
+
+def read_requirements(input_path: str) -> List[dict]:
+    requirements = []
+    with open(input_path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"requirement": item}
+            item.setdefault("id", str(number))
+            requirements.append(item)
+    return requirements
+
+
+def _run_id(item: dict) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]+", "-", str(item["id"])).strip("-") or "run"
+
+
+async def run_one(item: dict, workdir: str) -> dict:
+    """Run one requirement in its own workspace and return its result line."""
+    run_id = _run_id(item)
+    file_path = os.path.join(workdir, run_id, "src")
+    test_path = os.path.join(workdir, run_id, "test")
+    os.makedirs(file_path, exist_ok=True)
+    os.makedirs(test_path, exist_ok=True)
+
+    # Runs are tasks, so the sink is only set for this run
+    sink = CollectingEventSink()
+    current_event_sink.set(sink)
+
+    result = {"id": item["id"], "requirement": item["requirement"], "workspace": file_path}
+    session_id = f"batch-{run_id}"
+    try:
+        outcome = await run_requirement(
+            build_graph(file_path, test_path), item["requirement"], session_id
+        )
+    except Exception as e:
+        logger.exception("Run %s failed", run_id)
+        return {**result, "success": False, "error": f"{type(e).__name__}: {e}"}
+    finally:
+        # No follow-up comes, the run's containers and images are not kept
+        await release_docker_resources(session_id, end_session=True)
+
+    state = outcome.state or {}
+    return {
+        **result,
+        "success": outcome.success,
+        "error": outcome.error,
+        "duration": round(outcome.duration, 2),
+        "iterations": state.get("iterations", 0),
+        "tokens": outcome.tokens,
+        "cost": round(outcome.cost, 6),
+        "peak_rss_mb": outcome.peak_rss_mb,
+        # The peak is process wide, with concurrent runs it is not this run's alone
+        "peak_rss_shared": outcome.peak_rss_shared,
+        "files": [code.filename for code in state["codes"].codes] if state.get("codes") else [],
+        "errors": [event.content for event in sink.events if event.kind == "error"],
+    }
+
+
+async def run_batch(
+    input_path: str,
+    output_path: str,
+    concurrency: Optional[int] = None,
+    workdir: Optional[str] = None,
+) -> List[dict]:
+    """
+    Run every requirement of `input_path`, at most `concurrency` at a time.
+    Results are appended to `output_path` as soon as each run ends.
+
+    [BATCH]
+    concurrency = 2
+    workdir = generated/batch
+    """
+    concurrency = concurrency or get_int_setting("BATCH", "concurrency", 2)
+    workdir = os.path.abspath(
+        workdir or get_setting("BATCH", "workdir", os.path.join("generated", "batch"))
+    )
+    requirements = read_requirements(input_path)
+    logger.info(
+        "Running %d requirements, %d at a time", len(requirements), concurrency
+    )
+
+    slots = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+    results = []
+
+    with open(output_path, "a", encoding="utf-8") as output:
+
+        async def run_and_write(item: dict):
+            async with slots:
+                result = await run_one(item, workdir)
+            async with write_lock:
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+                results.append(result)
+            logger.info(
+                "Run %s: %s in %ss",
+                result["id"],
+                "success" if result["success"] else f"failed ({result['error']})",
+                result.get("duration"),
+            )
+
+        await asyncio.gather(*(run_and_write(item) for item in requirements))
+
+    succeeded = sum(1 for result in results if result["success"])
+    logger.info("Batch done: %d/%d succeeded", succeeded, len(results))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run requirements without the chat UI")
+    parser.add_argument("input", help="JSONL file of requirements")
+    parser.add_argument("--output", default="results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--workdir", default=None, help="Directory of the run workspaces")
+    args = parser.parse_args()
+
+    load_dotenv()
+    setup_logging()
+    asyncio.run(run_batch(args.input, args.output, args.concurrency, args.workdir))
+
+
+if __name__ == "__main__":
+    main()
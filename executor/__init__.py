@@ -0,0 +1,53 @@
+from .backends import (
+    ExecutionBackend,
+    ExecutionJob,
+    get_backend,
+    select_backend,
+)
+from .compose import (
+    ComposeResult,
+    compose_up,
+    compose_down,
+    container_logs,
+    container_state,
+)
+from .events import (
+    ContainerEvent,
+    DockerEventWatcher,
+    StubEventSource,
+    get_event_watcher,
+)
+from .hot_reload import SyncResult, sync_into_container
+from .dispatcher import WorkerPool, NoWorkerAvailable, get_worker_pool
+from .lifecycle import LifecycleManager, get_lifecycle_manager
+from .snapshots import SnapshotStore, forget_snapshot_store, get_snapshot_store
+from .testing import TestFailure, TestReport, run_tests
+
+__all__ = [
+    "ExecutionBackend",
+    "ExecutionJob",
+    "get_backend",
+    "select_backend",
+    "ComposeResult",
+    "compose_up",
+    "compose_down",
+    "container_logs",
+    "container_state",
+    "ContainerEvent",
+    "DockerEventWatcher",
+    "StubEventSource",
+    "get_event_watcher",
+    "SyncResult",
+    "sync_into_container",
+    "WorkerPool",
+    "NoWorkerAvailable",
+    "get_worker_pool",
+    "LifecycleManager",
+    "get_lifecycle_manager",
+    "SnapshotStore",
+    "get_snapshot_store",
+    "forget_snapshot_store",
+    "TestFailure",
+    "TestReport",
+    "run_tests",
+]
@@ -0,0 +1,469 @@
+import abc
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, and no sandbox
+    resource = None
+
+# own imports
+from executor.build_context import ComposeFileError, build_services, read_compose_services
+from executor.compose import (
+    CommandTimeout,
+    ComposeResult,
+    OutputCallback,
+    _wait_for_exit,
+    build_image,
+    compose_up,
+    run_command,
+)
+from executor.events import get_event_watcher
+from executor.lifecycle import PROJECT_LABEL
+from executor.limits import ExecutionLimits
+from executor.snapshots import clone_file
+from utils.docker_templates import RuntimeSpec
+from utils.settings import get_int_setting, get_setting
+
+logger = logging.getLogger(__name__)
+
+# Backend tried next when a project is not something the chosen backend can run
+FALLBACKS = {"sandbox": "container", "container": "compose"}
+# Service keys the container backend knows how to pass to `docker run`
+CONTAINER_SERVICE_KEYS = {"build", "image", "container_name", "restart", "environment"}
+# Host interpreters of the runtimes the sandbox runs, with their isolation flags
+SANDBOX_INTERPRETERS = {"python": ["python3", "-I", "-S"], "node": ["node"]}
+SANDBOX_NAMESPACES = [
+    "unshare", "--user", "--map-root-user", "--net", "--pid", "--fork", "--kill-child", "--mount",
+]
+# Host directories of the runtime, mounted read-only in the sandbox's root
+SANDBOX_RUNTIME_DIRS = ["/usr", "/bin", "/lib", "/lib32", "/lib64", "/libx32", "/etc"]
+SANDBOX_PATH = "/usr/local/bin:/usr/bin:/bin"
+# Run by `sh` in the new namespaces: $1 becomes the root, with the directories up to "--"
+# read-only, the program's copy at /app and its own /proc, /tmp and /dev nodes; then the
+# program (after "--") runs chrooted in /app
+SANDBOX_ROOT_SCRIPT = r"""
+set -e
+root=$1 app=$2
+shift 2
+mount -t tmpfs -o mode=755 sandbox "$root"
+while [ "$1" != "--" ]; do
+    mkdir -p "$root$1"
+    mount --bind "$1" "$root$1"
+    mount -o remount,bind,ro "$root$1"
+    shift
+done
+shift
+mkdir -p "$root/app" "$root/proc" "$root/tmp" "$root/dev"
+mount --bind "$app" "$root/app"
+mount -t proc proc "$root/proc"
+mount -t tmpfs -o mode=1777 tmp "$root/tmp"
+for node in null zero random urandom; do
+    touch "$root/dev/$node"
+    mount --bind "/dev/$node" "$root/dev/$node"
+done
+chroot=$(PATH="/usr/sbin:/sbin:$PATH" command -v chroot)
+exec "$chroot" "$root" /bin/sh -c 'cd /app && exec "$@"' sh "$@"
+"""
+
+
+@dataclass
+class ExecutionJob:
+    """
+    A project to build and run.
+
+    Attributes:
+        file_path: Workspace of the project (sources, Dockerfile, compose.yaml).
+        container_name: Container the program runs in (its name for the sandbox).
+        project_name: Compose project, also the label of the Docker resources.
+        tracked_files: Files of the project, the only ones sent to a build or sandbox.
+        runtime: Runtime and command of the project, None for stacks without a template.
+    """
+
+    file_path: str
+    container_name: str
+    project_name: str
+    tracked_files: List[str]
+    runtime: Optional[RuntimeSpec] = None
+    limits: Optional[ExecutionLimits] = None
+    on_output: Optional[OutputCallback] = None
+
+
+def _compose_services(file_path: str) -> Dict[str, dict]:
+    """Services of compose.yaml, none when it is broken (compose_up reports why)."""
+    try:
+        return read_compose_services(os.path.join(file_path, "compose.yaml"))
+    except ComposeFileError:
+        return {}
+
+
+def memory_bytes(size: str) -> int:
+    """Bytes of a docker memory size ("512m", "1g", "1048576")."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([bkmg]?)b?\s*", size.lower())
+    if not match:
+        raise ValueError(f"Unknown memory size: {size}")
+    scale = {"": 1, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}[match.group(2)]
+    return int(float(match.group(1)) * scale)
+
+
+class ExecutionBackend(abc.ABC):
+    """
+    Builds and runs a project under the execution limits, and reports how it went
+    as a ComposeResult.
+
+    Attributes:
+        name: Name of the backend in [BACKENDS].
+        keeps_container: The program runs in a named container that outlives the
+            run, so its logs can be read and fixed files synced into it.
+    """
+
+    name = ""
+    keeps_container = True
+
+    def supports(self, job: ExecutionJob) -> Optional[str]:
+        """Why the backend can not run the project, None if it can."""
+        return None
+
+    @abc.abstractmethod
+    async def run(self, job: ExecutionJob) -> ComposeResult:
+        pass
+
+
+class ComposeBackend(ExecutionBackend):
+    """docker-compose, for every project (several services, networks, volumes, ...)."""
+
+    name = "compose"
+
+    def supports(self, job: ExecutionJob) -> Optional[str]:
+        if shutil.which("docker-compose") is None:
+            return "docker-compose is not installed"
+        return None
+
+    async def run(self, job: ExecutionJob) -> ComposeResult:
+        return await compose_up(
+            job.file_path,
+            job.container_name,
+            job.on_output,
+            project_name=job.project_name,
+            limits=job.limits,
+            tracked_files=job.tracked_files,
+        )
+
+
+class ContainerBackend(ExecutionBackend):
+    """
+    One container started with `docker run`, for projects with a single service
+    built from the workspace: no compose project, network or override file to create.
+    """
+
+    name = "container"
+
+    def supports(self, job: ExecutionJob) -> Optional[str]:
+        if shutil.which("docker") is None:
+            return "docker is not installed"
+        services = _compose_services(job.file_path)
+        if len(services) != 1:
+            return f"compose.yaml has {len(services)} services"
+        service = next(iter(services.values())) or {}
+        extra = set(service) - CONTAINER_SERVICE_KEYS
+        if extra:
+            return f"the service uses {', '.join(sorted(extra))}"
+        if not build_services(job.file_path, job.project_name):
+            return "the service is not built from the workspace"
+        return None
+
+    async def run(self, job: ExecutionJob) -> ComposeResult:
+        limits = job.limits or ExecutionLimits.from_settings()
+        result = ComposeResult(build_returncode=0, backend=self.name)
+        build = next(iter(build_services(job.file_path, job.project_name).values()))
+        service = next(iter(_compose_services(job.file_path).values())) or {}
+
+        try:
+            returncode, stdout, stderr, stats = await build_image(
+                job.file_path,
+                job.tracked_files,
+                build["image"],
+                build["dockerfile"],
+                job.on_output,
+                limits.build_timeout,
+                limits.log_max_bytes,
+                project_name=job.project_name,
+            )
+        except CommandTimeout as e:
+            result.build_returncode = -1
+            result.timed_out = True
+            result.build_stdout = e.stdout
+            result.build_stderr = f"{e.stderr}\n{e}"
+            return result
+        result.build_stats = {"app": stats.to_dict()}
+        result.build_returncode = returncode
+        result.images = [build["image"]]
+        result.build_stdout = stdout
+        result.build_stderr = stderr
+        if returncode != 0:
+            return result
+
+        # The container of the previous run has the same name
+        await run_command(["docker", "rm", "-f", job.container_name])
+        environment = service.get("environment") or {}
+        if isinstance(environment, dict):
+            environment = [f"{key}={value}" for key, value in environment.items()]
+        command = [
+            "docker", "run", "-d",
+            "--name", job.container_name,
+            "--label", f"{PROJECT_LABEL}={job.project_name}",
+            "--cpus", str(limits.cpus),
+            "--memory", limits.memory,
+            "--memory-swap", limits.memory,
+            "--pids-limit", str(limits.pids),
+            "--log-driver", "json-file",
+            "--log-opt", f"max-size={limits.log_max_bytes}",
+            "--log-opt", "max-file=1",
+        ]
+        for variable in environment:
+            command += ["-e", str(variable)]
+
+        # Watch the container before it starts, so its exit can not be missed
+        watch = get_event_watcher().watch(job.container_name)
+        try:
+            try:
+                returncode, stdout, stderr = await run_command(
+                    command + [build["image"]], job.on_output, limits.run_timeout
+                )
+            except CommandTimeout as e:
+                result.build_returncode = -1
+                result.timed_out = True
+                result.build_stderr += f"{e.stderr}\n{e}"
+                return result
+            result.build_returncode = returncode
+            result.build_stdout += stdout
+            result.build_stderr += stderr
+            if returncode != 0:
+                return result
+
+            await _wait_for_exit(job.container_name, limits, result, watch)
+            _, result.logs, result.logs_stderr = await run_command(
+                ["docker", "logs", job.container_name], max_bytes=limits.log_max_bytes
+            )
+            return result
+        finally:
+            watch.close()
+
+
+class LocalSandboxBackend(ExecutionBackend):
+    """
+    Runs a Python or Node.js program directly on the host, in a copy of its files,
+    for short-lived scripts where starting a container costs more than the program.
+
+    The program runs with the host's interpreter (Python without site-packages), so
+    only projects without dependencies qualify. It runs in new user, network, PID and
+    mount namespaces (`unshare`) with a private root: a tmpfs holding the copy of the
+    files at /app and the runtime directories of the host, read-only. Nothing else of
+    the host (the bot's .env, the other sessions' workspaces) is visible. Hosts where
+    unprivileged user namespaces or these mounts are not allowed do not get the sandbox:
+    the project falls back to the container backend.
+
+    Resource limits: memory from [LIMITS] memory (RLIMIT_DATA; RLIMIT_AS would break
+    the address space V8 reserves), CPU time from run_timeout, file size and no core
+    dumps. The process count is not limited: RLIMIT_NPROC counts every process of the
+    user, not the sandbox's.
+
+    [SANDBOX]
+    max_file_size = 67108864
+    """
+
+    name = "sandbox"
+    keeps_container = False
+
+    def __init__(self):
+        self._isolation: Optional[str] = None
+        self._isolation_checked = False
+
+    def supports(self, job: ExecutionJob) -> Optional[str]:
+        if not sys.platform.startswith("linux") or resource is None:
+            return "the sandbox needs Linux"
+        if job.runtime is None or job.runtime.runtime not in SANDBOX_INTERPRETERS:
+            return "the project's runtime is not supported"
+        interpreter = SANDBOX_INTERPRETERS[job.runtime.runtime][0]
+        if shutil.which(interpreter, path=SANDBOX_PATH) is None:
+            return f"{interpreter} is not installed in {SANDBOX_PATH}"
+        for manifest in job.runtime.manifests:
+            if self._has_dependencies(os.path.join(job.file_path, manifest)):
+                return f"{manifest} lists dependencies"
+        return self.isolation_unavailable()
+
+    @staticmethod
+    def _has_dependencies(manifest_path: str) -> bool:
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                content = f.read()
+        except OSError:
+            return False
+        if manifest_path.endswith(".json"):
+            try:
+                package = json.loads(content or "{}")
+            except ValueError:
+                return True
+            return bool(package.get("dependencies")) if isinstance(package, dict) else True
+        return any(
+            line.strip() and not line.strip().startswith("#") for line in content.splitlines()
+        )
+
+    @staticmethod
+    def _isolated_command(directory: str, command: List[str]) -> List[str]:
+        """`command` in new namespaces, chrooted in a private root built in `directory`."""
+        root = os.path.join(directory, "root")
+        os.makedirs(root, exist_ok=True)
+        runtime_dirs = [path for path in SANDBOX_RUNTIME_DIRS if os.path.isdir(path)]
+        return (
+            SANDBOX_NAMESPACES
+            + ["sh", "-c", SANDBOX_ROOT_SCRIPT, "sh", root, os.path.join(directory, "app")]
+            + runtime_dirs
+            + ["--"]
+            + command
+        )
+
+    def isolation_unavailable(self) -> Optional[str]:
+        """
+        Why programs can not be isolated on this host, None if they can. Checked once,
+        by building a private root, as the first select_backend call of the process.
+        """
+        if not self._isolation_checked:
+            self._isolation_checked = True
+            self._isolation = self._check_isolation()
+            if self._isolation:
+                logger.warning("No sandbox on this host: %s", self._isolation)
+        return self._isolation
+
+    def _check_isolation(self) -> Optional[str]:
+        if shutil.which("unshare") is None:
+            return "unshare is not installed"
+        directory = tempfile.mkdtemp(prefix="sandbox-")
+        try:
+            os.makedirs(os.path.join(directory, "app"))
+            completed = subprocess.run(
+                self._isolated_command(directory, ["true"]),
+                capture_output=True,
+                text=True,
+                timeout=10,
+                env={"PATH": SANDBOX_PATH},
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            return f"the private root can not be created: {e}"
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        if completed.returncode != 0:
+            return f"the private root can not be created: {completed.stderr.strip()}"
+        return None
+
+    def _limit_resources(self, limits: ExecutionLimits):
+        memory = memory_bytes(limits.memory)
+        cpu_seconds = int(limits.run_timeout) + 1
+        max_file_size = get_int_setting("SANDBOX", "max_file_size", 64 * 1024 * 1024)
+
+        # Runs in the child, between fork and exec
+        def limit():
+            resource.setrlimit(resource.RLIMIT_DATA, (memory, memory))
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+            resource.setrlimit(resource.RLIMIT_FSIZE, (max_file_size, max_file_size))
+            resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+        return limit
+
+    async def run(self, job: ExecutionJob) -> ComposeResult:
+        limits = job.limits or ExecutionLimits.from_settings()
+        result = ComposeResult(build_returncode=0, backend=self.name)
+        # Never run the program on the host without its private root
+        reason = self.isolation_unavailable()
+        if reason is not None:
+            result.build_returncode = 1
+            result.build_stderr = f"The sandbox can not run the program: {reason}"
+            return result
+
+        directory = tempfile.mkdtemp(prefix="sandbox-")
+        workdir = os.path.join(directory, "app")
+        try:
+            os.makedirs(workdir)
+            for filename in job.tracked_files:
+                source = os.path.join(job.file_path, filename)
+                if os.path.isfile(source):
+                    target = os.path.join(workdir, filename)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    clone_file(source, target)
+
+            command = self._isolated_command(
+                directory, SANDBOX_INTERPRETERS[job.runtime.runtime] + job.runtime.command[1:]
+            )
+            environment = {
+                "PATH": SANDBOX_PATH,
+                "HOME": "/app",
+                "LANG": "C.UTF-8",
+                "PYTHONUNBUFFERED": "1",
+                "PYTHONDONTWRITEBYTECODE": "1",
+                "NODE_ENV": "production",
+            }
+            try:
+                returncode, result.logs, result.logs_stderr = await run_command(
+                    command,
+                    job.on_output,
+                    limits.run_timeout,
+                    limits.log_max_bytes,
+                    cwd=workdir,
+                    env=environment,
+                    preexec_fn=self._limit_resources(limits),
+                )
+            except CommandTimeout as e:
+                result.timed_out = True
+                result.logs, result.logs_stderr = e.stdout, e.stderr
+                return result
+            result.exit_code = returncode
+            # Allocations over RLIMIT_DATA fail inside the program instead of a kill
+            result.oom_killed = returncode != 0 and (
+                "MemoryError" in result.logs_stderr
+                or "heap out of memory" in result.logs_stderr
+            )
+            return result
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+BACKENDS: Dict[str, ExecutionBackend] = {
+    backend.name: backend
+    for backend in (ComposeBackend(), ContainerBackend(), LocalSandboxBackend())
+}
+
+
+def get_backend(name: Optional[str]) -> ExecutionBackend:
+    return BACKENDS.get(name or "compose", BACKENDS["compose"])
+
+
+def select_backend(job: ExecutionJob) -> ExecutionBackend:
+    """
+    Backend configured for the project's runtime, or the next heavier one
+    (sandbox -> container -> compose) when it can not run the project.
+
+    [BACKENDS]
+    default = compose
+    python = compose
+    node = compose
+    """
+    default = get_setting("BACKENDS", "default", "compose")
+    name = get_setting("BACKENDS", job.runtime.runtime, default) if job.runtime else default
+    if name not in BACKENDS:
+        logger.warning("Unknown execution backend %s, using compose", name)
+        name = "compose"
+    while name in FALLBACKS:
+        reason = BACKENDS[name].supports(job)
+        if reason is None:
+            break
+        logger.info("Not using the %s backend: %s", name, reason)
+        name = FALLBACKS[name]
+    return BACKENDS[name]
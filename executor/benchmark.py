@@ -0,0 +1,160 @@
+"""
+Start latency and throughput of the execution backends, on a short Python script.
+
+    python -m executor.benchmark --runs 10 --concurrency 4
+    python -m executor.benchmark --backends sandbox --runs 50
+
+Every run gets its own workspace and container name. Backends that can not run
+here (no Docker, no docker-compose, not Linux) are reported as skipped, so the
+sandbox can be measured on any Linux host without extra services.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import List
+
+# own imports
+from executor.backends import BACKENDS, ExecutionBackend, ExecutionJob
+from executor.compose import compose_command, run_command
+from executor.limits import ExecutionLimits
+from utils.docker_templates import PYTHON_BASE_IMAGE, RuntimeSpec
+from utils.log_pipeline import setup_logging
+
+logger = logging.getLogger(__name__)
+
+SCRIPT = 'import sys\nprint("hello from", sys.version.split()[0])\n'
+IMAGE_NAME = "codegen-benchmark:latest"
+
+
+def write_project(directory: str, container_name: str) -> ExecutionJob:
+    """A one-file Python project with the Docker files of the templates."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "main.py"), "w", encoding="utf-8") as f:
+        f.write(SCRIPT)
+    with open(os.path.join(directory, "Dockerfile"), "w", encoding="utf-8") as f:
+        f.write(
+            f"FROM {PYTHON_BASE_IMAGE}\nWORKDIR /app\nCOPY . .\n"
+            'CMD ["python", "main.py"]\n'
+        )
+    with open(os.path.join(directory, "compose.yaml"), "w", encoding="utf-8") as f:
+        f.write(
+            "services:\n  app:\n    build: .\n"
+            f"    image: {IMAGE_NAME}\n    container_name: {container_name}\n"
+            '    restart: "no"\n'
+        )
+    return ExecutionJob(
+        directory,
+        container_name,
+        container_name,
+        ["main.py"],
+        runtime=RuntimeSpec("python", "main.py", [], ["python", "main.py"]),
+        limits=ExecutionLimits.from_settings(),
+    )
+
+
+async def _timed_run(backend: ExecutionBackend, job: ExecutionJob) -> float:
+    started_at = time.monotonic()
+    result = await backend.run(job)
+    seconds = time.monotonic() - started_at
+    if result.build_returncode != 0 or result.exit_code not in (0, None) or result.timed_out:
+        raise RuntimeError(
+            f"{backend.name} run failed: {(result.build_stderr or result.logs_stderr)[-500:]}"
+        )
+    return seconds
+
+
+async def _cleanup(backend: ExecutionBackend, jobs: List[ExecutionJob]):
+    for job in jobs:
+        if backend.name == "compose":
+            await run_command(
+                compose_command(job.file_path, job.project_name) + ["down", "--timeout", "1"]
+            )
+        elif backend.keeps_container:
+            await run_command(["docker", "rm", "-f", job.container_name])
+
+
+async def benchmark_backend(
+    backend: ExecutionBackend, workdir: str, runs: int, concurrency: int
+) -> dict:
+    """
+    Start latency: `runs` runs one after the other (the first one, which builds the
+    image, is reported on its own). Throughput: `runs` more runs, `concurrency` at a time.
+    """
+    jobs = [
+        write_project(
+            os.path.join(workdir, backend.name, str(i)), f"codegen-bench-{backend.name}-{i}"
+        )
+        for i in range(runs * 2)
+    ]
+    reason = backend.supports(jobs[0])
+    if reason:
+        return {"backend": backend.name, "skipped": reason}
+
+    try:
+        first = await _timed_run(backend, jobs[0])
+        latencies = [first] + [await _timed_run(backend, job) for job in jobs[1:runs]]
+        warm = sorted(latencies[1:] or latencies)
+
+        slots = asyncio.Semaphore(concurrency)
+
+        async def limited(job: ExecutionJob) -> float:
+            async with slots:
+                return await _timed_run(backend, job)
+
+        started_at = time.monotonic()
+        await asyncio.gather(*(limited(job) for job in jobs[runs:]))
+        elapsed = time.monotonic() - started_at
+    except Exception as e:
+        logger.exception("Benchmark of %s failed", backend.name)
+        return {"backend": backend.name, "error": f"{type(e).__name__}: {e}"}
+    finally:
+        await _cleanup(backend, jobs)
+
+    return {
+        "backend": backend.name,
+        "first_run_seconds": round(first, 4),
+        "latency_seconds_min": round(warm[0], 4),
+        "latency_seconds_median": round(warm[len(warm) // 2], 4),
+        "latency_seconds_p95": round(warm[min(len(warm) - 1, int(len(warm) * 0.95))], 4),
+        "throughput_runs_per_second": round(runs / elapsed, 3),
+        "concurrency": concurrency,
+    }
+
+
+async def run_benchmark(backends: List[str], runs: int, concurrency: int) -> List[dict]:
+    workdir = tempfile.mkdtemp(prefix="backend-bench-")
+    try:
+        return [
+            await benchmark_backend(BACKENDS[name], workdir, runs, concurrency)
+            for name in backends
+        ]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the execution backends")
+    parser.add_argument(
+        "--backends", default="sandbox,container,compose", help="Comma separated backends"
+    )
+    parser.add_argument("--runs", type=int, default=10, help="Runs per measurement")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent runs for throughput")
+    args = parser.parse_args()
+
+    setup_logging()
+    backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+    unknown = [name for name in backends if name not in BACKENDS]
+    if unknown:
+        parser.error(f"Unknown backends: {', '.join(unknown)}")
+    results = asyncio.run(run_benchmark(backends, max(1, args.runs), max(1, args.concurrency)))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import logging
+import os
+import posixpath
+import re
+import tarfile
+import tempfile
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, List, Optional
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+DOCKERIGNORE_HEADER = "# Generated: only the project's tracked files are sent to the build\n"
+
+# Dependency manifests, copied and installed before the sources
+MANIFESTS = ("requirements.txt", "package.json", "package-lock.json", "yarn.lock")
+INSTALL_COMMAND = re.compile(
+    r"\b(pip3? install|npm (install|ci)|yarn install|pnpm install)\b|\byarn\s*($|&&|;)"
+)
+# Installs of the project itself need its sources
+SOURCE_INSTALL = re.compile(r"\bpip3? install\b.*(\s\.(\s|$)|\s-e\s)")
+
+
+@dataclass
+class BuildStats:
+    """
+    Build context and layer cache numbers of one image build.
+
+    Attributes:
+        context_files / context_bytes: Files and bytes sent to the Docker daemon.
+        context_seconds: Time spent packing the build context.
+        build_seconds: Time of the whole `docker build`.
+        cached_steps / total_steps: Dockerfile steps served from the layer cache.
+    """
+
+    context_files: int = 0
+    context_bytes: int = 0
+    context_seconds: float = 0.0
+    build_seconds: float = 0.0
+    cached_steps: int = 0
+    total_steps: int = 0
+
+    @property
+    def cache_hit_rate(self) -> float:
+        return self.cached_steps / self.total_steps if self.total_steps else 0.0
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "cache_hit_rate": round(self.cache_hit_rate, 3)}
+
+
+def write_dockerignore(file_path: str, tracked_files: List[str], dockerfile: str = "Dockerfile"):
+    """
+    Allow-list .dockerignore: everything but the tracked files is left out of the build
+    context, so README / DEVELOPER files or node_modules never invalidate `COPY . .`.
+    """
+    lines = [DOCKERIGNORE_HEADER, "**\n"]
+    for filename in sorted(set(tracked_files) | {dockerfile}):
+        lines.append(f"!{filename.replace(os.sep, '/')}\n")
+    with open(os.path.join(file_path, ".dockerignore"), "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+def pack_build_context(file_path: str, tracked_files: List[str], dockerfile: str = "Dockerfile"):
+    """
+    Uncompressed tar of the tracked files and the Dockerfile, in a temporary file.
+    Entries have a fixed mtime and owner, so an unchanged file always packs the same.
+    Returns (file, BuildStats).
+    """
+    return pack_files(file_path, set(tracked_files) | {dockerfile})
+
+
+def pack_files(file_path: str, filenames: Iterable[str]):
+    """Uncompressed tar of `filenames` (relative to `file_path`). Returns (file, BuildStats)."""
+    started_at = time.monotonic()
+    stats = BuildStats()
+    archive = tempfile.TemporaryFile()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        for filename in sorted(set(filenames)):
+            path = os.path.join(file_path, filename)
+            if not os.path.isfile(path):
+                continue
+            info = tar.gettarinfo(path, arcname=filename.replace(os.sep, "/"))
+            info.mtime = 0
+            info.uid = info.gid = 0
+            info.uname = info.gname = ""
+            with open(path, "rb") as f:
+                tar.addfile(info, f)
+            stats.context_files += 1
+            stats.context_bytes += info.size
+    archive.seek(0)
+    stats.context_seconds = time.monotonic() - started_at
+    return archive, stats
+
+
+def parse_cache_stats(output: str) -> tuple:
+    """(cached, total) build steps from BuildKit or classic builder output."""
+    # BuildKit: "#6 [2/5] COPY requirements.txt ." ... "#6 CACHED"
+    steps = set(re.findall(r"^#(\d+) \[[^\]]*\d+/\d+\]", output, re.MULTILINE))
+    if steps:
+        cached = set(re.findall(r"^#(\d+) CACHED", output, re.MULTILINE))
+        return len(steps & cached), len(steps)
+    # Classic builder: "Step 2/5 : ..." followed by " ---> Using cache"
+    total = len(re.findall(r"^Step \d+/\d+ :", output, re.MULTILINE))
+    return output.count("---> Using cache"), total
+
+
+class ComposeFileError(ValueError):
+    """compose.yaml can not be read, is not valid YAML, or its services are not mappings."""
+
+
+def read_compose_services(compose_file_path: str) -> Dict[str, dict]:
+    """
+    Services of a compose file by name. Raises ComposeFileError for files the LLM got
+    wrong, so they are reported as a Docker configuration error to be fixed.
+    """
+    try:
+        with open(compose_file_path, encoding="utf-8") as f:
+            compose = yaml.safe_load(f)
+    except OSError as e:
+        raise ComposeFileError(f"compose.yaml can not be read: {e}") from e
+    except yaml.YAMLError as e:
+        raise ComposeFileError(f"compose.yaml is not valid YAML: {e}") from e
+    if compose is None:
+        compose = {}
+    if not isinstance(compose, dict):
+        raise ComposeFileError("compose.yaml must be a mapping with a `services` key")
+    services = compose.get("services") or {}
+    if not isinstance(services, dict):
+        raise ComposeFileError("`services` in compose.yaml must map service names to services")
+    for name, service in services.items():
+        if service is not None and not isinstance(service, dict):
+            raise ComposeFileError(f"Service `{name}` in compose.yaml must be a mapping")
+    return {str(name): service or {} for name, service in services.items()}
+
+
+def _service_builds(file_path: str):
+    """(name, service, build) of the compose.yaml services that have a build section."""
+    services = read_compose_services(os.path.join(file_path, "compose.yaml"))
+    for name, service in services.items():
+        build = service.get("build")
+        if build is None:
+            continue
+        if isinstance(build, str):
+            build = {"context": build}
+        yield name, service, build
+
+
+def build_services(file_path: str, project_name: str) -> Dict[str, dict]:
+    """
+    Services of compose.yaml that are built from the project directory, with the
+    Dockerfile and the image tag compose would use for them.
+    """
+    builds = {}
+    for name, service, build in _service_builds(file_path):
+        if os.path.normpath(build.get("context", ".")) != ".":
+            continue
+        builds[name] = {
+            "dockerfile": build.get("dockerfile", "Dockerfile"),
+            "image": service.get("image") or f"{project_name}-{name}",
+        }
+    return builds
+
+
+def compose_builds(file_path: str) -> List[str]:
+    """Services built from another context than the project directory, left to compose."""
+    return [
+        name
+        for name, _, build in _service_builds(file_path)
+        if os.path.normpath(build.get("context", ".")) != "."
+    ]
+
+
+def _instructions(dockerfile: str) -> List[List[str]]:
+    """Dockerfile instructions, each with its continuation lines."""
+    units: List[List[str]] = []
+    continued = False
+    for line in dockerfile.splitlines():
+        if continued and units:
+            units[-1].append(line)
+        else:
+            units.append([line])
+        continued = line.rstrip().endswith("\\")
+    return units
+
+
+def _words(unit: List[str]) -> List[str]:
+    return " ".join(unit).replace("\\", " ").split()
+
+
+def copy_destination(dockerfile: str) -> Optional[str]:
+    """
+    Absolute directory the final stage copies the project to (`COPY . <dest>`).
+    None when the sources are not copied as a whole, or a RUN step follows the copy
+    (a build, `pip install .`, ...) so the image holds more than the copied files.
+    """
+    workdir = "/"
+    destination = None
+    for unit in _instructions(dockerfile):
+        tokens = _words(unit)
+        if not tokens:
+            continue
+        instruction = tokens[0].upper()
+        if instruction == "FROM":
+            workdir, destination = "/", None
+        elif instruction == "WORKDIR" and len(tokens) > 1:
+            workdir = posixpath.join(workdir, tokens[1])
+        elif instruction in ("COPY", "ADD") and not any(t.startswith("--from") for t in tokens):
+            sources = [t for t in tokens[1:-1] if not t.startswith("--")]
+            if sources == ["."]:
+                destination = posixpath.normpath(posixpath.join(workdir, tokens[-1]))
+        elif instruction == "RUN" and destination is not None:
+            destination = None
+    return destination
+
+
+def order_manifests_first(dockerfile: str, manifests: List[str]) -> str:
+    """
+    Move the dependency install in front of `COPY . <dest>`, after a COPY of the
+    manifests only, so source changes reuse the cached dependency layer.
+    Dockerfiles that already copy a manifest before the sources are left as they are,
+    and so are those with other instructions than ENV or ARG between the copy and the
+    install (a RUN installing system packages the install needs, a WORKDIR, ...).
+    The ENV and ARG lines move up with the install.
+    """
+    manifests = [m for m in manifests if m in MANIFESTS]
+    if not manifests:
+        return dockerfile
+
+    units = _instructions(dockerfile)
+    copy_all = install = None
+    for index, unit in enumerate(units):
+        tokens = _words(unit)
+        if not tokens:
+            continue
+        instruction = tokens[0].upper()
+        if instruction in ("COPY", "ADD") and copy_all is None:
+            sources = [t for t in tokens[1:-1] if not t.startswith("--")]
+            if any(m in sources for m in manifests):
+                return dockerfile
+            if sources == ["."] and not any(t.startswith("--from") for t in tokens):
+                copy_all = index
+        elif copy_all is None:
+            continue
+        elif instruction == "RUN" and INSTALL_COMMAND.search(" ".join(tokens[1:])):
+            if SOURCE_INSTALL.search(" ".join(tokens[1:])):
+                return dockerfile
+            install = index
+            break
+        elif instruction not in ("ENV", "ARG"):
+            return dockerfile
+    if copy_all is None or install is None:
+        return dockerfile
+
+    destination = _words(units[copy_all])[-1]
+    if not destination.endswith("/"):
+        destination += "/"
+    reordered = (
+        units[:copy_all]
+        + units[copy_all + 1 : install]
+        + [[f"COPY {' '.join(manifests)} {destination}"], units[install], units[copy_all]]
+        + units[install + 1 :]
+    )
+    return "\n".join(line for unit in reordered for line in unit) + "\n"
@@ -0,0 +1,425 @@
+import asyncio
+import codecs
+import inspect
+import logging
+import os
+import time
+from dataclasses import dataclass, asdict, field
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+# own imports
+from executor.build_context import (
+    BuildStats,
+    ComposeFileError,
+    build_services,
+    compose_builds,
+    pack_build_context,
+    parse_cache_stats,
+)
+from executor.events import ContainerWatch, get_event_watcher
+from executor.limits import ExecutionLimits, write_limits_override
+from tracing import record_command
+from utils.log_pipeline import RingBuffer
+
+logger = logging.getLogger(__name__)
+
+# Label docker-compose puts on the resources of a project, also set on the images
+# and containers started without compose so they are tracked and collected the same way
+PROJECT_LABEL = "com.docker.compose.project"
+READ_CHUNK_SIZE = 64 * 1024
+# Output kept per stream when the caller does not give a limit
+DEFAULT_OUTPUT_CHARS = 1024 * 1024
+
+
+@dataclass
+class ComposeResult:
+    """
+    Outcome of building and running a project with docker-compose.
+
+    Attributes:
+        build_returncode: Exit code of the build / start phase (-1 when it timed out).
+        build_stdout / build_stderr: Output of the build and start.
+        logs / logs_stderr: Output of `docker logs` for the project container.
+        exit_code: Exit code of the program inside the container, None if unknown.
+        running: The program is a server (it listens on a port) and was left running.
+        timed_out: The build or the program exceeded its wall-clock limit.
+        oom_killed: The program was killed for exceeding its memory limit.
+        build_stats: Build context size and layer cache hits, per built service.
+        backend: Execution backend that ran the project (see executor.backends).
+        images: Images built by `docker build` (not by compose), to be removed with
+            the session.
+    """
+
+    build_returncode: int
+    build_stdout: str = ""
+    build_stderr: str = ""
+    logs: str = ""
+    logs_stderr: str = ""
+    exit_code: Optional[int] = None
+    running: bool = False
+    timed_out: bool = False
+    oom_killed: bool = False
+    build_stats: Optional[Dict[str, dict]] = None
+    backend: str = "compose"
+    images: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+# Called with ("stdout" | "stderr", text) for each chunk of output, may be async
+OutputCallback = Callable[[str, str], Optional[object]]
+
+
+class CommandTimeout(Exception):
+    """The command ran longer than its timeout and was killed."""
+
+    def __init__(self, command: List[str], timeout: float, stdout: str, stderr: str):
+        super().__init__(f"'{' '.join(command)}' timed out after {timeout} seconds")
+        self.stdout = stdout
+        self.stderr = stderr
+
+
+async def _pump(
+    stream: asyncio.StreamReader,
+    name: str,
+    buffer: RingBuffer,
+    on_output: Optional[OutputCallback],
+):
+    # Read fixed-size chunks, a single huge line never has to fit in memory
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        chunk = await stream.read(READ_CHUNK_SIZE)
+        text = decoder.decode(chunk, final=not chunk)
+        if text:
+            buffer.append(text)
+            if on_output is not None:
+                result = on_output(name, text)
+                if inspect.isawaitable(result):
+                    await result
+        if not chunk:
+            break
+
+
+async def run_command(
+    command: List[str],
+    on_output: Optional[OutputCallback] = None,
+    timeout: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+    stdin: Optional[BinaryIO] = None,
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    preexec_fn: Optional[Callable[[], None]] = None,
+) -> tuple:
+    """
+    Run a command, streaming its output to `on_output`. Returns (returncode, stdout, stderr),
+    where stdout and stderr are the last `max_bytes` characters of each stream.
+    Raises CommandTimeout (after killing the command) when `timeout` is exceeded.
+    `cwd`, `env` and `preexec_fn` are passed to the subprocess as they are.
+    """
+    started_at = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=stdin,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+        preexec_fn=preexec_fn,
+    )
+    stdout = RingBuffer(max_bytes or DEFAULT_OUTPUT_CHARS)
+    stderr = RingBuffer(max_bytes or DEFAULT_OUTPUT_CHARS)
+    pumps = asyncio.gather(
+        _pump(process.stdout, "stdout", stdout, on_output),
+        _pump(process.stderr, "stderr", stderr, on_output),
+    )
+    try:
+        await asyncio.wait_for(pumps, timeout=timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        record_command(command, started_at, None, stdout.getvalue(), stderr.getvalue())
+        raise CommandTimeout(command, timeout, stdout.getvalue(), stderr.getvalue())
+    returncode = await process.wait()
+    record_command(command, started_at, returncode, stdout.getvalue(), stderr.getvalue())
+    return returncode, stdout.getvalue(), stderr.getvalue()
+
+
+def compose_command(
+    file_path: str, project_name: Optional[str] = None, override_path: Optional[str] = None
+) -> List[str]:
+    command = ["docker-compose", "-f", os.path.join(file_path, "compose.yaml")]
+    if override_path:
+        command += ["-f", override_path]
+    if project_name:
+        command += ["-p", project_name]
+    return command
+
+
+async def _is_listening(container_name: str) -> bool:
+    """The program in the container listens on a TCP port: a server, not expected to exit."""
+    # Both files are read from the container's network namespace; tcp6 may be missing
+    _, stdout, _ = await run_command(
+        ["docker", "exec", container_name, "cat", "/proc/net/tcp", "/proc/net/tcp6"]
+    )
+    for line in stdout.splitlines():
+        fields = line.split()
+        # local_address rem_address st ..., state 0A is LISTEN
+        if len(fields) > 3 and fields[0].endswith(":") and fields[3] == "0A":
+            return True
+    return False
+
+
+async def _wait_for_exit(
+    container_name: str,
+    limits: ExecutionLimits,
+    result: ComposeResult,
+    watch: Optional[ContainerWatch] = None,
+):
+    """
+    Wait for the program to finish within the run timeout, killing it otherwise.
+
+    Every `startup_window` seconds a program still running is checked for a listening
+    TCP port: a server is left running and reported as such (`result.running`), the
+    run timeout only applies to programs expected to exit.
+    """
+    state_format = "{{.Id}} {{.State.Running}} {{.State.ExitCode}}"
+    deadline = time.monotonic() + limits.run_timeout
+    returncode, stdout, _ = await run_command(
+        ["docker", "inspect", "-f", state_format, container_name]
+    )
+    fields = stdout.split()
+    container_id = fields[0] if returncode == 0 and len(fields) == 3 else None
+    while True:
+        if len(fields) == 3 and fields[1] == "false":
+            result.exit_code = int(fields[2])
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            result.timed_out = True
+            await run_command(["docker", "kill", container_name])
+            break
+        window = min(limits.startup_window, remaining)
+        if watch is not None and container_id:
+            # The die event arrives as soon as the program exits
+            event = await watch.wait(["die"], timeout=window, container_id=container_id)
+            if event is not None:
+                result.exit_code = event.exit_code
+                break
+        else:
+            try:
+                returncode, stdout, _ = await run_command(
+                    ["docker", "wait", container_name], timeout=window
+                )
+                if returncode == 0 and stdout.strip().lstrip("-").isdigit():
+                    result.exit_code = int(stdout.strip())
+                break
+            except CommandTimeout:
+                pass
+        if await _is_listening(container_name):
+            logger.info("%s listens on a port, leaving the server running", container_name)
+            result.running = True
+            break
+        # No event: the program is still running, or the events stream was down
+        _, stdout, _ = await run_command(
+            ["docker", "inspect", "-f", state_format, container_name]
+        )
+        fields = stdout.split()
+
+    if watch is not None:
+        result.oom_killed = any(event.action == "oom" for event in watch.history)
+    if not result.oom_killed:
+        returncode, stdout, _ = await run_command(
+            ["docker", "inspect", "-f", "{{.State.OOMKilled}}", container_name]
+        )
+        result.oom_killed = returncode == 0 and stdout.strip() == "true"
+
+
+async def build_image(
+    file_path: str,
+    tracked_files: List[str],
+    image: str,
+    dockerfile: str = "Dockerfile",
+    on_output: Optional[OutputCallback] = None,
+    timeout: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+    project_name: Optional[str] = None,
+) -> tuple:
+    """
+    Build `image` from a tar of the tracked files streamed to `docker build`, labeled
+    with the compose `project_name` like the images compose builds.
+    Returns (returncode, stdout, stderr, BuildStats).
+    """
+    archive, stats = pack_build_context(file_path, tracked_files, dockerfile)
+    labels = ["--label", f"{PROJECT_LABEL}={project_name}"] if project_name else []
+    started_at = time.monotonic()
+    try:
+        returncode, stdout, stderr = await run_command(
+            ["docker", "build", "-t", image, *labels, "-f", dockerfile, "-"],
+            on_output,
+            timeout,
+            max_bytes,
+            stdin=archive,
+        )
+    finally:
+        archive.close()
+    stats.build_seconds = time.monotonic() - started_at
+    # BuildKit writes its progress to stderr, the classic builder to stdout
+    stats.cached_steps, stats.total_steps = parse_cache_stats(stdout + stderr)
+    logger.info(
+        "Built %s: context %d files / %d bytes packed in %.2fs, build %.1fs, "
+        "%d/%d steps cached",
+        image,
+        stats.context_files,
+        stats.context_bytes,
+        stats.context_seconds,
+        stats.build_seconds,
+        stats.cached_steps,
+        stats.total_steps,
+    )
+    return returncode, stdout, stderr, stats
+
+
+async def compose_up(
+    file_path: str,
+    container_name: str,
+    on_output: Optional[OutputCallback] = None,
+    project_name: Optional[str] = None,
+    limits: Optional[ExecutionLimits] = None,
+    tracked_files: Optional[List[str]] = None,
+) -> ComposeResult:
+    """
+    Build and start the project in `file_path` under the execution limits, wait for the
+    program to exit (or time out) and collect the container logs.
+
+    With `tracked_files`, images of the services built from the project directory are
+    built from a context of those files only, compose builds the other services and
+    starts them all; otherwise compose builds everything from the whole directory.
+    """
+    limits = limits or ExecutionLimits.from_settings()
+    result = ComposeResult(build_returncode=0)
+    builds = {}
+    others = []
+    image_project = project_name or os.path.basename(os.path.abspath(file_path))
+    try:
+        if tracked_files is not None:
+            builds = build_services(file_path, image_project)
+            # Services with their own build context are not in the tracked files
+            others = compose_builds(file_path)
+        override_path = write_limits_override(
+            os.path.join(file_path, "compose.yaml"),
+            limits,
+            images={name: build["image"] for name, build in builds.items()},
+        )
+    except ComposeFileError as e:
+        # Reported like a failed build, so the Docker fixer gets to rewrite the file
+        result.build_returncode = 1
+        result.build_stderr = str(e)
+        return result
+    compose = compose_command(file_path, project_name, override_path)
+    # Watch the container before it starts, so its exit can not be missed
+    watch = get_event_watcher().watch(container_name)
+
+    try:
+        if builds:
+            result.build_stats = {}
+            phases = [(["up", "-d", "--no-build", "--remove-orphans"], limits.run_timeout)]
+            if others:
+                phases.insert(0, (["build", *others], limits.build_timeout))
+        else:
+            phases = [
+                (["build"], limits.build_timeout),
+                (["up", "-d", "--remove-orphans"], limits.run_timeout),
+            ]
+
+        for name, build in builds.items():
+            try:
+                returncode, stdout, stderr, stats = await build_image(
+                    file_path,
+                    tracked_files,
+                    build["image"],
+                    build["dockerfile"],
+                    on_output,
+                    limits.build_timeout,
+                    limits.log_max_bytes,
+                    image_project,
+                )
+            except CommandTimeout as e:
+                result.build_returncode = -1
+                result.timed_out = True
+                result.build_stdout += e.stdout
+                result.build_stderr += f"{e.stderr}\n{e}"
+                return result
+            result.images.append(build["image"])
+            result.build_stats[name] = stats.to_dict()
+            result.build_returncode = returncode
+            result.build_stdout += stdout
+            result.build_stderr += stderr
+            if returncode != 0:
+                return result
+
+        for phase, timeout in phases:
+            try:
+                returncode, stdout, stderr = await run_command(
+                    compose + phase, on_output, timeout, limits.log_max_bytes
+                )
+            except CommandTimeout as e:
+                result.build_returncode = -1
+                result.timed_out = True
+                result.build_stdout += e.stdout
+                result.build_stderr += f"{e.stderr}\n{e}"
+                return result
+
+            result.build_returncode = returncode
+            result.build_stdout += stdout
+            result.build_stderr += stderr
+            if returncode != 0:
+                return result
+
+        await _wait_for_exit(container_name, limits, result, watch)
+
+        _, result.logs, result.logs_stderr = await run_command(
+            ["docker", "logs", container_name], max_bytes=limits.log_max_bytes
+        )
+        return result
+    finally:
+        watch.close()
+        os.remove(override_path)
+
+
+async def compose_down(file_path: str, project_name: Optional[str] = None) -> int:
+    returncode, _, _ = await run_command(
+        compose_command(file_path, project_name)
+        + ["down", "--volumes", "--remove-orphans"]
+    )
+    return returncode
+
+
+async def container_state(container_name: str) -> Optional[dict]:
+    """Id, running flag, exit code and OOM flag of a container, None if it does not exist."""
+    returncode, stdout, _ = await run_command(
+        [
+            "docker", "inspect", "-f",
+            "{{.Id}} {{.State.Running}} {{.State.ExitCode}} {{.State.OOMKilled}}",
+            container_name,
+        ]
+    )
+    fields = stdout.split()
+    if returncode != 0 or len(fields) != 4:
+        return None
+    return {
+        "id": fields[0],
+        "running": fields[1] == "true",
+        "exit_code": int(fields[2]),
+        "oom_killed": fields[3] == "true",
+    }
+
+
+async def container_logs(
+    container_name: str, tail: int = 20, since: Optional[float] = None
+) -> tuple:
+    """Returns (returncode, stdout, stderr) of `docker logs --tail` (from the `since` timestamp)."""
+    command = ["docker", "logs", "--tail", str(tail)]
+    if since is not None:
+        command += ["--since", f"{since:.3f}"]
+    return await run_command(command + [container_name])
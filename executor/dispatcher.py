@@ -0,0 +1,241 @@
+import asyncio
+import inspect
+import logging
+from typing import Dict, List, Optional, Set
+
+# own imports
+from executor.compose import ComposeResult, OutputCallback
+from executor.testing import TestReport
+from executor.protocol import (
+    ProtocolError,
+    pack_workspace,
+    receive_message,
+    send_message,
+    send_stream,
+)
+from utils.settings import get_float_setting, get_list_setting, get_setting
+
+logger = logging.getLogger(__name__)
+
+
+class NoWorkerAvailable(Exception):
+    pass
+
+
+def _parse_address(address: str) -> tuple:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class WorkerPool:
+    """
+    Dispatches builds and runs to a pool of execution workers.
+
+    Placement prefers the worker that already ran the same container (it holds the
+    workspace and image), then workers that have the image cached, then the least
+    loaded worker.
+    """
+
+    def __init__(
+        self,
+        addresses: List[str],
+        connect_timeout: float = 5.0,
+        token: Optional[str] = None,
+    ):
+        self.addresses = addresses
+        self.connect_timeout = connect_timeout
+        self.token = token
+        self.placements: Dict[str, str] = {}  # container name -> worker address
+        self.sessions: Dict[str, Set[str]] = {}  # session id -> container names
+        self._in_flight: Dict[str, int] = {address: 0 for address in addresses}
+
+    async def _connect(self, address: str):
+        host, port = _parse_address(address)
+        return await asyncio.wait_for(
+            asyncio.open_connection(host, port), timeout=self.connect_timeout
+        )
+
+    def _message(self, message: dict) -> dict:
+        """Request with the workers' shared token, when one is configured."""
+        return {**message, "token": self.token} if self.token else message
+
+    async def _request(self, address: str, message: dict) -> dict:
+        reader, writer = await self._connect(address)
+        try:
+            await send_message(writer, self._message(message))
+            response = await receive_message(reader)
+        finally:
+            writer.close()
+        if response is None:
+            raise ProtocolError(f"Worker {address} closed the connection")
+        if response.get("event") == "error":
+            raise ProtocolError(response.get("details", "Unknown worker error"))
+        return response
+
+    async def status(self, address: str) -> Optional[dict]:
+        try:
+            return await self._request(address, {"op": "status"})
+        except (OSError, asyncio.TimeoutError, ProtocolError) as e:
+            logger.warning("Worker %s unavailable: %s", address, e)
+            return None
+
+    async def choose(self, container_name: str, image_name: Optional[str]) -> str:
+        statuses = await asyncio.gather(*(self.status(a) for a in self.addresses))
+
+        candidates = []
+        for address, status in zip(self.addresses, statuses):
+            if status is None:
+                continue
+            capacity = max(status.get("capacity", 1), 1)
+            # Reported jobs lag behind our own dispatches, take the larger of the two
+            load = max(status.get("active_jobs", 0), self._in_flight[address])
+            score = (
+                load >= capacity,  # saturated workers last
+                self.placements.get(container_name) != address,  # workspace affinity
+                image_name not in status.get("images", []),  # image affinity
+                load / capacity,  # least loaded
+            )
+            candidates.append((score, address))
+
+        if not candidates:
+            raise NoWorkerAvailable("No execution worker is reachable")
+        return min(candidates)[1]
+
+    async def run(
+        self,
+        file_path: str,
+        container_name: str,
+        image_name: Optional[str] = None,
+        on_output: Optional[OutputCallback] = None,
+        session_id: Optional[str] = None,
+    ) -> ComposeResult:
+        address = await self.choose(container_name, image_name)
+        self.sessions.setdefault(session_id, set()).add(container_name)
+        logger.info("Dispatching %s to worker %s", container_name, address)
+
+        # Gzip runs in a thread, a large workspace must not block the event loop
+        archive = await asyncio.to_thread(pack_workspace, file_path)
+        self._in_flight[address] += 1
+        try:
+            reader, writer = await self._connect(address)
+            try:
+                await send_message(
+                    writer,
+                    self._message(
+                        {
+                            "op": "run",
+                            "container_name": container_name,
+                            "image_name": image_name,
+                        }
+                    ),
+                )
+                await send_stream(writer, archive)
+
+                while True:
+                    message = await receive_message(reader)
+                    if message is None:
+                        raise ProtocolError(f"Worker {address} closed the connection")
+                    event = message.pop("event", None)
+                    if event == "log":
+                        if on_output is not None:
+                            result = on_output(message["stream"], message["data"])
+                            if inspect.isawaitable(result):
+                                await result
+                    elif event == "result":
+                        self.placements[container_name] = address
+                        return ComposeResult(**message)
+                    else:
+                        raise ProtocolError(message.get("details", "Unknown worker error"))
+            finally:
+                writer.close()
+        finally:
+            archive.close()
+            self._in_flight[address] -= 1
+
+    async def test(
+        self, container_name: str, test_path: str, runtime: str, generated: bool = True
+    ) -> TestReport:
+        """Run the project's tests, from `test_path`, on the worker that ran the container."""
+        address = self.placements.get(container_name)
+        if address is None:
+            raise NoWorkerAvailable(f"Container '{container_name}' was not dispatched to any worker")
+
+        archive = await asyncio.to_thread(pack_workspace, test_path)
+        self._in_flight[address] += 1
+        try:
+            reader, writer = await self._connect(address)
+            try:
+                await send_message(
+                    writer,
+                    self._message(
+                        {
+                            "op": "test",
+                            "container_name": container_name,
+                            "runtime": runtime,
+                            "generated": generated,
+                        }
+                    ),
+                )
+                await send_stream(writer, archive)
+                response = await receive_message(reader)
+            finally:
+                writer.close()
+        finally:
+            archive.close()
+            self._in_flight[address] -= 1
+        if response is None:
+            raise ProtocolError(f"Worker {address} closed the connection")
+        if response.pop("event", None) != "result":
+            raise ProtocolError(response.get("details", "Unknown worker error"))
+        return TestReport.from_dict(response)
+
+    async def logs(self, container_name: str, tail: int = 20) -> tuple:
+        """Returns (returncode, stdout, stderr) of `docker logs` on the worker running the container."""
+        address = self.placements.get(container_name)
+        if address is None:
+            return 1, "", f"Container '{container_name}' was not dispatched to any worker."
+        response = await self._request(
+            address, {"op": "logs", "container_name": container_name, "tail": tail}
+        )
+        return response["returncode"], response["stdout"], response["stderr"]
+
+    async def down(self, container_name: str) -> int:
+        address = self.placements.pop(container_name, None)
+        if address is None:
+            return 0
+        response = await self._request(
+            address, {"op": "down", "container_name": container_name}
+        )
+        return response["returncode"]
+
+    async def release_session(self, session_id: Optional[str]):
+        """Stop every container the session started on the workers."""
+        for container_name in self.sessions.pop(session_id, set()):
+            try:
+                await self.down(container_name)
+            except (OSError, asyncio.TimeoutError, ProtocolError) as e:
+                logger.warning("Failed to stop %s on its worker: %s", container_name, e)
+
+
+_worker_pool: Optional[WorkerPool] = None
+
+
+def get_worker_pool() -> Optional[WorkerPool]:
+    """
+    Worker pool from config.ini, or None when builds should run on this machine.
+
+    [EXECUTION]
+    workers = 127.0.0.1:7001, 127.0.0.1:7002
+    worker_token =
+    """
+    global _worker_pool
+    if _worker_pool is None:
+        addresses = get_list_setting("EXECUTION", "workers")
+        if not addresses:
+            return None
+        _worker_pool = WorkerPool(
+            addresses,
+            get_float_setting("EXECUTION", "connect_timeout", 5.0),
+            get_setting("EXECUTION", "worker_token") or None,
+        )
+    return _worker_pool
@@ -0,0 +1,233 @@
+import abc
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Container events the watcher subscribes to
+WATCHED_ACTIONS = ("start", "die", "oom", "restart", "health_status")
+
+
+@dataclass
+class ContainerEvent:
+    """
+    State change of a container, from the Docker events stream.
+
+    Attributes:
+        action: "start", "die", "oom", "restart" or "health_status".
+        container: Container name.
+        container_id: Full container id.
+        exit_code: Exit code of "die" events.
+        status: Health of "health_status" events ("healthy", "unhealthy", ...).
+    """
+
+    action: str
+    container: str
+    container_id: str = ""
+    exit_code: Optional[int] = None
+    status: Optional[str] = None
+    attributes: dict = field(default_factory=dict)
+    time: float = field(default_factory=time.time)
+
+    @classmethod
+    def from_docker(cls, raw: dict) -> "ContainerEvent":
+        actor = raw.get("Actor") or {}
+        attributes = actor.get("Attributes") or {}
+        action, _, status = (raw.get("Action") or raw.get("status") or "").partition(":")
+        exit_code = attributes.get("exitCode")
+        return cls(
+            action=action.strip(),
+            container=attributes.get("name", ""),
+            container_id=actor.get("ID") or raw.get("id", ""),
+            exit_code=int(exit_code) if exit_code not in (None, "") else None,
+            status=status.strip() or None,
+            attributes=attributes,
+            time=raw.get("time") or time.time(),
+        )
+
+
+class EventSource(abc.ABC):
+    """Stream of raw Docker event dicts."""
+
+    @abc.abstractmethod
+    def events(self) -> AsyncIterator[dict]:
+        """Async iterator of the events, from the moment it is opened."""
+
+
+class DockerCliEventSource(EventSource):
+    """`docker events` of the local daemon, from the moment the stream was opened."""
+
+    async def events(self) -> AsyncIterator[dict]:
+        command = [
+            "docker", "events",
+            "--format", "{{json .}}",
+            "--filter", "type=container",
+            # A second back, so events between the watch and the subscription are kept
+            "--since", str(int(time.time()) - 1),
+        ]
+        for action in WATCHED_ACTIONS:
+            command += ["--filter", f"event={action}"]
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        try:
+            async for line in process.stdout:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.debug("Skipping unreadable docker event: %r", line[:200])
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+
+class StubEventSource(EventSource):
+    """Events pushed by the caller, for running without a Docker daemon."""
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def push(self, action: str, container: str, container_id: str = "", **attributes):
+        self._queue.put_nowait(
+            {
+                "Type": "container",
+                "Action": action,
+                "Actor": {
+                    "ID": container_id,
+                    "Attributes": {
+                        "name": container,
+                        **{key: str(value) for key, value in attributes.items()},
+                    },
+                },
+                "time": int(time.time()),
+            }
+        )
+
+    async def events(self) -> AsyncIterator[dict]:
+        while True:
+            yield await self._queue.get()
+
+
+class ContainerWatch:
+    """Events of one container, queued from the moment the watch was registered."""
+
+    def __init__(self, watcher: "DockerEventWatcher", container: str):
+        self.watcher = watcher
+        self.container = container
+        self.history: List[ContainerEvent] = []
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def _put(self, event: ContainerEvent):
+        self.history.append(event)
+        self._queue.put_nowait(event)
+
+    async def wait(
+        self,
+        actions: Iterable[str],
+        timeout: Optional[float] = None,
+        container_id: Optional[str] = None,
+        status: Optional[str] = None,
+    ) -> Optional[ContainerEvent]:
+        """
+        Next event with one of `actions` (of `container_id` / with `status` when given).
+        Returns None when `timeout` passes first.
+        """
+        actions: Set[str] = set(actions)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            try:
+                event = await asyncio.wait_for(self._queue.get(), remaining)
+            except asyncio.TimeoutError:
+                return None
+            if event.action not in actions:
+                continue
+            if container_id and not event.container_id.startswith(container_id):
+                continue
+            if status and event.status != status:
+                continue
+            return event
+
+    def close(self):
+        self.watcher._unwatch(self)
+
+
+class DockerEventWatcher:
+    """
+    One background task per process reading the Docker events stream and handing
+    each container's events to the runs watching it, so they can await an exit or
+    a health change instead of polling.
+    """
+
+    def __init__(self, source: Optional[EventSource] = None, reconnect_delay: float = 1.0):
+        self.source = source or DockerCliEventSource()
+        self.reconnect_delay = reconnect_delay
+        self._watches: Dict[str, List[ContainerWatch]] = defaultdict(list)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the stream in the running event loop (again, if it stopped)."""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def watch(self, container: str) -> ContainerWatch:
+        """Register a watch; register it before starting the container to miss nothing."""
+        self.start()
+        watch = ContainerWatch(self, container)
+        self._watches[container].append(watch)
+        return watch
+
+    def _unwatch(self, watch: ContainerWatch):
+        watches = self._watches.get(watch.container, [])
+        if watch in watches:
+            watches.remove(watch)
+        if not watches:
+            self._watches.pop(watch.container, None)
+
+    def dispatch(self, event: ContainerEvent):
+        for watch in list(self._watches.get(event.container, [])):
+            watch._put(event)
+
+    async def _run(self):
+        while True:
+            try:
+                async for raw in self.source.events():
+                    event = ContainerEvent.from_docker(raw)
+                    if event.container:
+                        self.dispatch(event)
+                logger.warning("Docker events stream ended, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Docker events stream failed: %s", e)
+            await asyncio.sleep(self.reconnect_delay)
+
+
+_event_watcher: Optional[DockerEventWatcher] = None
+
+
+def get_event_watcher() -> DockerEventWatcher:
+    global _event_watcher
+    if _event_watcher is None:
+        _event_watcher = DockerEventWatcher()
+    return _event_watcher
@@ -0,0 +1,123 @@
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# own imports
+from executor.build_context import MANIFESTS, copy_destination, pack_files
+from executor.compose import CommandTimeout, run_command
+from utils.settings import get_int_setting
+
+logger = logging.getLogger(__name__)
+
+# Files only a rebuild picks up
+REBUILD_FILES = set(MANIFESTS) | {"Dockerfile", "compose.yaml", ".dockerignore"}
+# Files the program reads as they are; others (compiled languages, ...) need a rebuild
+RELOADABLE_EXTENSIONS = {
+    ".py", ".js", ".mjs", ".cjs", ".json", ".html", ".htm", ".css", ".svg",
+    ".rb", ".php", ".sh", ".txt", ".md", ".yaml", ".yml", ".toml", ".ini", ".env",
+}
+
+
+@dataclass
+class SyncResult:
+    """
+    Outcome of pushing changed files into a container.
+
+    Attributes:
+        reloaded: The files were copied and the container restarted. When False,
+            the project has to be rebuilt, for the given `reason`.
+        synced: Files copied into the container.
+        restarted_at: Unix time of the restart; the container's logs from then on
+            are those of the new code.
+        seconds: Time of the copy and the restart.
+    """
+
+    reloaded: bool
+    synced: List[str] = field(default_factory=list)
+    reason: str = ""
+    restarted_at: Optional[float] = None
+    seconds: float = 0.0
+
+
+def rebuild_reason(filenames: List[str], dockerfile: str) -> Optional[str]:
+    """Why copying `filenames` into the running container is not enough, None if it is."""
+    if not filenames:
+        return "no changed files"
+    for filename in filenames:
+        name = os.path.basename(filename)
+        if name in REBUILD_FILES:
+            return f"{filename} changed"
+        if os.path.splitext(name)[1].lower() not in RELOADABLE_EXTENSIONS:
+            return f"{filename} has to be built"
+    if copy_destination(dockerfile) is None:
+        return "the Dockerfile does not copy the sources as they are"
+    return None
+
+
+async def sync_into_container(
+    file_path: str, container_name: str, filenames: List[str], dockerfile: str
+) -> SyncResult:
+    """
+    Copy the changed files into the container (`docker cp` of a tar on stdin, to the
+    directory the Dockerfile copies the sources to) and restart it, so the program
+    runs the new code without a rebuild. Manifests, Docker files and sources that
+    are built in the image are not synced: the caller rebuilds instead.
+
+    [HOT_RELOAD]
+    enabled = true
+    stop_timeout = 1
+    timeout = 30
+    """
+    reason = rebuild_reason(filenames, dockerfile)
+    if reason:
+        return SyncResult(reloaded=False, reason=reason)
+    # docker cp adds files, a file the container must no longer have needs a rebuild
+    removed = [f for f in filenames if not os.path.isfile(os.path.join(file_path, f))]
+    if removed:
+        return SyncResult(reloaded=False, reason=f"{removed[0]} was removed")
+
+    started_at = time.monotonic()
+    destination = copy_destination(dockerfile)
+    timeout = get_int_setting("HOT_RELOAD", "timeout", 30)
+    archive, stats = pack_files(file_path, filenames)
+    try:
+        with archive:
+            returncode, _, stderr = await run_command(
+                ["docker", "cp", "-", f"{container_name}:{destination}"],
+                stdin=archive,
+                timeout=timeout,
+            )
+        if returncode != 0:
+            return SyncResult(reloaded=False, reason=f"docker cp failed: {stderr.strip()}")
+
+        restarted_at = time.time()
+        returncode, _, stderr = await run_command(
+            [
+                "docker", "restart",
+                "-t", str(get_int_setting("HOT_RELOAD", "stop_timeout", 1)),
+                container_name,
+            ],
+            timeout=timeout,
+        )
+    except CommandTimeout as e:
+        return SyncResult(reloaded=False, reason=str(e))
+    if returncode != 0:
+        return SyncResult(reloaded=False, reason=f"docker restart failed: {stderr.strip()}")
+
+    result = SyncResult(
+        reloaded=True,
+        synced=sorted(set(filenames)),
+        restarted_at=restarted_at,
+        seconds=time.monotonic() - started_at,
+    )
+    logger.info(
+        "Synced %d files (%d bytes) into %s:%s and restarted it in %.2fs",
+        stats.context_files,
+        stats.context_bytes,
+        container_name,
+        destination,
+        result.seconds,
+    )
+    return result
@@ -0,0 +1,324 @@
+import logging
+import os
+import re
+import subprocess
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no startup lock, only the age of the resources is checked
+    fcntl = None
+
+# own imports
+from executor.compose import PROJECT_LABEL, compose_command, run_command
+from utils.settings import get_float_setting, get_int_setting, get_setting
+
+logger = logging.getLogger(__name__)
+
+# Every compose project we start is named with this prefix, docker labels its
+# containers, networks and built images with it (PROJECT_LABEL) so orphans can
+# be found later.
+PROJECT_PREFIX = "codegen-"
+
+
+def project_name_for(session_id: Optional[str]) -> str:
+    slug = re.sub(r"[^a-z0-9_-]+", "-", (session_id or "local").lower()).strip("-")
+    return f"{PROJECT_PREFIX}{slug[:40] or 'local'}"
+
+
+@dataclass
+class RunResources:
+    """Docker resources created for one session."""
+
+    project_name: str
+    file_path: str
+    containers: Set[str] = field(default_factory=set)
+    networks: Set[str] = field(default_factory=set)
+    images: Set[str] = field(default_factory=set)
+    last_used: float = field(default_factory=time.time)
+
+
+def _lines(output: str) -> Set[str]:
+    return {line.strip() for line in output.splitlines() if line.strip()}
+
+
+def _created_at(value: str) -> Optional[float]:
+    """Timestamp of a docker `CreatedAt` ("2024-07-01 12:34:56.123 +0200 CEST")."""
+    parts = value.split()
+    if len(parts) < 3:
+        return None
+    try:
+        created = datetime.strptime(
+            f"{parts[0]} {parts[1].split('.')[0]} {parts[2]}", "%Y-%m-%d %H:%M:%S %z"
+        )
+    except ValueError:
+        return None
+    return created.timestamp()
+
+
+def _labeled_resources(list_command: List[str]) -> List[Tuple[str, str, str]]:
+    """
+    (id, CreatedAt, compose project) of the resources `list_command` lists with the
+    project label. `docker images` can not format labels, the projects of images
+    come from `docker image inspect`.
+    """
+    label_filter = ["--filter", f"label={PROJECT_LABEL}"]
+    if list_command == ["docker", "images"]:
+        listing = subprocess.run(
+            list_command + label_filter + ["--format", "{{.ID}}\t{{.CreatedAt}}"],
+            capture_output=True,
+            text=True,
+        )
+        rows = [line.split("\t") for line in listing.stdout.splitlines() if line.strip()]
+        rows = [row for row in rows if len(row) == 2]
+        if not rows:
+            return []
+        inspect = subprocess.run(
+            ["docker", "image", "inspect", "-f", '{{index .Config.Labels "' + PROJECT_LABEL + '"}}']
+            + [row[0] for row in rows],
+            capture_output=True,
+            text=True,
+        )
+        projects = inspect.stdout.splitlines()
+        if inspect.returncode != 0 or len(projects) != len(rows):
+            return []
+        return [
+            (image, created_at, project)
+            for (image, created_at), project in zip(rows, projects)
+        ]
+
+    line_format = "{{.ID}}\t{{.CreatedAt}}\t{{.Label \"" + PROJECT_LABEL + "\"}}"
+    listing = subprocess.run(
+        list_command + label_filter + ["--format", line_format],
+        capture_output=True,
+        text=True,
+    )
+    rows = [tuple(line.split("\t")) for line in listing.stdout.splitlines()]
+    return [row for row in rows if len(row) == 3]
+
+
+class LifecycleManager:
+    """
+    Tracks the containers, networks and images created for each session and
+    guarantees they are removed.
+
+    - Containers and networks that can be started again stay up when a run ends, so
+      the next run of the session (a follow-up edit) hot reloads into them or only
+      recreates what changed. They are torn down when the session ends, or once they
+      have been idle for `idle_timeout` seconds; broken ones when the run ends.
+    - Images are kept for the session (they are the build cache) and removed when the
+      session ends.
+    - Projects left behind by a previous process are collected at startup, by the
+      first process only (see `collect_orphans`).
+    """
+
+    def __init__(
+        self,
+        idle_timeout: float = 900,
+        orphan_lock_path: Optional[str] = None,
+        orphan_min_age: float = 3600,
+    ):
+        self.idle_timeout = idle_timeout
+        self.orphan_lock_path = orphan_lock_path
+        self.orphan_min_age = orphan_min_age
+        self._sessions: Dict[str, RunResources] = {}
+        self._idle: "OrderedDict[str, float]" = OrderedDict()  # session -> run end time
+        self._orphan_lock = None
+
+    def project_name(self, session_id: Optional[str]) -> str:
+        return project_name_for(session_id)
+
+    def acquire(self, session_id: str):
+        """
+        Mark the session as running: its kept containers are no longer idle, so they
+        are not torn down while the run uses them. Containers are never torn down
+        between the iterations of a run, compose `up` recreates only what changed.
+        """
+        self._idle.pop(session_id, None)
+
+    async def track(
+        self, session_id: str, file_path: str, images: Iterable[str] = ()
+    ) -> RunResources:
+        """
+        Record everything the session's compose project currently owns, and the
+        `images` built for it outside of compose (see ComposeResult.images).
+        """
+        project = self.project_name(session_id)
+        resources = self._sessions.setdefault(
+            session_id, RunResources(project, file_path)
+        )
+        resources.file_path = file_path
+        resources.last_used = time.time()
+
+        label = f"label={PROJECT_LABEL}={project}"
+        _, containers, _ = await run_command(
+            ["docker", "ps", "-a", "-q", "--filter", label]
+        )
+        _, networks, _ = await run_command(
+            ["docker", "network", "ls", "-q", "--filter", label]
+        )
+        _, images_by_label, _ = await run_command(
+            ["docker", "images", "-q", "--filter", label]
+        )
+        resources.containers |= _lines(containers)
+        resources.networks |= _lines(networks)
+        resources.images |= _lines(images_by_label)
+        resources.images.update(image for image in images if image)
+        return resources
+
+    async def _remove_containers(self, resources: RunResources):
+        await run_command(
+            compose_command(resources.file_path, resources.project_name)
+            + ["down", "--volumes", "--remove-orphans", "--timeout", "5"]
+        )
+        # Anything compose did not know about (e.g. renamed services) is removed by id
+        if resources.containers:
+            await run_command(["docker", "rm", "-f", "-v", *resources.containers])
+        if resources.networks:
+            await run_command(["docker", "network", "rm", *resources.networks])
+        resources.containers.clear()
+        resources.networks.clear()
+
+    async def _is_reusable(self, resources: RunResources) -> bool:
+        """Containers that `up` can start again as they are (not dead or crash looping)."""
+        if not resources.containers:
+            return False
+        returncode, stdout, _ = await run_command(
+            ["docker", "inspect", "-f", "{{.State.Status}}", *resources.containers]
+        )
+        return returncode == 0 and _lines(stdout) <= {"running", "exited", "created"}
+
+    async def release_run(self, session_id: str):
+        """
+        Called when a run ends, whatever the outcome. Reusable containers are kept for
+        the next run of the session, broken ones are torn down. Containers of other
+        sessions that have been idle for too long are torn down too.
+        """
+        await self.release_idle()
+        resources = self._sessions.get(session_id)
+        if resources is None:
+            return
+
+        if self.idle_timeout > 0 and await self._is_reusable(resources):
+            self._idle[session_id] = time.time()
+            self._idle.move_to_end(session_id)
+            return
+
+        await self._remove_containers(resources)
+
+    async def release_idle(self, now: Optional[float] = None):
+        """Tear down the containers of sessions idle for more than `idle_timeout` seconds."""
+        now = time.time() if now is None else now
+        # Oldest first, so the loop stops at the first session still in use
+        while self._idle:
+            session_id, released_at = next(iter(self._idle.items()))
+            if now - released_at < self.idle_timeout:
+                break
+            del self._idle[session_id]
+            logger.info("Tearing down the idle containers of %s", session_id)
+            await self._remove_containers(self._sessions[session_id])
+
+    async def end_session(self, session_id: str):
+        """Remove everything the session created, including its images."""
+        self._idle.pop(session_id, None)
+        resources = self._sessions.pop(session_id, None)
+        if resources is None:
+            return
+        await self._remove_containers(resources)
+        if resources.images:
+            await run_command(["docker", "image", "rm", "-f", *resources.images])
+
+    async def shutdown(self):
+        for session_id in list(self._sessions):
+            await self.end_session(session_id)
+
+    def _lock_orphan_collection(self) -> bool:
+        """
+        Take the startup lock, held for the life of the process. Only the first of
+        several processes sharing the Docker daemon gets it; the others must not
+        collect, the projects of the running processes look like orphans to them.
+        """
+        if self._orphan_lock is not None:
+            return True
+        if not self.orphan_lock_path or fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.orphan_lock_path)), exist_ok=True)
+        lock = open(self.orphan_lock_path, "a")
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        self._orphan_lock = lock
+        return True
+
+    def collect_orphans(self) -> bool:
+        """
+        Remove containers, networks and images of codegen projects that no live
+        session owns (left behind by a crash or restart). Synchronous, run at startup.
+
+        Only the process holding the startup lock collects, and only resources older
+        than `orphan_min_age` seconds are removed, so a worker restarted next to
+        running workers does not remove their live projects. Returns False when
+        another process collects.
+        """
+        if not self._lock_orphan_collection():
+            logger.info("Another process collects orphaned Docker resources")
+            return False
+
+        owned = {r.project_name for r in self._sessions.values()}
+        targets = [
+            (["docker", "ps", "-a"], ["docker", "rm", "-f", "-v"]),
+            (["docker", "network", "ls"], ["docker", "network", "rm"]),
+            (["docker", "images"], ["docker", "image", "rm", "-f"]),
+        ]
+        now = time.time()
+        for list_command, remove_command in targets:
+            try:
+                resources = _labeled_resources(list_command)
+            except OSError as e:
+                logger.warning("Skipping orphan collection, docker is not available: %s", e)
+                return True
+
+            orphans = []
+            for resource_id, created_at, project in resources:
+                created = _created_at(created_at)
+                if (
+                    project.startswith(PROJECT_PREFIX)
+                    and project not in owned
+                    and created is not None
+                    and now - created >= self.orphan_min_age
+                ):
+                    orphans.append(resource_id)
+            if orphans:
+                logger.info(
+                    "Removing %d orphaned resources: %s", len(orphans), " ".join(list_command)
+                )
+                subprocess.run(remove_command + orphans, capture_output=True, text=True)
+        return True
+
+
+_lifecycle_manager: Optional[LifecycleManager] = None
+
+
+def get_lifecycle_manager() -> LifecycleManager:
+    """
+    Process wide lifecycle manager.
+
+    [EXECUTION]
+    idle_timeout = 900
+    orphan_lock = generated/orphans.lock
+    orphan_min_age = 3600
+    """
+    global _lifecycle_manager
+    if _lifecycle_manager is None:
+        _lifecycle_manager = LifecycleManager(
+            get_float_setting("EXECUTION", "idle_timeout", 900),
+            get_setting("EXECUTION", "orphan_lock", os.path.join("generated", "orphans.lock")),
+            get_int_setting("EXECUTION", "orphan_min_age", 3600),
+        )
+    return _lifecycle_manager
@@ -0,0 +1,114 @@
+import copy
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import yaml
+
+# own imports
+from executor.build_context import read_compose_services
+from utils.settings import get_float_setting, get_int_setting, get_setting
+
+
+@dataclass
+class ExecutionLimits:
+    """
+    Per-run limits enforced by the executor, whatever the generated compose.yaml asks for.
+
+    Attributes:
+        cpus: CPU quota per service (number of CPUs).
+        memory: Memory limit per service (docker size, e.g. "512m"). Swap is disabled.
+        pids: Maximum number of processes per service.
+        build_timeout: Wall-clock seconds allowed for building the images.
+        run_timeout: Wall-clock seconds the program may run before it is killed, unless
+            it is a server (it listens on a port), which is left running.
+        startup_window: Seconds between checks whether a running program is a server.
+        log_max_bytes: Maximum bytes of output kept per run (also the json-file log size).
+    """
+
+    cpus: float = 1.0
+    memory: str = "512m"
+    pids: int = 256
+    build_timeout: float = 600.0
+    run_timeout: float = 60.0
+    startup_window: float = 5.0
+    log_max_bytes: int = 1024 * 1024
+
+    @classmethod
+    def from_settings(cls) -> "ExecutionLimits":
+        """
+        [LIMITS]
+        cpus = 1.0
+        memory = 512m
+        pids = 256
+        build_timeout = 600
+        run_timeout = 60
+        startup_window = 5
+        log_max_bytes = 1048576
+        """
+        defaults = cls()
+        return cls(
+            cpus=get_float_setting("LIMITS", "cpus", defaults.cpus),
+            memory=get_setting("LIMITS", "memory", defaults.memory),
+            pids=get_int_setting("LIMITS", "pids", defaults.pids),
+            build_timeout=get_float_setting(
+                "LIMITS", "build_timeout", defaults.build_timeout
+            ),
+            run_timeout=get_float_setting("LIMITS", "run_timeout", defaults.run_timeout),
+            startup_window=get_float_setting(
+                "LIMITS", "startup_window", defaults.startup_window
+            ),
+            log_max_bytes=get_int_setting(
+                "LIMITS", "log_max_bytes", defaults.log_max_bytes
+            ),
+        )
+
+
+def compose_services(compose_file_path: str) -> list:
+    """Service names defined in a compose file (ComposeFileError when it is broken)."""
+    return list(read_compose_services(compose_file_path))
+
+
+def write_limits_override(
+    compose_file_path: str, limits: ExecutionLimits, images: Optional[Dict[str, str]] = None
+) -> str:
+    """
+    Write a compose override file applying `limits` to every service and return its path.
+    The override is passed after the project's compose.yaml, so its values win.
+    `images` sets the image of services built outside of compose.
+    """
+    service_limits = {
+        "cpus": limits.cpus,
+        "mem_limit": limits.memory,
+        "memswap_limit": limits.memory,
+        "pids_limit": limits.pids,
+        # Restart loops of a crashing program would never end
+        "restart": "no",
+        "deploy": {
+            "resources": {
+                "limits": {
+                    "cpus": str(limits.cpus),
+                    "memory": limits.memory,
+                    "pids": limits.pids,
+                }
+            }
+        },
+        "logging": {
+            "driver": "json-file",
+            "options": {"max-size": str(limits.log_max_bytes), "max-file": "1"},
+        },
+    }
+    override = {
+        "services": {
+            name: copy.deepcopy(service_limits)
+            for name in compose_services(compose_file_path)
+        }
+    }
+    for name, image in (images or {}).items():
+        override["services"][name]["image"] = image
+
+    fd, override_path = tempfile.mkstemp(prefix="limits-", suffix=".override.yaml")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        yaml.safe_dump(override, f, sort_keys=False)
+    return override_path
@@ -0,0 +1,101 @@
+import asyncio
+import io
+import json
+import os
+import struct
+import tarfile
+import tempfile
+from typing import AsyncIterator, Optional
+
+# Wire format between the dispatcher and execution workers:
+# every frame is a 4-byte big-endian length followed by the payload.
+# Control messages are JSON frames, workspace tarballs are sent as raw
+# chunk frames terminated by an empty frame.
+HEADER = struct.Struct(">I")
+CHUNK_SIZE = 64 * 1024
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# Directories never shipped to a worker, they are rebuilt inside the image
+EXCLUDED_DIRS = {"node_modules", "__pycache__", ".git", ".venv", "venv"}
+
+
+class ProtocolError(Exception):
+    pass
+
+
+async def write_frame(writer: asyncio.StreamWriter, payload: bytes):
+    writer.write(HEADER.pack(len(payload)) + payload)
+    await writer.drain()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Read one frame, returns None when the peer closed the connection."""
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (size,) = HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Frame of {size} bytes exceeds the limit")
+    return await reader.readexactly(size)
+
+
+async def send_message(writer: asyncio.StreamWriter, message: dict):
+    await write_frame(writer, json.dumps(message).encode("utf-8"))
+
+
+async def receive_message(reader: asyncio.StreamReader) -> Optional[dict]:
+    frame = await read_frame(reader)
+    if frame is None:
+        return None
+    return json.loads(frame.decode("utf-8"))
+
+
+def pack_workspace(directory: str) -> tempfile.SpooledTemporaryFile:
+    """
+    Pack a workspace directory into a gzip tarball.
+    Small workspaces stay in memory, bigger ones spill to disk.
+    """
+    archive = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(d for d in dirs if d not in EXCLUDED_DIRS)
+            for name in sorted(files):
+                full_path = os.path.join(root, name)
+                tar.add(full_path, arcname=os.path.relpath(full_path, directory))
+    archive.seek(0)
+    return archive
+
+
+async def send_stream(writer: asyncio.StreamWriter, fileobj: io.IOBase):
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        await write_frame(writer, chunk)
+    await write_frame(writer, b"")
+
+
+async def receive_stream(reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await read_frame(reader)
+        if chunk is None:
+            raise ProtocolError("Connection closed in the middle of a stream")
+        if not chunk:
+            return
+        yield chunk
+
+
+def unpack_workspace(fileobj: io.IOBase, directory: str):
+    """Extract a workspace tarball, refusing members that would escape the directory."""
+    root = os.path.realpath(directory)
+    with tarfile.open(fileobj=fileobj, mode="r:gz") as tar:
+        members = []
+        for member in tar.getmembers():
+            target = os.path.realpath(os.path.join(root, member.name))
+            if os.path.commonpath([root, target]) != root:
+                raise ProtocolError(f"Refusing to extract '{member.name}'")
+            if not (member.isfile() or member.isdir()):
+                raise ProtocolError(f"Refusing to extract special file '{member.name}'")
+            members.append(member)
+        tar.extractall(root, members=members)
@@ -0,0 +1,200 @@
+import errno
+import json
+import logging
+import os
+import shutil
+import stat
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no reflinks, files are copied
+    fcntl = None
+
+# own imports
+from utils.artifacts import file_digest
+from utils.settings import get_int_setting, get_list_setting
+
+logger = logging.getLogger(__name__)
+
+# Directories rebuilt from the dependency manifests, never snapshotted
+DEFAULT_EXCLUDES = "node_modules, __pycache__, .git, .venv, venv, .pytest_cache"
+
+# ioctl(FICLONE): copy-on-write clone on btrfs / xfs / overlayfs with reflink support
+FICLONE = 0x40049409
+
+
+def clone_file(source: str, target: str):
+    """Copy a file, sharing its blocks with the source when the filesystem supports reflinks."""
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY):
+                    raise
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+class SnapshotStore:
+    """
+    Copy-on-write snapshots of a workspace.
+
+    File contents live once in a content-addressed blob store (`blobs/ab/abcd...`),
+    each snapshot is a manifest of path -> blob. Taking a snapshot only hashes files
+    whose size or mtime changed and stores blobs it has not seen before, so it is
+    cheap in time and disk. Excluded directories (node_modules, ...) are skipped.
+
+    Blobs are read-only: a restore into the workspace copies (or reflinks) them,
+    because the agents rewrite workspace files in place. Snapshots are not mounted
+    into containers: the executor runs the workspace, so a snapshot runs once it is
+    restored and its files are synced into the container or rebuilt.
+    """
+
+    def __init__(
+        self, directory: str, max_snapshots: int = 30, excludes: Optional[List[str]] = None
+    ):
+        self.directory = directory
+        self.blob_path = os.path.join(directory, "blobs")
+        self.manifest_path = os.path.join(directory, "manifests")
+        self.max_snapshots = max_snapshots
+        if excludes is None:
+            excludes = get_list_setting("SNAPSHOTS", "exclude", DEFAULT_EXCLUDES)
+        self.excludes = set(excludes)
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+        self._manifests: "OrderedDict[str, Dict[str, list]]" = OrderedDict()
+        self._lock = threading.Lock()
+        for path in (self.blob_path, self.manifest_path):
+            os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        manifests = sorted(
+            (entry for entry in os.scandir(self.manifest_path) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in manifests:
+            try:
+                with open(entry.path, encoding="utf-8") as f:
+                    self._manifests[entry.name[:-5]] = json.load(f)
+            except ValueError as e:
+                logger.warning("Skipping broken snapshot manifest %s: %s", entry.name, e)
+
+    def _blob(self, digest: str) -> str:
+        return os.path.join(self.blob_path, digest[:2], digest)
+
+    def _files(self, workspace: str):
+        for root, dirs, files in os.walk(workspace):
+            dirs[:] = [d for d in dirs if d not in self.excludes]
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.isfile(path) and not os.path.islink(path):
+                    yield os.path.relpath(path, workspace), path
+
+    def _hash(self, path: str, info: os.stat_result) -> str:
+        cached = self._hashes.get(path)
+        if cached and cached[:2] == (info.st_size, info.st_mtime_ns):
+            return cached[2]
+        digest = file_digest(path)
+        self._hashes[path] = (info.st_size, info.st_mtime_ns, digest)
+        return digest
+
+    def take(self, workspace: str, snapshot_id: str) -> Dict[str, list]:
+        """Snapshot the workspace. Returns the manifest {path: [blob, mode]}."""
+        with self._lock:
+            manifest = {}
+            for relative_path, path in self._files(workspace):
+                info = os.stat(path)
+                digest = self._hash(path, info)
+                blob = self._blob(digest)
+                if not os.path.exists(blob):
+                    os.makedirs(os.path.dirname(blob), exist_ok=True)
+                    clone_file(path, blob + ".tmp")
+                    os.chmod(blob + ".tmp", 0o444)
+                    os.replace(blob + ".tmp", blob)
+                manifest[relative_path] = [digest, stat.S_IMODE(info.st_mode)]
+
+            manifest_file = os.path.join(self.manifest_path, f"{snapshot_id}.json")
+            with open(manifest_file, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            self._manifests.pop(snapshot_id, None)
+            self._manifests[snapshot_id] = manifest
+            self._evict()
+        logger.info("Snapshot %s: %d files", snapshot_id, len(manifest))
+        return manifest
+
+    def manifest(self, snapshot_id: str) -> Dict[str, list]:
+        return self._manifests[snapshot_id]
+
+    def restore(self, snapshot_id: str, workspace: str) -> List[str]:
+        """
+        Make the workspace's files those of the snapshot (excluded directories are kept).
+        Returns the files it rewrote or removed, which a running container does not have.
+        """
+        changed = []
+        with self._lock:
+            manifest = self._manifests[snapshot_id]
+            for relative_path, path in list(self._files(workspace)):
+                if relative_path not in manifest:
+                    os.remove(path)
+                    changed.append(relative_path)
+            for relative_path, (digest, mode) in manifest.items():
+                path = os.path.join(workspace, relative_path)
+                info = os.stat(path) if os.path.exists(path) else None
+                if info and self._hash(path, info) == digest:
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if info:
+                    os.remove(path)
+                clone_file(self._blob(digest), path)
+                os.chmod(path, mode)
+                changed.append(relative_path)
+        logger.info(
+            "Restored snapshot %s into %s: %d files changed", snapshot_id, workspace, len(changed)
+        )
+        return sorted(changed)
+
+    def _evict(self):
+        if len(self._manifests) <= self.max_snapshots:
+            return
+        while len(self._manifests) > self.max_snapshots:
+            snapshot_id, _ = self._manifests.popitem(last=False)
+            os.remove(os.path.join(self.manifest_path, f"{snapshot_id}.json"))
+        # Blobs no snapshot refers to any more
+        referenced = {
+            digest
+            for manifest in self._manifests.values()
+            for digest, _ in manifest.values()
+        }
+        for prefix in os.scandir(self.blob_path):
+            for blob in os.scandir(prefix.path):
+                if blob.name not in referenced:
+                    os.remove(blob.path)
+
+
+_snapshot_stores: Dict[str, SnapshotStore] = {}
+
+
+def get_snapshot_store(workspace: str) -> SnapshotStore:
+    """
+    Store of a workspace, kept next to it (generated/src -> generated/snapshots).
+
+    [SNAPSHOTS]
+    max_snapshots = 30
+    exclude = node_modules, __pycache__, .git, .venv, venv, .pytest_cache
+    """
+    directory = os.path.join(os.path.dirname(os.path.abspath(workspace)), "snapshots")
+    if directory not in _snapshot_stores:
+        _snapshot_stores[directory] = SnapshotStore(
+            directory, get_int_setting("SNAPSHOTS", "max_snapshots", 30)
+        )
+    return _snapshot_stores[directory]
+
+
+def forget_snapshot_store(workspace: str):
+    """Drop the store of a workspace that is removed (the session ended)."""
+    directory = os.path.join(os.path.dirname(os.path.abspath(workspace)), "snapshots")
+    _snapshot_stores.pop(directory, None)
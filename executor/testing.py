@@ -0,0 +1,356 @@
+import logging
+import os
+import re
+import shlex
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, asdict, field
+from typing import List, Optional
+
+# own imports
+from executor.build_context import (
+    ComposeFileError,
+    _instructions,
+    _words,
+    read_compose_services,
+)
+from executor.compose import PROJECT_LABEL, CommandTimeout, build_image, run_command
+from executor.limits import ExecutionLimits
+from utils.settings import get_int_setting
+
+logger = logging.getLogger(__name__)
+
+# Folder the generated tests are mounted at, inside the image's working directory
+TEST_DIR_NAME = "tests_generated"
+REPORT_FILE = "report.xml"
+# Test runner layer added to the final stage of Python images: installed at build time,
+# with network, and shared by every project on the same base image
+PYTHON_TEST_RUNNER = (
+    "RUN python -m pip install --no-cache-dir --disable-pip-version-check pytest pytest-xdist"
+)
+
+PYTHON_TEST_FILE = re.compile(r"(^|/)(test_[^/]*|[^/]*_test)\.py$")
+NODE_TEST_FILE = re.compile(r"(^|/)([^/]*\.(test|spec)\.[cm]?js|__tests__/[^/]*\.[cm]?js)$")
+
+
+@dataclass
+class TestFailure:
+    name: str
+    message: str = ""
+    details: str = ""
+
+
+@dataclass
+class TestReport:
+    """
+    Result of running a project's tests.
+
+    Attributes:
+        runner: "pytest" or "node".
+        total / passed: Number of tests run and passed.
+        failures: Failed tests with their messages.
+        duration: Wall-clock seconds of the test phase.
+        output: Tail of the runner output (for errors outside the tests).
+        returncode: Exit code of the test runner.
+        build_failed: The test image could not be built, the tests did not run.
+        image: Test image, to be removed with the session.
+    """
+
+    runner: str
+    total: int = 0
+    passed: int = 0
+    failures: List[TestFailure] = field(default_factory=list)
+    duration: float = 0.0
+    output: str = ""
+    returncode: int = 0
+    build_failed: bool = False
+    image: str = ""
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TestReport":
+        failures = [TestFailure(**failure) for failure in data.get("failures", [])]
+        return cls(**{**data, "failures": failures})
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.failures
+
+    def summary(self) -> str:
+        return (
+            f"{self.runner}: {self.passed}/{self.total} tests passed, "
+            f"{len(self.failures)} failed in {self.duration:.1f}s"
+        )
+
+    def failure_details(self, max_chars: int = 4000) -> str:
+        """Failures formatted for the code fixer."""
+        if not self.failures:
+            return self.output[-max_chars:]
+        parts = []
+        for failure in self.failures:
+            parts.append(f"FAILED {failure.name}: {failure.message}\n{failure.details}".strip())
+        return "\n\n".join(parts)[:max_chars]
+
+
+def detect_test_files(filenames: List[str], runtime: str) -> List[str]:
+    pattern = PYTHON_TEST_FILE if runtime == "python" else NODE_TEST_FILE
+    return [f for f in filenames if pattern.search(f.replace(os.sep, "/"))]
+
+
+def service_build(file_path: str, container_name: str) -> tuple:
+    """Build context and Dockerfile of the compose service running `container_name`."""
+    services = read_compose_services(os.path.join(file_path, "compose.yaml"))
+    build = None
+    for service in services.values():
+        if service.get("container_name") == container_name or len(services) == 1:
+            build = service.get("build")
+            break
+    if isinstance(build, dict):
+        context = build.get("context", ".")
+        return os.path.join(file_path, context), build.get("dockerfile", "Dockerfile")
+    return os.path.join(file_path, build or "."), "Dockerfile"
+
+
+def test_image_name(container_name: str) -> str:
+    return f"{container_name}-tests"
+
+
+def with_test_runner(dockerfile: str, runtime: str) -> str:
+    """The project's Dockerfile with the test runner installed right after the final FROM."""
+    if runtime != "python":
+        # node --test comes with Node.js
+        return dockerfile
+    units = _instructions(dockerfile)
+    stages = [
+        index
+        for index, unit in enumerate(units)
+        if [word.upper() for word in _words(unit)[:1]] == ["FROM"]
+    ]
+    if not stages:
+        return dockerfile
+    units.insert(stages[-1] + 1, [PYTHON_TEST_RUNNER])
+    return "\n".join(line for unit in units for line in unit) + "\n"
+
+
+def _junit_case_failure(case) -> Optional[TestFailure]:
+    for tag in ("failure", "error"):
+        node = case.find(tag)
+        if node is not None:
+            return TestFailure(
+                name=f"{case.get('classname', '')}::{case.get('name', '')}".strip(":"),
+                message=node.get("message", ""),
+                details=(node.text or "")[-1500:],
+            )
+    return None
+
+
+def parse_junit(xml_text: str) -> tuple:
+    """Returns (total, failures) from a JUnit XML report."""
+    root = ET.fromstring(xml_text)
+    total = 0
+    failures = []
+    for case in root.iter("testcase"):
+        total += 1
+        failure = _junit_case_failure(case)
+        if failure:
+            failures.append(failure)
+    return total, failures
+
+
+def parse_junit_file(path: str) -> tuple:
+    """
+    parse_junit of a report file, streamed: every test case is dropped once read,
+    so a report with large captured outputs is never held in memory whole.
+    """
+    total = 0
+    failures = []
+    for _, element in ET.iterparse(path, events=("end",)):
+        if element.tag != "testcase":
+            continue
+        total += 1
+        failure = _junit_case_failure(element)
+        if failure:
+            failures.append(failure)
+        element.clear()
+    return total, failures
+
+
+def parse_tap(output: str) -> tuple:
+    """
+    Returns (total, failures) from TAP output of `node --test`.
+    Top level results are test files, the tests inside them are indented subtests.
+    """
+    total = 0
+    failures = []
+    nested_total = 0
+    nested_failures: List[TestFailure] = []
+    current: Optional[TestFailure] = None
+    for line in output.splitlines():
+        result = re.match(r"^(\s*)(not ok|ok) \d+ - (.*?)(\s+#\s*(SKIP|TODO).*)?$", line)
+        if result:
+            current = TestFailure(name=result.group(3)) if result.group(2) == "not ok" else None
+            if result.group(1):
+                nested_total += 1
+                if current:
+                    nested_failures.append(current)
+                continue
+            # Report the file's own result only when it has no tests of its own
+            if nested_total:
+                total += nested_total
+                failures += nested_failures
+                current = None
+            else:
+                total += 1
+                if current:
+                    failures.append(current)
+            nested_total, nested_failures = 0, []
+            continue
+        if current is not None:
+            stripped = line.strip()
+            if stripped.startswith("error:"):
+                current.message = stripped[len("error:"):].strip().strip("'|")
+            elif stripped and stripped not in ("---", "..."):
+                current.details = (current.details + "\n" + stripped)[-1500:]
+    return total, failures
+
+
+def generated_test_files(test_path: str, runtime: str) -> List[str]:
+    """
+    Source files of the generated tests in `test_path`, as paths relative to the image's
+    working directory. Every one of them is a test, whatever the LLM named it.
+    """
+    extensions = (".py",) if runtime == "python" else (".js", ".mjs", ".cjs")
+    filenames = []
+    for root, _, files in os.walk(test_path):
+        for filename in files:
+            if filename.endswith(extensions):
+                relative = os.path.relpath(os.path.join(root, filename), test_path)
+                filenames.append(f"{TEST_DIR_NAME}/{relative.replace(os.sep, '/')}")
+    return sorted(filenames)
+
+
+def _test_command(
+    runtime: str, workers: int, generated: bool, test_files: Optional[List[str]] = None
+) -> List[str]:
+    if runtime == "python":
+        target = TEST_DIR_NAME if generated else "."
+        script = (
+            f"python -m pytest -q -p no:cacheprovider -n {workers} "
+            f"--junitxml={TEST_DIR_NAME}/{REPORT_FILE} {target}"
+        )
+    else:
+        # node --test runs every test file in its own process, in parallel. A directory
+        # argument is taken as a module to run, so the generated files are listed
+        target = " ".join(shlex.quote(f) for f in test_files or []) if generated else ""
+        script = f"node --test --test-reporter=tap {target}".rstrip()
+    return ["sh", "-c", script]
+
+
+async def run_tests(
+    file_path: str,
+    test_path: str,
+    runtime: str,
+    container_name: str,
+    generated: bool = True,
+    limits: Optional[ExecutionLimits] = None,
+    tracked_files: Optional[List[str]] = None,
+    project_name: Optional[str] = None,
+) -> TestReport:
+    """
+    Rebuild the project image with the test runner and run its tests in a throwaway
+    container, with the generated tests mounted from `test_path`.
+
+    With `tracked_files`, the image is built from a context of those files only (see
+    build_image). The image is labeled with the compose `project_name`.
+    """
+    limits = limits or ExecutionLimits.from_settings()
+    workers = get_int_setting("TESTS", "workers", 2)
+    runner = "pytest" if runtime == "python" else "node"
+    report = TestReport(runner=runner)
+    started_at = time.monotonic()
+
+    os.makedirs(test_path, exist_ok=True)
+    report_path = os.path.join(test_path, REPORT_FILE)
+    if os.path.exists(report_path):
+        os.remove(report_path)
+
+    # Same Dockerfile as the run, so every layer but the changed sources comes from the cache
+    image = test_image_name(container_name)
+    try:
+        context, dockerfile = service_build(file_path, container_name)
+        with open(os.path.join(context, dockerfile), encoding="utf-8") as f:
+            test_dockerfile = with_test_runner(f.read(), runtime)
+    except (ComposeFileError, OSError) as e:
+        report.build_failed = True
+        report.returncode = 1
+        report.output = str(e)
+        return report
+    test_dockerfile_name = f"{dockerfile}.tests"
+    test_dockerfile_path = os.path.join(context, test_dockerfile_name)
+    with open(test_dockerfile_path, "w", encoding="utf-8") as f:
+        f.write(test_dockerfile)
+    try:
+        if tracked_files is not None and os.path.samefile(context, file_path):
+            returncode, _, stderr, _ = await build_image(
+                file_path,
+                tracked_files,
+                image,
+                test_dockerfile_name,
+                timeout=limits.build_timeout,
+                max_bytes=limits.log_max_bytes,
+                project_name=project_name,
+            )
+        else:
+            labels = ["--label", f"{PROJECT_LABEL}={project_name}"] if project_name else []
+            returncode, _, stderr = await run_command(
+                ["docker", "build", "-q", "-t", image, *labels, "-f", test_dockerfile_path, context],
+                timeout=limits.build_timeout,
+                max_bytes=limits.log_max_bytes,
+            )
+    finally:
+        os.remove(test_dockerfile_path)
+    report.image = image
+    if returncode != 0:
+        report.build_failed = True
+        report.returncode = returncode
+        report.output = stderr
+        report.duration = time.monotonic() - started_at
+        return report
+
+    returncode, workdir, _ = await run_command(
+        ["docker", "image", "inspect", "-f", "{{.Config.WorkingDir}}", image]
+    )
+    workdir = workdir.strip() if returncode == 0 and workdir.strip() else "/"
+
+    command = [
+        "docker", "run", "--rm",
+        "--cpus", str(limits.cpus),
+        "--memory", limits.memory,
+        "--pids-limit", str(limits.pids),
+        "-v", f"{os.path.abspath(test_path)}:{workdir.rstrip('/')}/{TEST_DIR_NAME}",
+        "-w", workdir,
+        "--entrypoint", "",
+        image,
+    ] + _test_command(runtime, workers, generated, generated_test_files(test_path, runtime))
+
+    try:
+        report.returncode, stdout, stderr = await run_command(
+            command,
+            timeout=get_int_setting("TESTS", "timeout", 300),
+            max_bytes=limits.log_max_bytes,
+        )
+    except CommandTimeout as e:
+        report.returncode = -1
+        stdout, stderr = e.stdout, f"{e.stderr}\n{e}"
+    report.output = stdout + stderr
+
+    if runtime == "python" and os.path.exists(report_path):
+        report.total, report.failures = parse_junit_file(report_path)
+    else:
+        report.total, report.failures = parse_tap(stdout)
+    report.passed = report.total - len(report.failures)
+    report.duration = time.monotonic() - started_at
+    logger.info("Test phase: %s", report.summary())
+    return report
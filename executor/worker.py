@@ -0,0 +1,251 @@
+"""
+Execution worker: accepts a workspace tarball, builds and runs it with
+docker-compose and streams the output back to the dispatcher. The tests of a
+project run on the worker that ran it, where its workspace and image are.
+
+Run several workers on one machine for local testing:
+    python -m executor.worker --port 7001 --workdir /tmp/worker-1
+    python -m executor.worker --port 7002 --workdir /tmp/worker-2
+
+Workers listening on other interfaces than loopback need a shared token, which
+the dispatcher sends with every request ([EXECUTION] worker_token):
+    EXECUTOR_WORKER_TOKEN=... python -m executor.worker --host 0.0.0.0 --port 7001
+"""
+
+import argparse
+import asyncio
+import hmac
+import ipaddress
+import logging
+import os
+import re
+import shutil
+import tempfile
+from typing import Optional
+
+# own imports
+from executor.compose import compose_up, compose_down, container_logs, run_command
+from executor.testing import run_tests, test_image_name
+from executor.protocol import (
+    ProtocolError,
+    receive_message,
+    receive_stream,
+    send_message,
+    unpack_workspace,
+)
+from utils.log_pipeline import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def _job_directory_name(container_name: str) -> str:
+    # The directory name is also the compose project name, keep it docker-safe
+    return re.sub(r"[^a-z0-9_-]+", "-", container_name.lower()).strip("-") or "job"
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class ExecutionWorker:
+    def __init__(self, workdir: str, capacity: int = 2, token: Optional[str] = None):
+        self.workdir = workdir
+        self.capacity = capacity
+        self.token = token
+        self.active_jobs = 0
+        self.images = set()
+        self._slots = asyncio.Semaphore(capacity)
+        os.makedirs(workdir, exist_ok=True)
+
+    async def load_cached_images(self):
+        """Seed the image list from the local daemon so placement affinity survives restarts."""
+        try:
+            returncode, stdout, _ = await run_command(
+                ["docker", "images", "--format", "{{.Repository}}:{{.Tag}}"]
+            )
+        except OSError as e:
+            logger.warning("Could not list docker images: %s", e)
+            return
+        if returncode == 0:
+            self.images.update(line for line in stdout.splitlines() if line)
+
+    def status(self) -> dict:
+        return {
+            "active_jobs": self.active_jobs,
+            "capacity": self.capacity,
+            "images": sorted(self.images),
+        }
+
+    def _job_path(self, container_name: str) -> str:
+        return os.path.join(self.workdir, _job_directory_name(container_name))
+
+    def _test_path(self, container_name: str) -> str:
+        return self._job_path(container_name) + "-tests"
+
+    async def handle_run(self, message: dict, reader, writer):
+        container_name = message["container_name"]
+        image_name = message.get("image_name")
+        job_path = self._job_path(container_name)
+
+        archive = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        async for chunk in receive_stream(reader):
+            archive.write(chunk)
+        archive.seek(0)
+
+        self.active_jobs += 1
+        try:
+            async with self._slots:
+                # Keep the directory (and compose project) stable between iterations
+                if os.path.exists(job_path):
+                    shutil.rmtree(job_path)
+                os.makedirs(job_path)
+                await asyncio.to_thread(unpack_workspace, archive, job_path)
+
+                async def forward(stream: str, data: str):
+                    await send_message(
+                        writer, {"event": "log", "stream": stream, "data": data}
+                    )
+
+                result = await compose_up(job_path, container_name, forward)
+        finally:
+            self.active_jobs -= 1
+            archive.close()
+
+        if result.build_returncode == 0 and image_name:
+            self.images.add(image_name)
+        await send_message(writer, {"event": "result", **result.to_dict()})
+
+    async def handle_test(self, message: dict, reader, writer):
+        container_name = message["container_name"]
+        job_path = self._job_path(container_name)
+        test_path = self._test_path(container_name)
+
+        archive = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        async for chunk in receive_stream(reader):
+            archive.write(chunk)
+        archive.seek(0)
+
+        self.active_jobs += 1
+        try:
+            async with self._slots:
+                if os.path.exists(test_path):
+                    shutil.rmtree(test_path)
+                os.makedirs(test_path)
+                await asyncio.to_thread(unpack_workspace, archive, test_path)
+                if not os.path.exists(job_path):
+                    raise ProtocolError(f"No workspace for '{container_name}' on this worker")
+                # The job directory name is the compose project of the run
+                report = await run_tests(
+                    job_path,
+                    test_path,
+                    message["runtime"],
+                    container_name,
+                    generated=message.get("generated", True),
+                    project_name=os.path.basename(job_path),
+                )
+        finally:
+            self.active_jobs -= 1
+            archive.close()
+
+        await send_message(writer, {"event": "result", **report.to_dict()})
+
+    async def handle_logs(self, message: dict, writer):
+        returncode, stdout, stderr = await container_logs(
+            message["container_name"], message.get("tail", 20)
+        )
+        await send_message(
+            writer,
+            {
+                "event": "result",
+                "returncode": returncode,
+                "stdout": stdout,
+                "stderr": stderr,
+            },
+        )
+
+    async def handle_down(self, message: dict, writer):
+        job_path = self._job_path(message["container_name"])
+        returncode = await compose_down(job_path) if os.path.exists(job_path) else 0
+        await run_command(
+            ["docker", "image", "rm", "-f", test_image_name(message["container_name"])]
+        )
+        await send_message(writer, {"event": "result", "returncode": returncode})
+
+    async def handle_connection(self, reader, writer):
+        try:
+            message = await receive_message(reader)
+            if message is None:
+                return
+            if self.token and not hmac.compare_digest(
+                str(message.get("token") or ""), self.token
+            ):
+                logger.warning("Refusing a request without a valid token")
+                await send_message(writer, {"event": "error", "details": "Invalid worker token"})
+                return
+            op = message.get("op")
+            if op == "status":
+                await send_message(writer, {"event": "result", **self.status()})
+            elif op == "run":
+                await self.handle_run(message, reader, writer)
+            elif op == "test":
+                await self.handle_test(message, reader, writer)
+            elif op == "logs":
+                await self.handle_logs(message, writer)
+            elif op == "down":
+                await self.handle_down(message, writer)
+            else:
+                await send_message(
+                    writer, {"event": "error", "details": f"Unknown op '{op}'"}
+                )
+        except Exception as e:
+            if isinstance(e, (ProtocolError, OSError, KeyError)):
+                logger.warning("Worker request failed: %s", e)
+            else:
+                logger.exception("Worker request failed")
+            try:
+                await send_message(
+                    writer, {"event": "error", "details": f"{type(e).__name__}: {e}"}
+                )
+            except OSError:
+                pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        await self.load_cached_images()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info(
+            "Execution worker listening on %s:%s (capacity %s)", host, port, self.capacity
+        )
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Execution worker for generated projects")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7001)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "executor-worker"))
+    parser.add_argument("--capacity", type=int, default=2)
+    parser.add_argument(
+        "--token",
+        default=os.environ.get("EXECUTOR_WORKER_TOKEN"),
+        help="Shared token the dispatcher must send (default: $EXECUTOR_WORKER_TOKEN)",
+    )
+    args = parser.parse_args()
+    # The protocol runs whatever it is sent, it must not be reachable without a token
+    if not args.token and not is_loopback(args.host):
+        parser.error("listening on a non-loopback address needs --token")
+
+    setup_logging()
+    worker = ExecutionWorker(args.workdir, args.capacity, args.token)
+    asyncio.run(worker.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+The agents graph and a single run of it, shared by the Chainlit app (main.py)
+and the headless batch runner (batch.py).
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import StateGraph, END
+from langgraph.pregel import GraphRecursionError
+from langchain_community.callbacks import get_openai_callback
+
+# own imports
+from llm_models import ModelRouter, get_model_router
+from agents import (
+    code_generator_agent,
+    code_editor_agent,
+    write_code_to_file_agent,
+    execute_code_agent,
+    debug_code_agent,
+    read_me_agent,
+    dockerizer_agent,
+    execute_docker_agent,
+    debug_code_execution_agent,
+    debug_docker_execution_agent,
+    hot_reload_agent,
+    release_docker_resources,
+    remember_successful_project,
+    verify_pending_fix,
+    test_agent,
+    take_snapshot,
+    rate_snapshot,
+    restore_best_snapshot,
+)
+from agents.routing import (
+    current_budget,
+    failed_fixes,
+    get_routing_policy,
+    record_execution_outcome,
+    run_budget_from_settings,
+)
+from executor import get_lifecycle_manager
+from utils.log_pipeline import excerpt, session_id_var
+from utils.memory import RunMemory
+from tracing import end_trace, start_trace, traced
+from utils.events import progress_step
+from schemas import GraphState
+
+logger = logging.getLogger(__name__)
+
+# Model of each node is picked by the router (see [MODELS] in config.ini)
+models = get_model_router()
+
+
+# detirmine if we should end (success) or debug (error)
+def decide_to_end(state: GraphState):
+    logger.info("ENTERING DECIDE TO END FUNCTION")
+    logger.info("iterations: %s", state["iterations"])
+    logger.info("error: %s", state["error"] and state["error"].type)
+
+    # Per error class budgets, progress detection and the run's time / token budget
+    return get_routing_policy().decide(state)
+
+
+def decide_entry(state: GraphState):
+    return "editor" if state.get("codes") and state.get("docker_files") else "programmer"
+
+
+def build_graph(file_path: str, test_file: str, router: Optional[ModelRouter] = None):
+    """
+    Compile the agents graph for a workspace (sources in `file_path`, tests in `test_file`).
+    Every node is traced (see tracing); `router` replaces the model router, e.g. by
+    the recorded models of a replay.
+    """
+    router = router or models
+    # Create the graph.
+    workflow = StateGraph(GraphState)
+
+    # generate code from user input
+    async def create_code_f(state: GraphState):
+        return await code_generator_agent(
+            state, router.for_node("programmer"), router.for_node("planner")
+        )
+
+    # change the session's existing project for a follow-up request
+    async def edit_code_f(state: GraphState):
+        result = await code_editor_agent(state, router.for_node("editor"), file_path)
+        return {**result, **take_snapshot(result, file_path, "editor")}
+
+    # save generated code to file
+    def write_code_to_file_f(state: GraphState):
+        return write_code_to_file_agent(state, file_path)
+
+    # execute code from folder
+    async def execute_code_f(state: GraphState):
+        return await execute_code_agent(state, file_path)
+
+    # execute docker from folder
+    async def execute_docker_f(state: GraphState):
+        result = await execute_docker_agent(state, file_path)
+        return {
+            **result,
+            # The image is built from the whole workspace
+            "changed_files": [],
+            **verify_pending_fix(state, result["error"]),
+            **record_execution_outcome(state, result["error"]),
+            **rate_snapshot(state, result["error"]),
+        }
+
+    # debug codes if error occurs
+    async def debug_code_f(state: GraphState):
+        llm = router.for_node("debugger", failed_fixes(state))
+        return await debug_code_agent(state, llm)
+
+    # debug docker if error occurs in docker
+    async def debug_docker_f(state: GraphState):
+        # Stronger model once the fixes keep failing
+        llm = router.for_node("debug_docker", failed_fixes(state))
+        result = await debug_docker_execution_agent(state, llm, file_path)
+        return {**result, **take_snapshot(result, file_path, "debug_docker")}
+
+    # debug code used in docker if error occurs
+    async def debug_code_docker_f(state: GraphState):
+        llm = router.for_node("debug_code", failed_fixes(state))
+        result = await debug_code_execution_agent(state, llm, file_path)
+        return {**result, **take_snapshot(result, file_path, "debug_code")}
+
+    # sync the fixed code into the container (rebuild if needed) and log its errors
+    async def log_docker_errors_f(state: GraphState):
+        result = await hot_reload_agent(state, file_path)
+        return {
+            **result,
+            **verify_pending_fix(state, result["error"]),
+            **record_execution_outcome(state, result["error"]),
+            **rate_snapshot(state, result["error"]),
+        }
+
+    # run the project's tests inside its image
+    async def test_f(state: GraphState):
+        result = await test_agent(state, router.for_node("tester"), file_path, test_file)
+        return {
+            **result,
+            **verify_pending_fix(state, result["error"]),
+            **record_execution_outcome(state, result["error"]),
+            **rate_snapshot(state, result["error"]),
+        }
+
+    # create readme and developer files
+    async def read_me_f(state: GraphState):
+        return await read_me_agent(state, router.for_node("readme"), file_path)
+
+    # generate dockerfile and docker-compose file
+    # TODO:: start docker etc.
+    async def dockerize_f(state: GraphState):
+        result = await dockerizer_agent(state, router.for_node("dockerizer"), file_path)
+        # First snapshot of the workspace: saved code and its Docker files
+        return {**result, **take_snapshot(result, file_path, "dockerizer")}
+
+    # put the best attempt back when the run ends without success
+    def restore_best_f(state: GraphState):
+        return restore_best_snapshot(state, file_path)
+
+    # Traced, and reported to the UI as a progress step
+    def node(name: str, function):
+        return traced(name, progress_step(name, function))
+
+    # Add the node to the graph.
+    # image from graph flow is saved in images/graphs/graph_flow.png
+    workflow.add_node("programmer", node("programmer", create_code_f))
+    workflow.add_node("editor", node("editor", edit_code_f))
+    workflow.add_node("saver", node("saver", write_code_to_file_f))
+    workflow.add_node("dockerizer", node("dockerizer", dockerize_f))
+    # workflow.add_node("executer", node("executer", execute_code_f)) <- replaced with execute_docker_f
+    workflow.add_node("executer_docker", node("executer_docker", execute_docker_f))
+    workflow.add_node("debugger", node("debugger", debug_code_f))
+    workflow.add_node("debug_docker", node("debug_docker", debug_docker_f))
+    workflow.add_node("debug_code", node("debug_code", debug_code_docker_f))
+    workflow.add_node("log_docker_errors", node("log_docker_errors", log_docker_errors_f))
+    workflow.add_node("tester", node("tester", test_f))
+    workflow.add_node("readme", node("readme", read_me_f))
+    workflow.add_node("restore_best", node("restore_best", restore_best_f))
+
+    # add the edge to the graph
+    workflow.add_edge("programmer", "saver")
+    workflow.add_edge("saver", "dockerizer")
+    # workflow.add_edge("dockerizer", "executer")
+    workflow.add_edge("dockerizer", "executer_docker")
+    workflow.add_edge("debugger", "saver")
+    workflow.add_edge("debug_docker", "executer_docker")
+    workflow.add_edge("debug_code", "log_docker_errors")
+    # Edited files are synced into the session's container, or rebuilt when needed
+    workflow.add_edge("editor", "log_docker_errors")
+    workflow.add_edge("readme", END)
+    workflow.add_edge("restore_best", END)
+
+    workflow.add_conditional_edges(
+        source="executer_docker",
+        path=decide_to_end,
+        path_map={
+            "tester": "tester",  # Run the tests once the project runs without errors
+            "readme": "readme",  # Transition to the README node if `decide_to_end` returns "readme"
+            "debugger": "debugger",  # General debugger transition (if needed)
+            "debug_docker": "debug_docker",  # Transition to Docker debugging if a Docker Error is detected
+            "debug_code": "debug_code",  # Transition to code debugging if a Docker Execution Error is detected
+            "retry": "executer_docker",  # Run again as is if Docker itself failed
+            "end": "restore_best",  # Restore the best attempt and end if too many iterations or another end condition is met
+        },
+    )
+    #Used after code changes been made and we want to log errors again
+    workflow.add_conditional_edges(
+        source="log_docker_errors",
+        path=decide_to_end,
+        path_map={
+            "tester": "tester",  # Run the tests once the project runs without errors
+            "readme": "readme",  # Transition to the README node if `decide_to_end` returns "readme"
+            "debugger": "debugger",  # General debugger transition (if needed)
+            "debug_docker": "debug_docker",  # Transition to Docker debugging if a Docker Error is detected
+            "debug_code": "debug_code",  # Transition to code debugging if a Docker Execution Error is detected
+            "retry": "executer_docker",  # Run again as is if Docker itself failed
+            "end": "restore_best",  # Restore the best attempt and end if too many iterations or another end condition is met
+        },
+    )
+
+    # Test failures go to the code debugger, passing tests to the README node
+    workflow.add_conditional_edges(
+        source="tester",
+        path=decide_to_end,
+        path_map={
+            "tester": "tester",
+            "readme": "readme",
+            "debugger": "debugger",
+            "debug_docker": "debug_docker",
+            "debug_code": "debug_code",
+            "retry": "executer_docker",
+            "end": "restore_best",
+        },
+    )
+
+    # set start node: new projects are generated, follow-ups edit the existing one
+    workflow.set_conditional_entry_point(
+        decide_entry,
+        {"programmer": "programmer", "editor": "editor"},
+    )
+
+    # Create the app and run it
+    return workflow.compile()
+
+
+@dataclass
+class RunOutcome:
+    """
+    Result of one requirement run through the graph.
+
+    Attributes:
+        state: Final graph state (None when the run was aborted).
+        success: The project ran (and passed its tests) without errors.
+        duration: Wall-clock seconds of the run.
+        tokens / cost: LLM tokens used and their cost in USD.
+        error: Type of the last error, or why the run was aborted.
+        rss_mb / peak_rss_mb: Resident memory of the process when the run started,
+            and its peak during the run (process wide, see RunMemory).
+        peak_rss_shared: Other runs overlapped this one, its peak is theirs as well.
+    """
+
+    state: Optional[dict]
+    success: bool
+    duration: float
+    tokens: int = 0
+    cost: float = 0.0
+    error: Optional[str] = None
+    rss_mb: float = 0.0
+    peak_rss_mb: float = 0.0
+    peak_rss_shared: bool = False
+
+
+async def run_requirement(
+    app, requirement: str, session_id: str, previous_state: Optional[dict] = None
+) -> RunOutcome:
+    """
+    Run one requirement through a compiled graph and release its Docker resources.
+    With the `previous_state` of the session's project, the requirement is a change
+    to that project and the graph starts at the editor instead of the programmer.
+    """
+    logger.info("New requirement: %s", excerpt(requirement))
+    inputs = {
+        "messages": [HumanMessage(content=requirement)],
+        "iterations": 0,
+        "session_id": session_id,
+    }
+    if previous_state and previous_state.get("codes"):
+        # Per run fields start over, the project and its Docker setup are kept
+        inputs = {
+            **previous_state,
+            **inputs,
+            "messages": list(previous_state.get("messages") or []) + inputs["messages"],
+            "error": None,
+            "error_history": [],
+            "snapshots": [],
+            "pending_fix": None,
+            # Files restored at the end of the previous run are not in its container yet
+            "changed_files": list(previous_state.get("changed_files") or []),
+        }
+    # amount of steps to run (node -> step), so no infinite loop will be created by accident
+    # TODO: use iterations instread of steps??
+    config = RunnableConfig(recursion_limit=30)
+    # Every log record of this run goes to the session's own log file
+    session_id_var.set(session_id)
+    get_lifecycle_manager().acquire(session_id)
+    # Replayable record of the run, when [TRACING] is enabled
+    trace = start_trace(session_id, inputs)
+    memory = RunMemory().start()
+    started_at = time.monotonic()
+    results = None
+    error = None
+    token_usage = None
+
+    try:
+        # Token usage of every LLM call in the run counts against the run's budget
+        with get_openai_callback() as token_usage:
+            current_budget.set(run_budget_from_settings(token_usage))
+            # first invoke should have something to add to the state
+            results = await app.ainvoke(inputs, config=config)
+        # Successful projects seed the generation of similar requirements
+        if results.get("codes") and not results.get("error"):
+            remember_successful_project(results)
+        elif results.get("error"):
+            error = results["error"].type
+    except GraphRecursionError as e:
+        logger.warning("GraphRecursionError: %s", e)
+        error = "GraphRecursionError"
+    finally:
+        # Whatever the outcome, broken containers are removed and the others kept for
+        # the session's next run (see LifecycleManager.release_run)
+        await release_docker_resources(session_id)
+        models.log_stats()
+        end_trace(trace, error)
+        memory.stop()
+        logger.info(
+            "Memory: %.1f MB at start, %.1f MB peak%s",
+            memory.start_mb,
+            memory.peak_mb,
+            " (shared with concurrent runs)" if memory.shared else "",
+        )
+
+    return RunOutcome(
+        state=results,
+        success=bool(results and results.get("codes") and not results.get("error")),
+        duration=time.monotonic() - started_at,
+        tokens=getattr(token_usage, "total_tokens", 0),
+        cost=getattr(token_usage, "total_cost", 0.0),
+        error=error,
+        rss_mb=round(memory.start_mb, 1),
+        peak_rss_mb=round(memory.peak_mb, 1),
+        peak_rss_shared=memory.shared,
+    )
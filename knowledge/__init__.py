@@ -0,0 +1,24 @@
+from .project_index import (
+    ProjectEntry,
+    ProjectIndex,
+    ProjectMatch,
+    get_project_index,
+    reuse_threshold,
+    adapt_threshold,
+    tokenize,
+)
+from .fix_cache import FixCache, KnownFix, error_signature, get_fix_cache
+
+__all__ = [
+    "ProjectEntry",
+    "ProjectIndex",
+    "ProjectMatch",
+    "get_project_index",
+    "reuse_threshold",
+    "adapt_threshold",
+    "tokenize",
+    "FixCache",
+    "KnownFix",
+    "error_signature",
+    "get_fix_cache",
+]
@@ -0,0 +1,407 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+# own imports
+from utils.docker_templates import NODE_BASE_IMAGE, PYTHON_BASE_IMAGE
+from utils.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Import names that differ from their pip package name
+PIP_PACKAGE_NAMES = {
+    "cv2": "opencv-python",
+    "PIL": "Pillow",
+    "yaml": "PyYAML",
+    "sklearn": "scikit-learn",
+    "bs4": "beautifulsoup4",
+    "dotenv": "python-dotenv",
+    "dateutil": "python-dateutil",
+}
+
+# A fix is dropped after this many attempts if it worked less than half the time
+MIN_ATTEMPTS_BEFORE_EVICTION = 3
+MIN_SUCCESS_RATE = 0.5
+# LLM fixes waiting for the execution that verifies them, before they are stored
+MAX_CANDIDATES = 128
+
+# Lines of the error details that carry the signature
+_ERROR_LINE = re.compile(
+    r"error|err!|exception|not found|no such|failed|denied|cannot|unable", re.IGNORECASE
+)
+
+
+def _normalize(line: str) -> str:
+    line = line.lower()
+    line = re.sub(r"sha256:[0-9a-f]+|0x[0-9a-f]+|\b[0-9a-f]{12,}\b", "<id>", line)
+    line = re.sub(r"'[^']*'|\"[^\"]*\"|`[^`]*`", "<s>", line)
+    line = re.sub(r"(/[\w.\-@]+)+", "<path>", line)
+    line = re.sub(r"\d+", "<n>", line)
+    return re.sub(r"\s+", " ", line).strip()
+
+
+def error_signature(error_type: str, details: str, max_lines: int = 3) -> str:
+    """
+    Project independent signature of an error: its type plus the first distinct
+    error lines with names, paths, ids and numbers replaced by placeholders.
+    """
+    lines = []
+    for line in (details or "").splitlines():
+        if not _ERROR_LINE.search(line):
+            continue
+        normalized = _normalize(line)
+        if normalized and normalized not in lines:
+            lines.append(normalized)
+        if len(lines) >= max_lines:
+            break
+    return f"{error_type}|{' / '.join(lines)}"
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+# A deterministic fix returns {filename: new content}, or None when it does not apply
+RuleFunction = Callable[[str, Dict[str, str]], Optional[Dict[str, str]]]
+
+
+@dataclass
+class FixRule:
+    name: str
+    pattern: re.Pattern
+    apply: RuleFunction
+
+
+def _npm_legacy_peer_deps(details: str, files: Dict[str, str]) -> Optional[Dict[str, str]]:
+    dockerfile = files.get("Dockerfile", "")
+    if "--legacy-peer-deps" in dockerfile:
+        return None
+    patched = re.sub(
+        r"npm (?:install|ci|i)\b[^\n&|;\\]*",
+        lambda m: m.group(0).rstrip() + " --legacy-peer-deps ",
+        dockerfile,
+    )
+    patched = re.sub(r"--legacy-peer-deps $", "--legacy-peer-deps", patched, flags=re.MULTILINE)
+    return {"Dockerfile": patched} if patched != dockerfile else None
+
+
+def _missing_workdir(details: str, files: Dict[str, str]) -> Optional[Dict[str, str]]:
+    dockerfile = files.get("Dockerfile", "")
+    if not dockerfile or re.search(r"^\s*WORKDIR\b", dockerfile, re.MULTILINE | re.IGNORECASE):
+        return None
+    patched = re.sub(
+        r"^(\s*FROM\b[^\n]*\n)",
+        r"\1WORKDIR /app\n",
+        dockerfile,
+        count=1,
+        flags=re.MULTILINE | re.IGNORECASE,
+    )
+    return {"Dockerfile": patched} if patched != dockerfile else None
+
+
+def _wrong_base_image(details: str, files: Dict[str, str]) -> Optional[Dict[str, str]]:
+    dockerfile = files.get("Dockerfile", "")
+    if "requirements.txt" in files or any(f.endswith(".py") for f in files):
+        image = PYTHON_BASE_IMAGE
+    elif "package.json" in files or any(f.endswith(".js") for f in files):
+        image = NODE_BASE_IMAGE
+    else:
+        return None
+    patched = re.sub(
+        r"^(\s*FROM\s+)\S+",
+        lambda m: m.group(1) + image,
+        dockerfile,
+        count=1,
+        flags=re.MULTILINE | re.IGNORECASE,
+    )
+    return {"Dockerfile": patched} if patched != dockerfile else None
+
+
+def _missing_python_module(details: str, files: Dict[str, str]) -> Optional[Dict[str, str]]:
+    match = re.search(r"No module named '([\w.]+)'", details)
+    requirements = files.get("requirements.txt")
+    if not match or requirements is None:
+        return None
+    module = match.group(1).split(".")[0]
+    local_module = any(
+        f == f"{module}.py" or f.startswith(f"{module}/") for f in files
+    )
+    if module in sys.stdlib_module_names or local_module:
+        return None
+    package = PIP_PACKAGE_NAMES.get(module, module)
+    listed = {
+        re.split(r"[<>=!~\[; ]", line.strip(), 1)[0].lower()
+        for line in requirements.splitlines()
+        if line.strip()
+    }
+    if package.lower() in listed:
+        return None
+    return {"requirements.txt": requirements.rstrip("\n") + f"\n{package}\n"}
+
+
+def _missing_node_module(details: str, files: Dict[str, str]) -> Optional[Dict[str, str]]:
+    match = re.search(r"Cannot find module '([^'./][^']*)'", details)
+    manifest = files.get("package.json")
+    if not match or manifest is None:
+        return None
+    name = match.group(1)
+    # Scoped packages keep two path segments, others one
+    package = "/".join(name.split("/")[:2]) if name.startswith("@") else name.split("/")[0]
+    try:
+        package_json = json.loads(manifest)
+    except ValueError:
+        return None
+    dependencies = package_json.setdefault("dependencies", {})
+    if package in dependencies:
+        return None
+    dependencies[package] = "*"
+    return {"package.json": json.dumps(package_json, indent=2) + "\n"}
+
+
+FIX_RULES = [
+    FixRule(
+        "npm-legacy-peer-deps",
+        re.compile(r"ERESOLVE|peer dep|conflicting peer dependency", re.IGNORECASE),
+        _npm_legacy_peer_deps,
+    ),
+    FixRule(
+        "wrong-base-image",
+        re.compile(
+            r"pull access denied|manifest unknown|manifest for .* not found|failed to resolve source metadata",
+            re.IGNORECASE,
+        ),
+        _wrong_base_image,
+    ),
+    FixRule(
+        "missing-python-module",
+        re.compile(r"ModuleNotFoundError|No module named"),
+        _missing_python_module,
+    ),
+    FixRule(
+        "missing-node-module",
+        re.compile(r"Cannot find module '[^'./]"),
+        _missing_node_module,
+    ),
+    # Last: "cannot find module" is also what a missing dependency looks like
+    FixRule(
+        "missing-workdir",
+        re.compile(
+            r"no such file or directory|can't open file|cannot find module", re.IGNORECASE
+        ),
+        _missing_workdir,
+    ),
+]
+
+
+@dataclass
+class KnownFix:
+    """
+    A fix that resolved an error signature.
+
+    Attributes:
+        key: Identifier of the fix (rule name or hash of a learned patch).
+        signature: Error signature the fix is for.
+        before: Hashes of the patched files before the fix, a learned patch is only
+                replayed on identical files.
+        patch: New content of the patched files (empty for rules).
+        attempts / successes: How often the fix was applied and how often it worked.
+    """
+
+    key: str
+    signature: str
+    before: Dict[str, str] = field(default_factory=dict)
+    patch: Dict[str, str] = field(default_factory=dict)
+    attempts: int = 0
+    successes: int = 0
+
+    @property
+    def success_rate(self) -> float:
+        return self.successes / self.attempts if self.attempts else 1.0
+
+
+class FixCache:
+    """
+    Fix knowledge base keyed by normalized error signatures.
+
+    `lookup` first tries patches learned from earlier LLM fixes of the same signature
+    on the same files, then the deterministic rules. Only a miss needs the LLM.
+    Every applied fix is verified by the next execution: an LLM fix is only stored
+    once it made its error class go away, and fixes that keep failing are evicted.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.learned: Dict[str, KnownFix] = {}
+        self.rule_stats: Dict[str, KnownFix] = {}
+        self._candidates: "OrderedDict[str, KnownFix]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read the fix cache: %s", e)
+            return
+        self.learned = {k: KnownFix(**v) for k, v in data.get("learned", {}).items()}
+        self.rule_stats = {k: KnownFix(**v) for k, v in data.get("rules", {}).items()}
+
+    def _save(self):
+        data = {
+            "learned": {k: v.__dict__ for k, v in self.learned.items()},
+            "rules": {k: v.__dict__ for k, v in self.rule_stats.items()},
+        }
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # A temporary file of its own, several processes share the cache file
+        descriptor, temporary_path = tempfile.mkstemp(
+            dir=directory, prefix=os.path.basename(self.path), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(temporary_path, self.path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    def _rule_usable(self, rule: FixRule) -> bool:
+        stats = self.rule_stats.get(rule.name)
+        return stats is None or not (
+            stats.attempts >= MIN_ATTEMPTS_BEFORE_EVICTION
+            and stats.success_rate < MIN_SUCCESS_RATE
+        )
+
+    def lookup(
+        self, error_type: str, details: str, files: Dict[str, str]
+    ) -> Optional[KnownFix]:
+        """Known fix for the error on these files, or None when the LLM is needed."""
+        signature = error_signature(error_type, details)
+        hashes = {name: _hash(content) for name, content in files.items()}
+
+        with self._lock:
+            for fix in self.learned.values():
+                if fix.signature == signature and all(
+                    hashes.get(name) == digest for name, digest in fix.before.items()
+                ):
+                    self.hits += 1
+                    logger.info("Fix cache hit (learned %s) for %s", fix.key[:8], signature)
+                    return fix
+
+            for rule in FIX_RULES:
+                if not rule.pattern.search(details or "") or not self._rule_usable(rule):
+                    continue
+                patch = rule.apply(details or "", files)
+                if patch:
+                    self.hits += 1
+                    logger.info("Fix cache hit (rule %s) for %s", rule.name, signature)
+                    return KnownFix(key=rule.name, signature=signature, patch=patch)
+
+            self.misses += 1
+            logger.info("Fix cache miss for %s", signature)
+            return None
+
+    def learn(
+        self,
+        error_type: str,
+        details: str,
+        files_before: Dict[str, str],
+        patch: Dict[str, str],
+    ) -> Optional[KnownFix]:
+        """
+        Candidate fix from the files an LLM fix rewrote. It is stored only when the
+        next execution confirms it (see record_outcome).
+        """
+        changed = {
+            name: content
+            for name, content in patch.items()
+            if files_before.get(name) != content
+        }
+        if not changed:
+            return None
+        signature = error_signature(error_type, details)
+        before = {name: _hash(files_before.get(name, "")) for name in changed}
+        key = _hash(signature + json.dumps(before, sort_keys=True))
+        with self._lock:
+            fix = self.learned.get(key) or KnownFix(
+                key=key, signature=signature, before=before, patch=changed
+            )
+            if key not in self.learned:
+                self._candidates[key] = fix
+                self._candidates.move_to_end(key)
+                while len(self._candidates) > MAX_CANDIDATES:
+                    self._candidates.popitem(last=False)
+        return fix
+
+    def record_outcome(self, key: str, signature: str, fixed: bool):
+        """
+        Outcome of a fix, from the execution after it: `fixed` when the error's class
+        went away (another class of error showing up still counts as fixed).
+        """
+        with self._lock:
+            candidate = self._candidates.pop(key, None)
+            if candidate is not None:
+                if not fixed:
+                    logger.info("Dropping LLM fix %s, the error remained", key[:8])
+                    return
+                self.learned[key] = candidate
+            fix = self.learned.get(key)
+            if fix is None:
+                fix = self.rule_stats.setdefault(
+                    key, KnownFix(key=key, signature=signature)
+                )
+            fix.attempts += 1
+            if fixed:
+                fix.successes += 1
+
+            if (
+                fix.attempts >= MIN_ATTEMPTS_BEFORE_EVICTION
+                and fix.success_rate < MIN_SUCCESS_RATE
+            ):
+                logger.info(
+                    "Evicting fix %s (success rate %.0f%%)", key[:8], fix.success_rate * 100
+                )
+                self.learned.pop(key, None)
+            self._save()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            # Every hit is a debug round-trip that did not need the LLM
+            "llm_calls_saved": self.hits,
+            "learned_fixes": len(self.learned),
+        }
+
+
+_fix_cache: Optional[FixCache] = None
+
+
+def get_fix_cache() -> FixCache:
+    """
+    [KNOWLEDGE]
+    directory = knowledge_base
+    """
+    global _fix_cache
+    if _fix_cache is None:
+        _fix_cache = FixCache(
+            os.path.join(
+                get_setting("KNOWLEDGE", "directory", "knowledge_base"), "fix_cache.json"
+            )
+        )
+    return _fix_cache
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# own imports
+from utils.settings import get_float_setting, get_setting
+
+logger = logging.getLogger(__name__)
+
+STOP_WORDS = {
+    "a", "an", "and", "the", "of", "to", "in", "for", "with", "that", "this",
+    "is", "it", "be", "on", "as", "by", "or", "should", "program", "make",
+    "create", "write", "simple", "please", "i", "want", "me",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Words and word bigrams, so 'hello world' and 'world hello' stay different."""
+    words = [w for w in re.findall(r"[a-z0-9#+]+", text.lower()) if w not in STOP_WORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+@dataclass
+class ProjectEntry:
+    """
+    A project that built and ran successfully.
+
+    Attributes:
+        requirement: The user's original request.
+        codes: The final `Codes` as a dict.
+        dockerfile / docker_compose: The Docker files the project ran with.
+        docker_image_name / docker_container_name: Names used in the Docker files.
+        iterations: Debug iterations that were needed.
+    """
+
+    requirement: str
+    codes: dict
+    dockerfile: str = ""
+    docker_compose: str = ""
+    docker_image_name: str = ""
+    docker_container_name: str = ""
+    iterations: int = 0
+    created_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class ProjectMatch:
+    entry: ProjectEntry
+    score: float
+
+
+class ProjectIndex:
+    """
+    On-disk TF-IDF index of successful projects.
+
+    Entries are appended to `projects.jsonl`, so updating the index after a success
+    only writes one line. A project whose files are already stored is not added again
+    (e.g. a reused project), and a new project for the same requirement replaces the
+    stored one; superseded lines are dropped from the file when it is loaded.
+    Document frequencies are kept incrementally in memory, the document vectors are
+    computed once per change of the index instead of on every query.
+    """
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, "projects.jsonl")
+        self.entries: List[ProjectEntry] = []
+        self._term_counts: List[Counter] = []
+        self._document_frequency: Counter = Counter()
+        self._by_requirement: Dict[str, int] = {}
+        self._by_content: Dict[str, int] = {}
+        # term -> (entry position, weight), None when entries changed since the last query
+        self._postings: Optional[Dict[str, List[Tuple[int, float]]]] = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def _requirement_key(entry: ProjectEntry) -> str:
+        return " ".join(entry.requirement.lower().split())
+
+    @staticmethod
+    def _content_key(entry: ProjectEntry) -> str:
+        data = json.dumps(entry.codes, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        lines = 0
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                lines += 1
+                try:
+                    self._index(ProjectEntry(**json.loads(line)))
+                except (ValueError, TypeError) as e:
+                    logger.warning("Skipping broken project index entry: %s", e)
+        if lines > len(self.entries):
+            self._compact()
+        logger.info("Loaded %d projects into the project index", len(self.entries))
+
+    def _compact(self):
+        """Rewrite the file with the live entries only."""
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            for entry in self.entries:
+                f.write(json.dumps(entry.__dict__) + "\n")
+        os.replace(temporary_path, self.path)
+
+    def _index(self, entry: ProjectEntry) -> bool:
+        """Index `entry`; False when the same project is already indexed."""
+        content_key = self._content_key(entry)
+        if content_key in self._by_content:
+            return False
+        counts = Counter(tokenize(entry.requirement))
+        requirement_key = self._requirement_key(entry)
+        position = self._by_requirement.get(requirement_key)
+        if position is None:
+            position = len(self.entries)
+            self.entries.append(entry)
+            self._term_counts.append(counts)
+        else:
+            replaced = self.entries[position]
+            del self._by_content[self._content_key(replaced)]
+            self._document_frequency.subtract(self._term_counts[position].keys())
+            self.entries[position] = entry
+            self._term_counts[position] = counts
+        self._by_requirement[requirement_key] = position
+        self._by_content[content_key] = position
+        self._document_frequency.update(counts.keys())
+        self._postings = None
+        return True
+
+    def _weights(self, counts: Counter) -> Dict[str, float]:
+        total = len(self.entries) + 1
+        weights = {
+            term: (1 + math.log(count))
+            * math.log(total / (1 + self._document_frequency.get(term, 0)) + 1)
+            for term, count in counts.items()
+        }
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        return {term: w / norm for term, w in weights.items()}
+
+    def _document_postings(self) -> Dict[str, List[Tuple[int, float]]]:
+        if self._postings is None:
+            postings: Dict[str, List[Tuple[int, float]]] = {}
+            for position, counts in enumerate(self._term_counts):
+                for term, weight in self._weights(counts).items():
+                    postings.setdefault(term, []).append((position, weight))
+            self._postings = postings
+        return self._postings
+
+    def add(self, entry: ProjectEntry) -> bool:
+        """Store a project; False when the same files are already stored."""
+        with self._lock:
+            if not self._index(entry):
+                logger.info("Project already in the project index")
+                return False
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry.__dict__) + "\n")
+            return True
+
+    def search(self, requirement: str, limit: int = 3) -> List[ProjectMatch]:
+        with self._lock:
+            query = self._weights(Counter(tokenize(requirement)))
+            if not query:
+                return []
+            postings = self._document_postings()
+            scores: Dict[int, float] = {}
+            for term, weight in query.items():
+                for position, document_weight in postings.get(term, ()):
+                    scores[position] = scores.get(position, 0.0) + weight * document_weight
+            matches = [
+                ProjectMatch(self.entries[position], score)
+                for position, score in scores.items()
+                if score > 0
+            ]
+        # Prefer projects that needed fewer iterations when scores tie
+        matches.sort(key=lambda m: (-m.score, m.entry.iterations))
+        return matches[:limit]
+
+    def best_match(self, requirement: str) -> Optional[ProjectMatch]:
+        matches = self.search(requirement, limit=1)
+        return matches[0] if matches else None
+
+
+_project_index: Optional[ProjectIndex] = None
+
+
+def get_project_index() -> ProjectIndex:
+    """
+    [KNOWLEDGE]
+    directory = knowledge_base
+    """
+    global _project_index
+    if _project_index is None:
+        _project_index = ProjectIndex(
+            get_setting("KNOWLEDGE", "directory", "knowledge_base")
+        )
+    return _project_index
+
+
+def reuse_threshold() -> float:
+    """Similarity above which a stored project is reused as is."""
+    return get_float_setting("KNOWLEDGE", "reuse_threshold", 0.92)
+
+
+def adapt_threshold() -> float:
+    """Similarity above which a stored project is given to the generator as a reference."""
+    return get_float_setting("KNOWLEDGE", "adapt_threshold", 0.45)
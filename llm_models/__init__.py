@@ -1,3 +1,4 @@
 from .openai_models import get_openai_llm
+from .router import ModelRouter, ModelStats, RoutedModel, get_model_router
 
-__all__ = ["get_openai_llm"]
+__all__ = ["get_openai_llm", "ModelRouter", "ModelStats", "RoutedModel", "get_model_router"]
@@ -0,0 +1,332 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_openai import ChatOpenAI
+from openai import APITimeoutError
+
+# own imports
+from llm_models.openai_models import llm_config
+from tracing import TraceCallbackHandler
+from utils.settings import config, get_float_setting, get_int_setting, get_setting
+
+logger = logging.getLogger(__name__)
+
+# Model aliases usable as node models in [MODELS]
+SMALL_MODEL = "gpt-4o-mini"
+STRONG_MODEL = "gpt-4o"
+
+# Cheap nodes get the small model unless config.ini says otherwise
+DEFAULT_NODE_MODELS = {
+    "readme": "small",
+    "dockerizer": "small",
+    "tester": "small",
+}
+
+# Nodes writing whole projects or files in one structured call get longer than the
+# [MODELS] timeout before they are moved to the fallback model, overridden by [MODEL_TIMEOUTS]
+DEFAULT_NODE_TIMEOUTS = {
+    "programmer": 300,
+    "planner": 180,
+    "editor": 300,
+}
+
+# Fixer nodes, escalated to the strong model after failed fixes
+FIXER_NODES = ("debugger", "debug_docker", "debug_code")
+
+# USD per million input / output tokens, overridden by [MODEL_PRICES]
+DEFAULT_PRICES = {
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+}
+
+# Share of the input price charged for prompt tokens served from the prefix cache
+DEFAULT_CACHED_PRICE_RATIO = 0.5
+
+
+@dataclass
+class ModelStats:
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    latency: float = 0.0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.latency / self.calls if self.calls else 0.0
+
+    @property
+    def cache_hit_rate(self) -> float:
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+
+def model_price(model: str) -> Tuple[float, float]:
+    """
+    [MODEL_PRICES]
+    gpt-4o = 2.5, 10
+    """
+    value = get_setting("MODEL_PRICES", model)
+    if value:
+        prompt_price, completion_price = (float(v) for v in value.split(","))
+        return prompt_price, completion_price
+    # Dated snapshots (gpt-4o-2024-08-06) cost the same as their model
+    for name in sorted(DEFAULT_PRICES, key=len, reverse=True):
+        if model.startswith(name):
+            return DEFAULT_PRICES[name]
+    return 0.0, 0.0
+
+
+def cached_price_ratio() -> float:
+    """
+    [PROMPT_CACHE]
+    cached_price_ratio = 0.5
+    """
+    return get_float_setting("PROMPT_CACHE", "cached_price_ratio", DEFAULT_CACHED_PRICE_RATIO)
+
+
+def cached_prompt_tokens(response, usage: dict) -> int:
+    """Prompt tokens the provider served from its prefix cache."""
+    details = usage.get("prompt_tokens_details") or {}
+    if details.get("cached_tokens"):
+        return details["cached_tokens"]
+    # Newer clients only report it on the message usage metadata
+    for generations in response.generations or []:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            cached = (metadata.get("input_token_details") or {}).get("cache_read")
+            if cached:
+                return cached
+    return 0
+
+
+class ModelStatsHandler(BaseCallbackHandler):
+    """Collects latency, token usage and cost of every LLM call, per model."""
+
+    def __init__(self):
+        self.stats: Dict[str, ModelStats] = {}
+        self._started: Dict[object, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or "unknown"
+        self._started[run_id] = (model, time.monotonic())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, kwargs)
+
+    def _finish(self, run_id) -> Tuple[str, ModelStats]:
+        model, started_at = self._started.pop(run_id, ("unknown", time.monotonic()))
+        stats = self.stats.setdefault(model, ModelStats())
+        stats.calls += 1
+        stats.latency += time.monotonic() - started_at
+        return model, stats
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        with self._lock:
+            model, stats = self._finish(run_id)
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            cached_tokens = cached_prompt_tokens(response, usage)
+            completion_tokens = usage.get("completion_tokens", 0)
+            stats.prompt_tokens += prompt_tokens
+            stats.cached_tokens += cached_tokens
+            stats.completion_tokens += completion_tokens
+            prompt_price, completion_price = model_price(model)
+            stats.cost += (
+                (prompt_tokens - cached_tokens) * prompt_price
+                + cached_tokens * prompt_price * cached_price_ratio()
+                + completion_tokens * completion_price
+            ) / 1_000_000
+        logger.info(
+            "LLM call %s: %d prompt tokens (%d from the prefix cache), %d completion tokens",
+            model,
+            prompt_tokens,
+            cached_tokens,
+            completion_tokens,
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            _, stats = self._finish(run_id)
+            stats.errors += 1
+            if isinstance(error, APITimeoutError):
+                stats.timeouts += 1
+
+
+class RoutedModel:
+    """
+    Chat model of one node: structured output calls go to `model`, and to
+    `fallback` when the call times out.
+    """
+
+    def __init__(self, model: ChatOpenAI, fallback: Optional[ChatOpenAI] = None):
+        self.model = model
+        self.fallback = fallback
+
+    @property
+    def model_name(self) -> str:
+        return self.model.model_name
+
+    def with_structured_output(self, schema, **kwargs):
+        structured = self.model.with_structured_output(schema, **kwargs)
+        if self.fallback is None:
+            return structured
+        return structured.with_fallbacks(
+            [self.fallback.with_structured_output(schema, **kwargs)],
+            exceptions_to_handle=(APITimeoutError,),
+        )
+
+
+class ModelRouter:
+    """
+    Picks the chat model of each graph node.
+
+    - Nodes use the model set for them in [MODELS], the default model otherwise.
+    - Fixer nodes move to the strong model once `escalate_after` fixes in a row failed.
+    - Calls running longer than the node's timeout (`node_timeouts`, `timeout` for the
+      other nodes) are retried on the fallback model.
+    """
+
+    def __init__(
+        self,
+        default_model: str,
+        node_models: Dict[str, str],
+        small_model: str = SMALL_MODEL,
+        strong_model: str = STRONG_MODEL,
+        fallback_model: Optional[str] = None,
+        escalate_after: int = 2,
+        timeout: float = 60,
+        node_timeouts: Optional[Dict[str, float]] = None,
+    ):
+        self.default_model = default_model
+        self.node_models = node_models
+        self.small_model = small_model
+        self.strong_model = strong_model
+        self.fallback_model = fallback_model
+        self.escalate_after = escalate_after
+        self.timeout = timeout
+        self.node_timeouts = node_timeouts or {}
+        self.stats_handler = ModelStatsHandler()
+        self.trace_handler = TraceCallbackHandler()
+        self._models: Dict[Tuple[str, float], ChatOpenAI] = {}
+
+    @classmethod
+    def from_settings(cls) -> "ModelRouter":
+        """
+        [MODELS]
+        small = gpt-4o-mini
+        strong = gpt-4o
+        fallback = gpt-4o-mini
+        escalate_after = 2
+        timeout = 60
+        readme = small
+        dockerizer = small
+        tester = small
+        programmer = default
+        planner = default
+
+        [MODEL_TIMEOUTS]
+        programmer = 300
+        planner = 180
+        editor = 300
+        """
+        node_models = dict(DEFAULT_NODE_MODELS)
+        reserved = {"small", "strong", "fallback", "escalate_after", "timeout"}
+        if config.has_section("MODELS"):
+            node_models.update(
+                (key, value)
+                for key, value in config.items("MODELS")
+                if key not in reserved
+            )
+        node_timeouts = dict(DEFAULT_NODE_TIMEOUTS)
+        if config.has_section("MODEL_TIMEOUTS"):
+            node_timeouts.update(
+                (key, float(value)) for key, value in config.items("MODEL_TIMEOUTS")
+            )
+        return cls(
+            default_model=llm_config["model"],
+            node_models=node_models,
+            small_model=get_setting("MODELS", "small", SMALL_MODEL),
+            strong_model=get_setting("MODELS", "strong", STRONG_MODEL),
+            fallback_model=get_setting("MODELS", "fallback", SMALL_MODEL),
+            escalate_after=get_int_setting("MODELS", "escalate_after", 2),
+            timeout=get_float_setting("MODELS", "timeout", 60),
+            node_timeouts=node_timeouts,
+        )
+
+    def _resolve(self, name: str) -> str:
+        return {
+            "default": self.default_model,
+            "small": self.small_model,
+            "strong": self.strong_model,
+        }.get(name, name)
+
+    def model_for(self, node: str, failed_fixes: int = 0) -> str:
+        if node in FIXER_NODES and self.escalate_after and failed_fixes >= self.escalate_after:
+            return self.strong_model
+        return self._resolve(self.node_models.get(node, "default"))
+
+    def timeout_for(self, node: str) -> float:
+        return self.node_timeouts.get(node, self.timeout)
+
+    def _chat_model(self, model: str, timeout: float) -> ChatOpenAI:
+        if (model, timeout) not in self._models:
+            self._models[(model, timeout)] = ChatOpenAI(
+                model=model,
+                timeout=timeout or None,
+                max_retries=1,
+                callbacks=[self.stats_handler, self.trace_handler],
+            )
+        return self._models[(model, timeout)]
+
+    def for_node(self, node: str, failed_fixes: int = 0) -> RoutedModel:
+        model = self.model_for(node, failed_fixes)
+        if model != self._resolve(self.node_models.get(node, "default")):
+            logger.info("Escalating %s to %s after %d failed fixes", node, model, failed_fixes)
+        # The fallback gets the same time: it answers the same (possibly large) request
+        timeout = self.timeout_for(node)
+        fallback = None
+        if self.fallback_model and self.fallback_model != model:
+            fallback = self._chat_model(self.fallback_model, timeout)
+        return RoutedModel(self._chat_model(model, timeout), fallback)
+
+    def stats(self) -> Dict[str, ModelStats]:
+        return dict(self.stats_handler.stats)
+
+    def log_stats(self):
+        for model, stats in sorted(self.stats().items()):
+            logger.info(
+                "Model %s: %d calls, %.1fs mean latency, %d errors (%d timeouts), "
+                "%d prompt (%d cached, %.0f%%) / %d completion tokens, $%.4f",
+                model,
+                stats.calls,
+                stats.mean_latency,
+                stats.errors,
+                stats.timeouts,
+                stats.prompt_tokens,
+                stats.cached_tokens,
+                stats.cache_hit_rate * 100,
+                stats.completion_tokens,
+                stats.cost,
+            )
+
+
+_model_router: Optional[ModelRouter] = None
+
+
+def get_model_router() -> ModelRouter:
+    global _model_router
+    if _model_router is None:
+        _model_router = ModelRouter.from_settings()
+    return _model_router
@@ -1,30 +1,94 @@
 import os
+import logging
+from functools import lru_cache
+from typing import Dict, List
+
 import chainlit as cl
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
-from langchain_core.runnables import RunnableConfig
-from langgraph.graph import StateGraph, END
-from langgraph.pregel import GraphRecursionError
 
 # own imports
-from llm_models.openai_models import get_openai_llm
-from agents import (
-    code_generator_agent,
-    write_code_to_file_agent,
-    execute_code_agent,
-    debug_code_agent,
-    read_me_agent,
-    dockerizer_agent,
-    execute_docker_agent,
-    debug_code_execution_agent,
-    debug_docker_execution_agent,
-    log_docker_container_errors,
+from agents import release_docker_resources
+from executor import forget_snapshot_store, get_lifecycle_manager
+from graph import build_graph, run_requirement
+from sessions import (
+    SessionRecord,
+    get_session_store,
+    remove_session_files,
+    session_workspace,
 )
-from schemas import GraphState
+from utils.events import BatchingEventSink, Event, current_event_sink
+from utils.log_pipeline import setup_logging
+from utils.settings import get_float_setting, get_int_setting
 
 load_dotenv()
-llm = get_openai_llm()
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Remove containers, networks and images left behind by a previous run of the server
+# (the first worker to start does it, see [EXECUTION] orphan_lock)
+get_lifecycle_manager().collect_orphans()
+
+
+# Events of the agents are shown as chat messages, in batches sent in the background
+class ChainlitEventSink(BatchingEventSink):
+    """
+    One chat message per batch: its files as collapsible elements, its errors and
+    status lines as text. Graph nodes are shown as steps, updated when they are done.
+
+    [UI]
+    flush_interval = 0.3
+    max_batch = 50
+    """
+
+    def __init__(self):
+        super().__init__(
+            get_float_setting("UI", "flush_interval", 0.3),
+            get_int_setting("UI", "max_batch", 50),
+        )
+        self._steps: Dict[str, cl.Step] = {}
+
+    async def _show_step(self, event: Event):
+        step = self._steps.get(event.name)
+        if step is None:
+            step = cl.Step(name=event.name, type="run")
+            step.output = event.content
+            await step.send()
+        else:
+            step.output = event.content
+            await step.update()
+        if event.content == "running":
+            self._steps[event.name] = step
+        else:
+            self._steps.pop(event.name, None)
+
+    async def deliver(self, events: List[Event]):
+        steps = [event for event in events if event.kind == "step"]
+        for index, event in enumerate(steps):
+            # A node that started and ended within the batch is shown once, done
+            if event.content == "running" and any(
+                later.name == event.name for later in steps[index + 1 :]
+            ):
+                continue
+            await self._show_step(event)
+
+        files = [event for event in events if event.kind == "code"]
+        texts = [event.content for event in events if event.kind not in ("code", "step")]
+        if files:
+            texts.append("Files: " + ", ".join(event.name or "code" for event in files))
+        if not texts:
+            return
+        await cl.Message(
+            content="\n\n".join(texts),
+            elements=[
+                cl.Text(
+                    name=event.name or "code",
+                    content=event.content,
+                    language=event.language,
+                    display="side",
+                )
+                for event in files
+            ],
+        ).send()
 
 
 # Streamlit when starting the chat
@@ -35,6 +99,17 @@ async def on_chat_start():
     ).send()
 
 
+# Remove everything the session created when the chat ends
+@cl.on_chat_end
+async def on_chat_end():
+    session_id = cl.user_session.get("id")
+    await release_docker_resources(session_id, end_session=True)
+    get_session_store().delete(session_id)
+    # The session's project, tests and workspace snapshots
+    forget_snapshot_store(session_workspace(session_id)[0])
+    remove_session_files(session_id)
+
+
 # Define the paths.
 search_path = os.path.join(os.getcwd(), "generated")
 file_path = os.path.join(search_path, "src")
@@ -47,175 +122,53 @@ if not os.path.exists(search_path):
     os.mkdir(os.path.join(search_path, "test"))
 
 
-# Create the graph.
-workflow = StateGraph(GraphState)
-
-
-# generate code from user input
-async def create_code_f(state: GraphState):
-    return await code_generator_agent(state, llm)
-
-
-# save generated code to file
-def write_code_to_file_f(state: GraphState):
-    return write_code_to_file_agent(state, file_path)
-
-
-# execute code from folder
-async def execute_code_f(state: GraphState):
-    return await execute_code_agent(state, file_path)
-
-
-# execute docker from folder
-async def execute_docker_f(state: GraphState):
-    return await execute_docker_agent(state, file_path)
-
-
-# debug codes if error occurs
-async def debug_code_f(state: GraphState):
-    return await debug_code_agent(state, llm)
-
-
-# debug docker if error occurs in docker
-async def debug_docker_f(state: GraphState):
-    return await debug_docker_execution_agent(state, llm, file_path)
-
-
-# debug code used in docker if error occurs
-async def debug_code_docker_f(state: GraphState):
-    return await debug_code_execution_agent(state, llm, file_path)
-
-
-# log docker errors after debugging errors in the code
-async def log_docker_errors_f(state: GraphState):
-    return await log_docker_container_errors(state)
-
-
-# create readme and developer files
-async def read_me_f(state: GraphState):
-    return await read_me_agent(state, llm, file_path)
-
-
-# generate dockerfile and docker-compose file
-# TODO:: start docker etc.
-async def dockerize_f(state: GraphState):
-    return await dockerizer_agent(state, llm, file_path)
-
-
-# detirmine if we should end (success) or debug (error)
-def decide_to_end(state: GraphState):
-    print(f"\nENTERING DECIDE TO END FUNCTION")
-    print(f"iterations: {state['iterations']}")
-    print(f"error: {state['error']}")
-
-    error_message = state["error"]
-
-    if error_message:
-        # Check if too many iterations have occurred
-        if state["iterations"] >= 3:
-            print("\nToo many iterations! Ending the process.")
-            return "end"
-
-        # this is used to determ which debugging approach to take
-        error_type = error_message.type
-
-        print("Deciding which debugging approach to take")
-
-        # Determine if the error is related to Docker or the code inside the container
-        if error_type == "Docker Configuration Error":
-            return "debug_docker"
-        elif error_type == "Docker Execution Error":
-            return "debug_code"
-
-        return "debugger"
-    else:
-        return "readme"
-
-
-# Add the node to the graph.
-# image from graph flow is saved in images/graphs/graph_flow.png
-workflow.add_node("programmer", create_code_f)
-workflow.add_node("saver", write_code_to_file_f)
-workflow.add_node("dockerizer", dockerize_f)
-# workflow.add_node("executer", execute_code_f) <- replaced with execute_docker_f
-workflow.add_node("executer_docker", execute_docker_f)
-workflow.add_node("debugger", debug_code_f)
-workflow.add_node("debug_docker", debug_docker_f)
-workflow.add_node("debug_code", debug_code_docker_f)
-workflow.add_node("log_docker_errors", log_docker_errors_f)
-workflow.add_node("readme", read_me_f)
-
-# add the edge to the graph
-workflow.add_edge("programmer", "saver")
-workflow.add_edge("saver", "dockerizer")
-# workflow.add_edge("dockerizer", "executer")
-workflow.add_edge("dockerizer", "executer_docker")
-workflow.add_edge("debugger", "saver")
-workflow.add_edge("debug_docker", "executer_docker")
-workflow.add_edge("debug_code", "log_docker_errors")
-workflow.add_edge("readme", END)
-
-workflow.add_conditional_edges(
-    source="executer_docker",
-    path=decide_to_end,
-    path_map={
-        "readme": "readme",  # Transition to the README node if `decide_to_end` returns "readme"
-        "debugger": "debugger",  # General debugger transition (if needed)
-        "debug_docker": "debug_docker",  # Transition to Docker debugging if a Docker Error is detected
-        "debug_code": "debug_code",  # Transition to code debugging if a Docker Execution Error is detected
-        "end": END,  # Transition to the END node if too many iterations or another end condition is met
-    },
-)
-#Used after code changes been made and we want to log errors again
-workflow.add_conditional_edges(
-    source="log_docker_errors",
-    path=decide_to_end,
-    path_map={
-        "readme": "readme",  # Transition to the README node if `decide_to_end` returns "readme"
-        "debugger": "debugger",  # General debugger transition (if needed)
-        "debug_docker": "debug_docker",  # Transition to Docker debugging if a Docker Error is detected
-        "debug_code": "debug_code",  # Transition to code debugging if a Docker Execution Error is detected
-        "end": END,  # Transition to the END node if too many iterations or another end condition is met
-    },
-)
-
-
-# set start node
-workflow.set_entry_point("programmer")
-
 # Create the app and run it
-app = workflow.compile()
+app = build_graph(file_path, test_file)
 # create the image of the graph
 app.get_graph().draw_mermaid_png(output_file_path="images/graphs/graph_flow.png")
 
 
+# Graph of a session's workspace, compiled once per worker
+@lru_cache(maxsize=64)
+def session_graph(workspace: str, test_path: str):
+    os.makedirs(workspace, exist_ok=True)
+    os.makedirs(test_path, exist_ok=True)
+    return build_graph(workspace, test_path)
+
+
 @cl.on_message  # this function will be called every time a user inputs a message in the UI
 async def main(message: cl.Message):
-    print(message.content)
-    # amount of steps to run (node -> step), so no infinite loop will be created by accident
-    # TODO: use iterations instread of steps??
-    config = RunnableConfig(recursion_limit=20)
-    # first invoke should have something to add to the state
-
+    # Example requirements:
+    # "Simple website about bengal cats with html, css and javascript files. If images used, use some placeholder images."
+    # "simple C# hello world program, prints hello word"
+    # "simple NODEJS hello world program, prints hello word"
+    # "simple python hello world program, prints hello world"
+    # "complicated Nodejs hello world program"
+    # "Python hello world program, print 'Hello, World!' to the console, make error in the code"
+    event_sink = ChainlitEventSink()
+    current_event_sink.set(event_sink)
+    session_id = cl.user_session.get("id")
+
+    # The session's project may have been created by another worker
+    sessions = get_session_store()
+    record = sessions.get(session_id)
+    if record is None:
+        record = SessionRecord(session_id, *session_workspace(session_id))
+    # Follow-ups edit the session's project instead of generating a new one
     try:
-        results = await app.ainvoke(
-            {
-                "messages": [
-                    HumanMessage(
-                        content=message.content
-                        # content="Simple website about bengal cats with html, css and javascript files. If images used, use some placeholder images."
-                        # content="simple C# hello world program, prints hello word"
-                        # content="simple NODEJS hello world program, prints hello word"
-                        # content="simple python hello world program, prints hello world"
-                        # content="complicated Nodejs hello world program"
-                        # content="Python hello world program, print 'Hello, World!' to the console, make error in the code"
-                    )
-                ],
-                "iterations": 0,
-            },
-            config=config,
+        outcome = await run_requirement(
+            session_graph(record.workspace, record.test_path),
+            message.content,
+            session_id,
+            previous_state=record.state,
         )
-    except GraphRecursionError as e:
-        print(f"GraphRecursionError: {e}")
+    finally:
+        # Show what is still queued before the run is reported as done
+        await event_sink.close()
+    if outcome.state:
+        record.state = outcome.state
+        record.project_name = get_lifecycle_manager().project_name(session_id)
+        sessions.put(record)
+    logger.info("Session store: %s", sessions.stats())
 
     await cl.Message(content="done!").send()
@@ -1,6 +1,9 @@
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import SystemMessage
 
+# Static instructions come first and variable content last in every template, so the
+# provider can reuse its cached prefix; render them with prompts.rendering.render_prompt.
+
 CODE_GENERATOR_AGENT_PROMPT = ChatPromptTemplate.from_template(
     """**Role**: You are an expert software programmer with deep knowledge of various programming languages, frameworks, and package management.
 **Task**: Your task is to generate all the necessary code and configuration files for the project based on the specified requirements. This includes creating dependency files (e.g., `requirements.txt` for Python, `package.json` for Node.js) that use the latest versions of libraries/packages while ensuring compatibility with each other and the project type.
@@ -18,6 +21,69 @@ CODE_GENERATOR_AGENT_PROMPT = ChatPromptTemplate.from_template(
 {requirement}"""
 )
 
+CODE_ADAPTER_AGENT_PROMPT = ChatPromptTemplate.from_template(
+    """**Role**: You are an expert software programmer with deep knowledge of various programming languages, frameworks, and package management.
+**Task**: Your task is to generate all the necessary code and configuration files for the project based on the specified requirements. A previous project with a similar requirement was built and ran successfully; it is given below as a reference.
+**Instructions**:
+1. **Compare**: Identify what the new requirement asks for that differs from the reference requirement.
+2. **Reuse**: Keep the files, structure, dependency versions and execution command of the reference project wherever they still fit the new requirement.
+3. **Adapt**: Change, add or remove only what is needed to meet the new requirement.
+4. **Dependency Management (CRITICAL)**: Keep dependency files consistent with the code. If no dependencies are needed, do not generate dependency files.
+5. **File Creation**: Create only the files and folders that are essential for the project. Do not create any empty files or folders.
+*REFERENCE REQUIREMENT*
+{reference_requirement}
+*REFERENCE PROJECT*
+{reference_code}
+*REQUIREMENT*
+{requirement}"""
+)
+
+CODE_PLANNER_AGENT_PROMPT = ChatPromptTemplate.from_template(
+    """**Role**: You are an expert software architect with deep knowledge of various programming languages, frameworks, and package management.
+**Task**: Plan the project for the specified requirement. Do not write the code: every file will be written separately by another programmer who only sees this plan, so the plan must let the files work together.
+**Instructions**:
+1. **Understand and Clarify**: Fully comprehend the task and select the correct programming language and framework based on the requirement.
+2. **Files**: List every file the project needs, dependency files included (e.g., `requirements.txt` for Python, `package.json` for Node.js). Do not plan empty files or folders. Mark exactly one file as the executable file.
+3. **Interfaces (CRITICAL)**: For every file, state precisely what it exposes and what it uses from the other files: module and function names with their parameters and return values, classes, routes, HTML element ids, JSON keys. For dependency files, list the packages with their **latest stable, mutually compatible versions**.
+4. **Execution**: Give the command that runs the executable file.
+*REQUIREMENT*
+{requirement}"""
+)
+
+FILE_GENERATOR_AGENT_PROMPT = ChatPromptTemplate.from_template(
+    """**Role**: You are an expert software programmer with deep knowledge of various programming languages, frameworks, and package management.
+**Task**: Write the complete content of one file of a planned project. The other files are written at the same time by other programmers following the same plan.
+**Instructions**:
+1. **Follow the Plan**: Implement exactly the interface planned for this file, and use the other files only through their planned interfaces.
+2. **Complete Code**: Write the whole file, with no placeholders or omitted parts. Do not change the filename.
+3. **Dependency Files**: Include exactly the packages and versions listed in the plan.
+*REQUIREMENT*
+{requirement}
+*PROJECT PLAN*
+{plan}
+*FILE TO WRITE*
+{file}"""
+)
+
+CODE_EDITOR_AGENT_PROMPT = ChatPromptTemplate.from_template(
+    """**Role**: You are an expert software programmer maintaining an existing project.
+**Task**: Apply the change request to the project by changing as few files as possible.
+**Instructions**:
+1. **Understand the Project**: The project's files are listed with their descriptions; the content of the files relevant to the change is given in full.
+2. **Minimal Change**: Change only what the change request needs. Keep the names, structure, dependency versions and coding style of the project.
+3. **Complete Files**: Return every changed or added file with its complete new content. Do not return files that did not change.
+4. **Dependency Management**: If the change needs a new package, add it to the project's dependency file with its **latest stable version** compatible with the other packages.
+5. **Large Files**: Files starting with an `[artifact ...]` line are too large to show and only their beginning is given. Do not return them.
+*PROJECT*
+{project}
+*FILES*
+{files}
+*RELEVANT FILE CONTENTS*
+{relevant_code}
+*CHANGE REQUEST*
+{change_request}"""
+)
+
 CODE_FIXER_AGENT_PROMPT = ChatPromptTemplate.from_template(
     """**Role**: You are an expert software programmer specializing in debugging and refactoring code.
 **Task**: As a programmer, you are required to fix the provided code. The code contains errors that need to be identified and corrected. Use a Chain-of-Thought approach to diagnose the problem, propose a solution, and then implement the fix.
@@ -29,12 +95,44 @@ CODE_FIXER_AGENT_PROMPT = ChatPromptTemplate.from_template(
 5. **Code Fixing**: Implement the solution by modifying the provided code to eliminate the error and enhance functionality.
 6. **Dependency Management**: If changes to dependency files are required (e.g., `requirements.txt`, `package.json`), update them to include the **latest stable versions** of necessary packages while ensuring they are **compatible with each other** and the project.
 7. **Testing Considerations**: Suggest or implement test cases to ensure that the fix works correctly.
+8. **Large Files**: Files starting with an `[artifact ...]` line are too large to show and only their beginning is given. Fix the other files instead.
+9. **Generated Tests**: When tests failed, the tests that were run are given under *Tests*. They check the requirement: fix the project's code, not the tests.
 **Original Code**:
 {original_code}
 **Error Message**:
-{error_message}"""
+{error_message}
+**Tests**:
+{tests}"""
+)
+
+TEST_GENERATOR_AGENT_PROMPT = ChatPromptTemplate.from_template(
+    """**Role**: You are an expert software tester.
+**Task**: Write automated tests that check the project below meets its requirement.
+**Instructions**:
+1. **Runner**: Use the test runner described under *RUNNER*.
+2. **Scope**: Test the behaviour asked for in the requirement through the project's functions and modules. Do not test private details and do not start servers or wait for user input.
+3. **Independence**: Every test must run on its own and in parallel with the others. Do not share files or global state between tests.
+4. **Size**: Write a small number of focused tests that run in a few seconds.
+*REQUIREMENT*
+{requirement}
+*PROJECT*
+{code}
+*RUNNER*
+{runner_instructions}"""
 )
 
+# How the tests are run, per runtime
+TEST_RUNNER_INSTRUCTIONS = {
+    "python": (
+        "The tests are run with pytest from the project root, with the project root on the import path. "
+        "Name the files `test_*.py` and import the project's modules by their module name."
+    ),
+    "node": (
+        "The tests are run with the built-in `node --test` runner from a `tests_generated` folder in the project root. "
+        "Name the files `*.test.js`, use `node:test` and `node:assert` only, and load the project's files from `../<filename>` with the same module system as the project (`import` when package.json sets `\"type\": \"module\"`, `require` otherwise)."
+    ),
+}
+
 README_DEVELOPER_WRITER_AGENT_PROMPT = ChatPromptTemplate(
     [
         (
@@ -46,11 +144,12 @@ The developer.md file should contain detailed information about the project stru
 Generate the content for both files based on the project requirements and codebase.
 **Instructions**:
 1. **Understand the Project**: Review the project requirements and codebase to understand the software.
-2. **Code Files**: The following are the code files and their descriptions: {code_descriptions}
+2. **Code Files**: The code files and their descriptions are given after the conversation.
 3. **README.md Creation**: Write a comprehensive README.md file that includes project overview, installation steps, usage examples, and other relevant information.
 4. **developer.md Creation**: Develop a detailed developer.md file that provides information on project structure, code organization, architecture, running and deploying the project, and other technical details.""",
         ),
         MessagesPlaceholder(variable_name="messages"),
+        ("human", "**Code Files**: {code_descriptions}"),
     ],
 )
 
@@ -146,9 +245,7 @@ DOCKERFILE_GENERATOR_AGENT_PROMPT = ChatPromptTemplate.from_messages(
 **Role**: You are a DevOps engineer tasked with generating an optimized Dockerfile and Docker Compose configuration for a software project. Your objective is to create a setup that efficiently handles dependencies, builds the container, and integrates the Docker Compose `watch` feature for handling code changes.
 
 ### Key Project Information:
-- **Executable File**: `{executable_file_name}`
-- **Project Files**: The following files and directories represent the entire project structure. **IMPORTANT! Use only these files** for Dockerfile and Docker Compose setup:
-  {code_descriptions}
+The executable file and the project files are given after the conversation. The project files represent the entire project structure. **IMPORTANT! Use only these files** for Dockerfile and Docker Compose setup.
 
 ### Task Overview:
 
@@ -222,6 +319,12 @@ DOCKERFILE_GENERATOR_AGENT_PROMPT = ChatPromptTemplate.from_messages(
 """,
         ),
         MessagesPlaceholder(variable_name="messages"),
+        (
+            "human",
+            """- **Executable File**: `{executable_file_name}`
+- **Project Files**:
+  {code_descriptions}""",
+        ),
     ],
 )
 
@@ -238,13 +341,7 @@ DEBUG_DOCKER_FILES_AGENT_PROMPT = ChatPromptTemplate.from_messages(
 3. **Ensuring the container builds, runs, and handles live updates correctly after resolving the issues**.
 
 ### Provided Information:
-- **Error Messages**: {error_messages}
-
-- **Current Dockerfile**: 
-{dockerfile}
-
-- **Current compose.yaml**:
-{docker_compose}
+The error messages, the current Dockerfile and the current compose.yaml are given after the chat history.
 
 ### Debugging Process:
 1. **Analyze the Error Messages**:
@@ -277,6 +374,16 @@ DEBUG_DOCKER_FILES_AGENT_PROMPT = ChatPromptTemplate.from_messages(
 """,
         ),
         MessagesPlaceholder(variable_name="messages"),
+        (
+            "human",
+            """- **Error Messages**: {error_messages}
+
+- **Current Dockerfile**:
+{dockerfile}
+
+- **Current compose.yaml**:
+{docker_compose}""",
+        ),
     ],
 )
 
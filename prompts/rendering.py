@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+# own imports
+from utils.settings import get_int_setting
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(values: List[Tuple[str, object]]) -> str:
+    # Variables are formatted with str(), so equal strings render equal messages
+    digest = hashlib.sha256()
+    for name, value in values:
+        digest.update(name.encode())
+        digest.update(b"\0")
+        digest.update(str(value).encode("utf-8", "surrogatepass"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class PromptRenderer:
+    """
+    Renders chat templates into messages, message by message.
+
+    Messages without variables are rendered once per template and reused as the same
+    objects, so the instructions at the start of every request are byte-identical and
+    the provider's prefix cache can serve them. Messages with variables are memoized
+    on the values they use, so a retry with unchanged code or errors skips formatting.
+    Chat history placeholders are passed through as they are.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[tuple, List[BaseMessage]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: tuple) -> Optional[List[BaseMessage]]:
+        with self._lock:
+            messages = self._cache.get(key)
+            if messages is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return messages
+
+    def _put(self, key: tuple, messages: List[BaseMessage]):
+        with self._lock:
+            self._cache[key] = messages
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def render(self, template: ChatPromptTemplate, **variables) -> List[BaseMessage]:
+        messages: List[BaseMessage] = []
+        for index, part in enumerate(template.messages):
+            if isinstance(part, MessagesPlaceholder):
+                history = variables.get(part.variable_name)
+                if history is None and not part.optional:
+                    raise KeyError(part.variable_name)
+                messages.extend(history or [])
+                continue
+            if isinstance(part, BaseMessage):
+                messages.append(part)
+                continue
+            names = sorted(part.input_variables)
+            key = (id(template), index, _digest([(name, variables[name]) for name in names]))
+            rendered = self._get(key)
+            if rendered is None:
+                rendered = part.format_messages(**{name: variables[name] for name in names})
+                self._put(key, rendered)
+            messages.extend(rendered)
+        return messages
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._cache)}
+
+
+_prompt_renderer: Optional[PromptRenderer] = None
+
+
+def get_prompt_renderer() -> PromptRenderer:
+    """
+    [PROMPT_CACHE]
+    max_entries = 256
+    """
+    global _prompt_renderer
+    if _prompt_renderer is None:
+        _prompt_renderer = PromptRenderer(get_int_setting("PROMPT_CACHE", "max_entries", 256))
+    return _prompt_renderer
+
+
+def render_prompt(template: ChatPromptTemplate, **variables) -> List[BaseMessage]:
+    """Messages of `template`, static prefix first; invoke the model with them."""
+    return get_prompt_renderer().render(template, **variables)
@@ -50,6 +50,73 @@ class Codes(BaseModel):
     )
 
 
+# Schema for one file of a project plan
+class PlannedFile(BaseModel):
+    """
+    Represents a file of the project, planned before its code is written.
+    """
+
+    filename: str = Field(
+        description="The name of the file, with its path relative to the project root."
+    )
+    description: str = Field(
+        description="What this file does and its purpose in the project."
+    )
+    programming_language: str = Field(
+        description="The programming language (or format, e.g. JSON) of the file."
+    )
+    executable_code: bool = Field(
+        description=(
+            "Indicates whether this file is the main executable file required for the "
+            "program to run. There should only be one executable file in the project structure."
+        )
+    )
+    interface: str = Field(
+        description=(
+            "What this file exposes to the other files and what it uses from them: exported "
+            "functions, classes and their signatures, routes, element ids, JSON keys or "
+            "dependency names and versions."
+        )
+    )
+
+
+# Schema for the plan of a whole project
+class ProjectPlan(BaseModel):
+    """
+    Represents the structure of a project: its files and how they fit together.
+    """
+
+    description: str = Field(
+        description=(
+            "A detailed description of the project, how the files work together "
+            "and the dependencies between them."
+        )
+    )
+    files: List[PlannedFile] = Field(
+        description="Every file of the project, dependency files included."
+    )
+    execution_command: str = Field(
+        description="The command used to execute the main executable file in the project."
+    )
+
+
+# Schema for a change to an existing project
+class ProjectEdit(BaseModel):
+    """
+    Represents the files changed or added to apply a change request to a project.
+    """
+
+    description: str = Field(
+        description="A short description of the change that was made."
+    )
+    files: List[Code] = Field(
+        description=(
+            "Only the files that were changed or added, each with its complete new content. "
+            "Files that did not change must not be listed."
+        )
+    )
+
+
 class FixedCode(BaseModel):
     """
     Represents an individual piece of code generated as part of a programming project.
@@ -74,6 +141,20 @@ class FixedCode(BaseModel):
     )
 
 
+# Schema for generated tests of a project
+class TestSuite(BaseModel):
+    """
+    Represents the test files written for a generated project.
+    """
+
+    description: str = Field(
+        description="A short description of what the tests check."
+    )
+    tests: List[Code] = Field(
+        description="A list containing all the test files."
+    )
+
+
 # Schema for generated project Readme.md and Developer.md files
 class Documentation(BaseModel):
     """
@@ -158,3 +239,12 @@ class GraphState(TypedDict):
     docker_container_name: str  # Name of the Docker container
     executable_file_name: str  # What is the name of the executable file
     iterations: int  # Number of tries
+    session_id: str  # Chat session, owner of the Docker resources
+    reference_docker_files: Optional[DockerFile]  # Docker files of a reused project
+    pending_fix: Optional[dict]  # Known or learned fix waiting for its verification
+    error_history: List[str]  # Error signature of every execution ('' for success)
+    tests: Optional[TestSuite]  # Generated tests, kept between fix iterations
+    tested_iteration: Optional[int]  # Iteration the tests last ran for
+    snapshots: List[dict]  # Workspace snapshots of the run and how their execution went
+    changed_files: List[str]  # Files the last code fix rewrote, synced into the running container
+    execution_backend: Optional[str]  # Backend that last ran the project (see executor.backends)
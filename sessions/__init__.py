@@ -0,0 +1,27 @@
+from .store import (
+    SessionRecord,
+    SessionStore,
+    MemorySessionStore,
+    SqliteSessionStore,
+    RedisSessionStore,
+    TieredSessionStore,
+    dump_state,
+    load_state,
+    get_session_store,
+    session_workspace,
+    remove_session_files,
+)
+
+__all__ = [
+    "SessionRecord",
+    "SessionStore",
+    "MemorySessionStore",
+    "SqliteSessionStore",
+    "RedisSessionStore",
+    "TieredSessionStore",
+    "dump_state",
+    "load_state",
+    "get_session_store",
+    "session_workspace",
+    "remove_session_files",
+]
@@ -0,0 +1,374 @@
+import abc
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+# own imports
+from schemas import Codes, DockerFiles, ErrorMessage, TestSuite
+from utils.settings import get_int_setting, get_setting
+
+logger = logging.getLogger(__name__)
+
+# Graph state fields that outlive a run; pending fixes and the like are per run. So are
+# snapshots: the best one is restored at the end of its run, on the worker running it,
+# and the files it changed are kept (changed_files) for the next run to sync or rebuild
+MODEL_FIELDS = {
+    "codes": Codes,
+    "docker_files": DockerFiles,
+    "error": ErrorMessage,
+    "tests": TestSuite,
+}
+PLAIN_FIELDS = (
+    "docker_image_name",
+    "docker_container_name",
+    "executable_file_name",
+    "iterations",
+    "error_history",
+    "tested_iteration",
+    "execution_backend",
+    "changed_files",
+)
+MESSAGE_TYPES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+
+
+def dump_state(state: dict) -> dict:
+    """JSON-ready copy of the persistent part of a graph state."""
+    data = {}
+    for key in MODEL_FIELDS:
+        if state.get(key) is not None:
+            data[key] = state[key].dict(exclude_none=True)
+    for key in PLAIN_FIELDS:
+        if state.get(key) is not None:
+            data[key] = state[key]
+    data["messages"] = [
+        [message.type, message.content] for message in state.get("messages") or []
+    ]
+    return data
+
+
+def load_state(data: dict) -> dict:
+    state = {key: data[key] for key in PLAIN_FIELDS if key in data}
+    for key, model in MODEL_FIELDS.items():
+        if data.get(key) is not None:
+            state[key] = model.parse_obj(data[key])
+    state["messages"] = [
+        MESSAGE_TYPES.get(kind, HumanMessage)(content=content)
+        for kind, content in data.get("messages") or []
+    ]
+    return state
+
+
+@dataclass
+class SessionRecord:
+    """
+    What a chat session left behind: its last graph state, where its project lives
+    and the Docker resources running it.
+
+    Attributes:
+        workspace / test_path: Project and test directories of the session.
+        project_name: Compose project of the session's containers.
+        version: Incremented by the store on every write.
+    """
+
+    session_id: str
+    workspace: str
+    test_path: str
+    state: dict = field(default_factory=dict)
+    project_name: str = ""
+    version: int = 0
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def container_name(self) -> Optional[str]:
+        return self.state.get("docker_container_name")
+
+    @property
+    def image_name(self) -> Optional[str]:
+        return self.state.get("docker_image_name")
+
+    def to_bytes(self) -> bytes:
+        """Compact form: minified JSON, compressed (code repeats in the messages)."""
+        data = {
+            "session_id": self.session_id,
+            "workspace": self.workspace,
+            "test_path": self.test_path,
+            "project_name": self.project_name,
+            "updated_at": self.updated_at,
+            "state": dump_state(self.state),
+        }
+        return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"), 6)
+
+    @classmethod
+    def from_bytes(cls, payload: bytes, version: int = 0) -> "SessionRecord":
+        data = json.loads(zlib.decompress(payload))
+        data["state"] = load_state(data["state"])
+        return cls(version=version, **data)
+
+
+class SessionStore(abc.ABC):
+    """Session records by session id."""
+
+    @abc.abstractmethod
+    def get(self, session_id: str) -> Optional[SessionRecord]:
+        pass
+
+    @abc.abstractmethod
+    def put(self, record: SessionRecord) -> SessionRecord:
+        """Store the record with the next version, which is set on it and returned."""
+
+    @abc.abstractmethod
+    def delete(self, session_id: str):
+        pass
+
+    def version(self, session_id: str) -> Optional[int]:
+        """Version of the stored record, without loading it."""
+        record = self.get(session_id)
+        return record.version if record else None
+
+
+class MemorySessionStore(SessionStore):
+    """Records of the most recently used sessions, in this process."""
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._records: "OrderedDict[str, SessionRecord]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[SessionRecord]:
+        with self._lock:
+            record = self._records.get(session_id)
+            if record is not None:
+                self._records.move_to_end(session_id)
+            return record
+
+    def put(self, record: SessionRecord) -> SessionRecord:
+        with self._lock:
+            previous = self._records.get(record.session_id)
+            record.version = (previous.version if previous else 0) + 1
+        return self.remember(record)
+
+    def remember(self, record: SessionRecord) -> SessionRecord:
+        """Keep the record with the version it already has."""
+        with self._lock:
+            self._records[record.session_id] = record
+            self._records.move_to_end(record.session_id)
+            while len(self._records) > self.max_entries:
+                self._records.popitem(last=False)
+        return record
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._records.pop(session_id, None)
+
+
+class SqliteSessionStore(SessionStore):
+    """Records in a SQLite file (WAL mode), shared by the workers of one host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, version INTEGER NOT NULL, "
+                "updated_at REAL NOT NULL, data BLOB NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, session_id: str) -> Optional[SessionRecord]:
+        row = self._connection().execute(
+            "SELECT version, data FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return SessionRecord.from_bytes(row[1], row[0]) if row else None
+
+    def version(self, session_id: str) -> Optional[int]:
+        row = self._connection().execute(
+            "SELECT version FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, record: SessionRecord) -> SessionRecord:
+        record.updated_at = time.time()
+        payload = record.to_bytes()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT version FROM sessions WHERE session_id = ?", (record.session_id,)
+            ).fetchone()
+            record.version = (row[0] if row else 0) + 1
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, version, updated_at, data) "
+                "VALUES (?, ?, ?, ?)",
+                (record.session_id, record.version, record.updated_at, payload),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return record
+
+    def delete(self, session_id: str):
+        self._connection().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+
+class RedisSessionStore(SessionStore):
+    """Records in Redis (or a compatible server), shared by workers on several hosts."""
+
+    def __init__(self, url: str, prefix: str = "codegen:session:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("The redis package is needed for a redis:// session store") from e
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, session_id: str) -> Optional[SessionRecord]:
+        version, data = self.client.hmget(self.prefix + session_id, "version", "data")
+        return SessionRecord.from_bytes(data, int(version)) if data else None
+
+    def version(self, session_id: str) -> Optional[int]:
+        version = self.client.hget(self.prefix + session_id, "version")
+        return int(version) if version is not None else None
+
+    def put(self, record: SessionRecord) -> SessionRecord:
+        record.updated_at = time.time()
+        key = self.prefix + record.session_id
+        payload = record.to_bytes()
+        # Version and data change together
+        with self.client.pipeline() as pipeline:
+            pipeline.hincrby(key, "version", 1)
+            pipeline.hset(key, "data", payload)
+            record.version = pipeline.execute()[0]
+        return record
+
+    def delete(self, session_id: str):
+        self.client.delete(self.prefix + session_id)
+
+
+class TieredSessionStore(SessionStore):
+    """
+    In-process LRU in front of a shared store. A read only asks the shared store for
+    the record's version, and loads it only when another worker wrote it since, so a
+    session that keeps reaching the same worker never deserializes its state.
+    """
+
+    def __init__(self, local: MemorySessionStore, shared: Optional[SessionStore] = None):
+        self.local = local
+        self.shared = shared
+        self.local_hits = 0
+        self.shared_loads = 0
+        self.misses = 0
+
+    def get(self, session_id: str) -> Optional[SessionRecord]:
+        record = self.local.get(session_id)
+        if self.shared is None:
+            return record
+        version = self.shared.version(session_id)
+        if version is None:
+            self.misses += 1
+            if record is not None:
+                self.local.delete(session_id)
+            return None
+        if record is not None and record.version == version:
+            self.local_hits += 1
+            return record
+        record = self.shared.get(session_id)
+        if record is not None:
+            self.shared_loads += 1
+            self.local.remember(record)
+        return record
+
+    def put(self, record: SessionRecord) -> SessionRecord:
+        if self.shared is None:
+            return self.local.put(record)
+        return self.local.remember(self.shared.put(record))
+
+    def delete(self, session_id: str):
+        self.local.delete(session_id)
+        if self.shared is not None:
+            self.shared.delete(session_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "local_hits": self.local_hits,
+            "shared_loads": self.shared_loads,
+            "misses": self.misses,
+        }
+
+
+def _session_root(session_id: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "-", session_id or "local").strip("-") or "local"
+    return os.path.abspath(
+        os.path.join(get_setting("SESSIONS", "workspace", os.path.join("generated", "sessions")), slug)
+    )
+
+
+def session_workspace(session_id: str) -> Tuple[str, str]:
+    """
+    Project and test directories of a new session.
+
+    [SESSIONS]
+    workspace = generated/sessions
+    """
+    root = _session_root(session_id)
+    return os.path.join(root, "src"), os.path.join(root, "test")
+
+
+def remove_session_files(session_id: str):
+    """Remove the session's directory: its project, tests and workspace snapshots."""
+    root = _session_root(session_id)
+    if os.path.isdir(root):
+        shutil.rmtree(root, ignore_errors=True)
+        logger.info("Removed the files of session %s", session_id)
+
+
+def shared_store_from_url(url: str) -> Optional[SessionStore]:
+    """`sqlite:///path/to.db`, `redis://host:port/db`, or empty for none."""
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SqliteSessionStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore(url)
+    raise ValueError(f"Unknown session store: {url}")
+
+
+_session_store: Optional[TieredSessionStore] = None
+
+
+def get_session_store() -> TieredSessionStore:
+    """
+    [SESSIONS]
+    max_local = 128
+    shared = sqlite:///generated/sessions.db
+    """
+    global _session_store
+    if _session_store is None:
+        _session_store = TieredSessionStore(
+            MemorySessionStore(get_int_setting("SESSIONS", "max_local", 128)),
+            shared_store_from_url(
+                get_setting("SESSIONS", "shared", "sqlite:///generated/sessions.db")
+            ),
+        )
+    return _session_store
@@ -0,0 +1,37 @@
+from agents.agents import without_artifact_rewrites
+from schemas import Code, Codes
+from utils.artifacts import ArtifactStore, artifact_filenames
+
+
+def code(filename: str, content: str) -> Code:
+    return Code(
+        description="",
+        filename=filename,
+        executable_code=False,
+        code=content,
+        programming_language="",
+    )
+
+
+def test_large_files_are_stored_once_and_written_back(tmp_path):
+    store = ArtifactStore(str(tmp_path / "artifacts"), threshold_chars=10, excerpt_chars=4)
+    content = "line one\\nline two\\n"
+    reference = store.offload(content)
+    assert store.is_reference(reference)
+    assert reference.splitlines()[1] == "line"
+    assert store.offload(reference) == reference
+    assert store.offload("short") == "short"
+
+    target = tmp_path / "src" / "data.txt"
+    store.write(reference, str(target))
+    assert target.read_text(encoding="utf-8") == "line one\nline two\n"
+
+
+def test_llm_versions_of_stored_artifacts_are_dropped(tmp_path):
+    store = ArtifactStore(str(tmp_path), threshold_chars=10)
+    project = [code("main.py", "print(1)"), code("./data/questions.json", store.offload("x" * 20))]
+    assert artifact_filenames(project) == {"data/questions.json"}
+
+    state = {"codes": Codes(description="", codes=project, execution_command="")}
+    answer = [code("main.py", "print(2)"), code("data/questions.json", "[]")]
+    assert [c.filename for c in without_artifact_rewrites(state, answer)] == ["main.py"]
@@ -0,0 +1,149 @@
+import asyncio
+
+import pytest
+
+import executor.backends as backends
+from executor.backends import ExecutionJob, LocalSandboxBackend, memory_bytes, select_backend
+from executor.limits import ExecutionLimits
+from utils.docker_templates import RuntimeSpec
+
+# The sandbox only runs programs in a private root, which needs Linux user namespaces
+sandboxed = pytest.mark.skipif(
+    backends.BACKENDS["sandbox"].isolation_unavailable() is not None,
+    reason="the host does not allow the sandbox's namespaces",
+)
+
+
+def python_job(directory, source: str, requirements: str = "") -> ExecutionJob:
+    (directory / "main.py").write_text(source, encoding="utf-8")
+    (directory / "requirements.txt").write_text(requirements, encoding="utf-8")
+    return ExecutionJob(
+        str(directory),
+        "app",
+        "codegen-test",
+        ["main.py", "requirements.txt"],
+        runtime=RuntimeSpec("python", "main.py", ["requirements.txt"], ["python", "main.py"]),
+        limits=ExecutionLimits(run_timeout=20),
+    )
+
+
+@pytest.fixture
+def backend_setting(monkeypatch):
+    def configure(name: str):
+        monkeypatch.setattr(
+            backends, "get_setting", lambda section, key, fallback=None: name
+        )
+
+    return configure
+
+
+def test_memory_bytes():
+    assert memory_bytes("512m") == 512 * 1024 ** 2
+    assert memory_bytes("1g") == 1024 ** 3
+    assert memory_bytes("1048576") == 1048576
+    with pytest.raises(ValueError):
+        memory_bytes("lots")
+
+
+def test_select_backend_falls_back_to_heavier_backends(tmp_path, backend_setting, monkeypatch):
+    job = python_job(tmp_path, "print(1)\n", "requests\n")
+    backend_setting("sandbox")
+    monkeypatch.setattr(
+        backends.BACKENDS["container"], "supports", lambda job: "compose.yaml has 2 services"
+    )
+    # The sandbox can not install requests, the container backend can not run two services
+    assert select_backend(job).name == "compose"
+
+    monkeypatch.setattr(backends.BACKENDS["container"], "supports", lambda job: None)
+    assert select_backend(job).name == "container"
+
+
+def test_select_backend_with_an_unknown_backend(tmp_path, backend_setting):
+    backend_setting("kubernetes")
+    assert select_backend(python_job(tmp_path, "print(1)\n")).name == "compose"
+
+
+@sandboxed
+def test_sandbox_runs_programs_without_dependencies(tmp_path, backend_setting):
+    backend_setting("sandbox")
+    job = python_job(tmp_path, "print('hello')\n", "# no dependencies\n")
+    assert select_backend(job).name == "sandbox"
+
+    result = asyncio.run(LocalSandboxBackend().run(job))
+    assert result.backend == "sandbox"
+    assert result.exit_code == 0
+    assert result.logs.strip() == "hello"
+
+
+@sandboxed
+def test_sandbox_reports_failures_and_limits(tmp_path):
+    backend = LocalSandboxBackend()
+    # A failure without output on stderr is still reported by its exit code
+    job = python_job(tmp_path, "import sys\nsys.exit(3)\n")
+    result = asyncio.run(backend.run(job))
+    assert result.exit_code == 3
+    assert result.logs_stderr == ""
+
+    job = python_job(tmp_path, "data = bytearray(2 * 1024 ** 3)\n")
+    job.limits = ExecutionLimits(memory="64m", run_timeout=20)
+    result = asyncio.run(backend.run(job))
+    assert result.exit_code != 0
+    assert result.oom_killed
+
+    job = python_job(tmp_path, "while True:\n    pass\n")
+    job.limits = ExecutionLimits(run_timeout=1)
+    result = asyncio.run(backend.run(job))
+    assert result.timed_out
+
+
+@sandboxed
+def test_sandbox_runs_in_a_copy_of_the_tracked_files(tmp_path):
+    job = python_job(
+        tmp_path,
+        "import os\nopen('out.txt', 'w').write('x')\nprint(sorted(os.listdir('.')))\n",
+    )
+    (tmp_path / "untracked.txt").write_text("secret", encoding="utf-8")
+    result = asyncio.run(LocalSandboxBackend().run(job))
+    assert "untracked.txt" not in result.logs
+    assert "main.py" in result.logs
+    assert not (tmp_path / "out.txt").exists()
+
+
+@sandboxed
+def test_sandbox_only_sees_its_files_and_the_runtime(tmp_path):
+    (tmp_path / "secret").mkdir()
+    (tmp_path / "secret" / ".env").write_text("OPENAI_API_KEY=sk", encoding="utf-8")
+    (tmp_path / "app").mkdir()
+    job = python_job(
+        tmp_path / "app",
+        "import os\n"
+        f"print(os.path.exists({str(tmp_path / 'secret' / '.env')!r}))\n"
+        "print(os.getcwd(), sorted(os.listdir('/app')))\n"
+        "open('/usr/written', 'w')\n",
+    )
+    result = asyncio.run(LocalSandboxBackend().run(job))
+    assert result.logs.splitlines() == ["False", "/app ['main.py', 'requirements.txt']"]
+    # The runtime is read-only
+    assert "Read-only file system" in result.logs_stderr
+
+
+def test_sandbox_fails_closed_without_isolation(tmp_path, backend_setting, monkeypatch):
+    sandbox = LocalSandboxBackend()
+    sandbox._isolation_checked = True
+    sandbox._isolation = "unshare is not installed"
+    monkeypatch.setitem(backends.BACKENDS, "sandbox", sandbox)
+    monkeypatch.setattr(backends.BACKENDS["container"], "supports", lambda job: None)
+    backend_setting("sandbox")
+    job = python_job(tmp_path, "open('ran', 'w')\n")
+    assert select_backend(job).name == "container"
+
+    # Not even a direct run reaches the host
+    result = asyncio.run(sandbox.run(job))
+    assert result.build_returncode != 0
+    assert "unshare is not installed" in result.build_stderr
+    assert not (tmp_path / "ran").exists()
+
+
+def test_backends_must_implement_run():
+    with pytest.raises(TypeError):
+        backends.ExecutionBackend()
@@ -0,0 +1,46 @@
+from executor.build_context import order_manifests_first
+
+REQUIREMENTS = ["requirements.txt"]
+
+
+def test_install_moves_before_the_sources():
+    dockerfile = (
+        "FROM python:3.12-slim\nWORKDIR /app\nCOPY . .\n"
+        "RUN pip install -r requirements.txt\nCMD [\"python\", \"main.py\"]\n"
+    )
+    assert order_manifests_first(dockerfile, REQUIREMENTS) == (
+        "FROM python:3.12-slim\nWORKDIR /app\nCOPY requirements.txt ./\n"
+        "RUN pip install -r requirements.txt\nCOPY . .\nCMD [\"python\", \"main.py\"]\n"
+    )
+
+
+def test_env_and_arg_lines_move_up_with_the_install():
+    dockerfile = (
+        "FROM python:3.12-slim\nCOPY . /app/\nENV PIP_NO_CACHE_DIR=1\nARG EXTRA\n"
+        "RUN pip install -r /app/requirements.txt\n"
+    )
+    assert order_manifests_first(dockerfile, REQUIREMENTS) == (
+        "FROM python:3.12-slim\nENV PIP_NO_CACHE_DIR=1\nARG EXTRA\n"
+        "COPY requirements.txt /app/\nRUN pip install -r /app/requirements.txt\nCOPY . /app/\n"
+    )
+
+
+def test_other_instructions_between_copy_and_install_are_left_alone():
+    dockerfile = (
+        "FROM python:3.12-slim\nCOPY . .\nRUN apt-get update && apt-get install -y gcc\n"
+        "RUN pip install -r requirements.txt\n"
+    )
+    assert order_manifests_first(dockerfile, REQUIREMENTS) == dockerfile
+    dockerfile = "FROM node:20\nCOPY . .\nWORKDIR /srv\nRUN npm ci\n"
+    assert order_manifests_first(dockerfile, ["package.json"]) == dockerfile
+
+
+def test_dockerfiles_already_ordered_or_installing_the_sources_are_left_alone():
+    ordered = (
+        "FROM python:3.12-slim\nCOPY requirements.txt .\nRUN pip install -r requirements.txt\n"
+        "COPY . .\n"
+    )
+    assert order_manifests_first(ordered, REQUIREMENTS) == ordered
+    source_install = "FROM python:3.12-slim\nCOPY . .\nRUN pip install -e .\n"
+    assert order_manifests_first(source_install, REQUIREMENTS) == source_install
+    assert order_manifests_first(source_install, ["README.md"]) == source_install
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+import yaml
+
+import executor.worker as worker_module
+from executor.dispatcher import NoWorkerAvailable, WorkerPool
+from executor.protocol import ProtocolError
+from executor.worker import ExecutionWorker, is_loopback
+
+
+def pool_with(statuses: dict) -> WorkerPool:
+    pool = WorkerPool(list(statuses))
+
+    async def status(address):
+        return statuses[address]
+
+    pool.status = status
+    return pool
+
+
+def test_choose_prefers_the_least_loaded_worker():
+    pool = pool_with(
+        {
+            "a:1": {"capacity": 2, "active_jobs": 1, "images": []},
+            "b:1": {"capacity": 2, "active_jobs": 0, "images": []},
+        }
+    )
+    assert asyncio.run(pool.choose("app", "app:latest")) == "b:1"
+
+
+def test_choose_prefers_the_worker_with_the_image():
+    pool = pool_with(
+        {
+            "a:1": {"capacity": 4, "active_jobs": 2, "images": ["app:latest"]},
+            "b:1": {"capacity": 4, "active_jobs": 0, "images": []},
+        }
+    )
+    assert asyncio.run(pool.choose("app", "app:latest")) == "a:1"
+
+
+def test_choose_prefers_the_previous_placement_over_the_image():
+    pool = pool_with(
+        {
+            "a:1": {"capacity": 4, "active_jobs": 0, "images": ["app:latest"]},
+            "b:1": {"capacity": 4, "active_jobs": 1, "images": []},
+        }
+    )
+    pool.placements["app"] = "b:1"
+    assert asyncio.run(pool.choose("app", "app:latest")) == "b:1"
+
+
+def test_choose_skips_saturated_and_unreachable_workers():
+    pool = pool_with(
+        {
+            "a:1": {"capacity": 1, "active_jobs": 0, "images": ["app:latest"]},
+            "b:1": None,
+            "c:1": {"capacity": 2, "active_jobs": 1, "images": []},
+        }
+    )
+    pool.placements["app"] = "a:1"
+    # Dispatches not yet reported by the worker count as load
+    pool._in_flight["a:1"] = 1
+    assert asyncio.run(pool.choose("app", "app:latest")) == "c:1"
+
+
+def test_choose_without_reachable_workers():
+    pool = pool_with({"a:1": None})
+    with pytest.raises(NoWorkerAvailable):
+        asyncio.run(pool.choose("app", None))
+
+
+async def serving(worker: ExecutionWorker):
+    server = await asyncio.start_server(worker.handle_connection, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"127.0.0.1:{port}"
+
+
+def test_worker_errors_are_reported_to_the_dispatcher(tmp_path, monkeypatch):
+    async def broken_compose_up(*args, **kwargs):
+        raise yaml.YAMLError("mapping values are not allowed here")
+
+    monkeypatch.setattr(worker_module, "compose_up", broken_compose_up)
+    workspace = tmp_path / "src"
+    workspace.mkdir()
+    (workspace / "main.py").write_text("print(1)\n", encoding="utf-8")
+
+    async def scenario():
+        server, address = await serving(ExecutionWorker(str(tmp_path / "worker")))
+        async with server:
+            with pytest.raises(ProtocolError, match="YAMLError: mapping values"):
+                await WorkerPool([address]).run(str(workspace), "app")
+
+    asyncio.run(scenario())
+
+
+def test_worker_token(tmp_path):
+    async def scenario():
+        server, address = await serving(ExecutionWorker(str(tmp_path), token="secret"))
+        async with server:
+            return (
+                await WorkerPool([address]).status(address),
+                await WorkerPool([address], token="wrong").status(address),
+                await WorkerPool([address], token="secret").status(address),
+            )
+
+    without, wrong, right = asyncio.run(scenario())
+    assert without is None and wrong is None
+    assert right["capacity"] == 2
+
+
+def test_only_loopback_binds_go_without_a_token():
+    assert is_loopback("127.0.0.1") and is_loopback("::1") and is_loopback("localhost")
+    assert not is_loopback("0.0.0.0")
+    assert not is_loopback("worker.example.com")
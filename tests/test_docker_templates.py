@@ -0,0 +1,125 @@
+import yaml
+
+from schemas import Code, Codes, DockerFile
+from utils.docker_templates import detect_runtime, render_docker_files, scope_docker_files
+
+
+def project(files: dict, execution_command: str = "", executable: str = "") -> Codes:
+    return Codes(
+        description="",
+        codes=[
+            Code(
+                description="",
+                filename=filename,
+                executable_code=filename == executable,
+                code=content,
+                programming_language="",
+            )
+            for filename, content in files.items()
+        ],
+        execution_command=execution_command,
+    )
+
+
+def test_python_and_node_projects_use_the_templates():
+    spec = detect_runtime(
+        project({"main.py": "", "requirements.txt": "requests\n"}, "python main.py -v", "main.py")
+    )
+    assert (spec.runtime, spec.manifests, spec.command) == (
+        "python",
+        ["requirements.txt"],
+        ["python", "main.py", "-v"],
+    )
+    spec = detect_runtime(project({"index.js": "", "package.json": "{}"}, executable="index.js"))
+    assert (spec.runtime, spec.manifests, spec.command) == (
+        "node",
+        ["package.json"],
+        ["node", "index.js"],
+    )
+
+
+def test_other_stacks_fall_back_to_the_llm():
+    assert detect_runtime(project({"main.go": ""}, executable="main.go")) is None
+    assert detect_runtime(project({"main.py": ""})) is None
+    assert render_docker_files(project({"Main.java": ""}, executable="Main.java")) is None
+
+
+def test_scripts_expose_no_port():
+    files = render_docker_files(project({"main.py": "print(1)\n"}, executable="main.py"))
+    assert "EXPOSE" not in files.dockerfile
+    assert "ports" not in yaml.safe_load(files.docker_compose)["services"]["app"]
+
+
+def test_servers_expose_their_port():
+    flask = project(
+        {"app.py": "app.run(host='0.0.0.0', port=8080)\n", "requirements.txt": "Flask==3.0\n"},
+        executable="app.py",
+    )
+    files = render_docker_files(flask)
+    assert "EXPOSE 8080" in files.dockerfile
+    assert yaml.safe_load(files.docker_compose)["services"]["app"]["ports"] == ["8080"]
+
+    express = project(
+        {
+            "server.js": "app.listen(process.env.PORT || 4000)\n",
+            "package.json": '{"dependencies": {"express": "^4"}}',
+        },
+        executable="server.js",
+    )
+    assert detect_runtime(express).port == 4000
+    # The framework's default when the sources set none
+    fastapi = project(
+        {"main.py": "", "requirements.txt": "fastapi\nuvicorn\n"}, executable="main.py"
+    )
+    assert detect_runtime(fastapi).port == 8000
+
+
+def test_names_are_scoped_to_the_session():
+    codes = project({"main.py": ""}, executable="main.py")
+    first = render_docker_files(codes, project_name="codegen-a")
+    second = render_docker_files(codes, project_name="codegen-b")
+    assert first.docker_container_name.startswith("codegen-a-")
+    assert first.docker_container_name != second.docker_container_name
+    assert first.docker_image_name != second.docker_image_name
+
+
+def test_scope_docker_files_renames_built_images_only():
+    docker_file = DockerFile(
+        description="",
+        dockerfile="FROM python:3.12-slim\n",
+        docker_compose=(
+            "services:\n"
+            "  app:\n    build: .\n    image: app:latest\n    container_name: app\n"
+            "  db:\n    image: postgres:16\n    container_name: db\n"
+        ),
+        docker_image_name="app:latest",
+        docker_container_name="app",
+    )
+    scoped = scope_docker_files(docker_file, "codegen-s1")
+    services = yaml.safe_load(scoped.docker_compose)["services"]
+    assert services["app"] == {
+        "build": ".",
+        "image": "codegen-s1-app:latest",
+        "container_name": "codegen-s1-app",
+    }
+    assert services["db"] == {"image": "postgres:16", "container_name": "codegen-s1-db"}
+    assert scoped.docker_container_name == "codegen-s1-app"
+    assert scoped.docker_image_name == "codegen-s1-app:latest"
+    # Scoping twice changes nothing
+    assert scope_docker_files(scoped, "codegen-s1").docker_compose == scoped.docker_compose
+
+
+def test_scope_docker_files_follows_a_renamed_container():
+    # An edit renamed the container the session knows as codegen-s1-app
+    docker_file = DockerFile(
+        description="",
+        dockerfile="FROM python:3.12-slim\n",
+        docker_compose=(
+            "services:\n"
+            "  db:\n    image: postgres:16\n    container_name: db\n"
+            "  web:\n    build: .\n    container_name: web\n"
+        ),
+        docker_image_name="codegen-s1-app:latest",
+        docker_container_name="codegen-s1-app",
+    )
+    assert scope_docker_files(docker_file, "codegen-s1").docker_container_name == "codegen-s1-web"
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from utils.events import BatchingEventSink, Event
+
+
+class RecordingSink(BatchingEventSink):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.delivered = []
+
+    async def deliver(self, events):
+        self.delivered.append([event.content for event in events])
+
+
+def test_events_sent_together_are_delivered_in_one_batch():
+    async def run():
+        sink = RecordingSink(flush_interval=0.05)
+        for content in ("a", "b", "c"):
+            await sink.send(Event("status", content))
+        await asyncio.sleep(0.15)
+        await sink.send(Event("status", "d"))
+        await sink.close()
+        return sink
+
+    sink = asyncio.run(run())
+    assert sink.delivered == [["a", "b", "c"], ["d"]]
+    assert sink.batches == 2
+
+
+def test_batches_are_cut_at_max_batch_and_close_drains_the_queue():
+    async def run():
+        sink = RecordingSink(flush_interval=10, max_batch=2)
+        for content in "abcde":
+            await sink.send(Event("status", content))
+        await sink.close()
+        return sink
+
+    sink = asyncio.run(run())
+    assert sink.delivered == [["a", "b"], ["c", "d"], ["e"]]
+
+
+def test_delivery_errors_do_not_reach_the_agents():
+    class FailingSink(BatchingEventSink):
+        async def deliver(self, events):
+            raise RuntimeError("UI is gone")
+
+    async def run():
+        sink = FailingSink(flush_interval=0)
+        await sink.send(Event("status", "a"))
+        await sink.close()
+        return sink
+
+    assert asyncio.run(run()).batches == 1
+
+
+def test_batching_sink_must_implement_deliver():
+    with pytest.raises(TypeError):
+        BatchingEventSink()
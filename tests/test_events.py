@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from executor.events import ContainerEvent, DockerEventWatcher, EventSource, StubEventSource
+
+
+def test_from_docker_reads_exit_code_and_health_status():
+    event = ContainerEvent.from_docker(
+        {
+            "Action": "health_status: healthy",
+            "Actor": {"ID": "abc123", "Attributes": {"name": "app", "exitCode": "3"}},
+            "time": 1,
+        }
+    )
+    assert event.action == "health_status"
+    assert event.status == "healthy"
+    assert event.container == "app"
+    assert event.container_id == "abc123"
+    assert event.exit_code == 3
+
+
+def test_watch_receives_the_events_of_its_container():
+    async def scenario():
+        source = StubEventSource()
+        watcher = DockerEventWatcher(source)
+        watch = watcher.watch("app")
+        other = watcher.watch("other")
+        source.push("start", "app", "id-1")
+        source.push("die", "app", "id-1", exitCode=137)
+        event = await watch.wait(["die"], timeout=1)
+        missed = await other.wait(["die"], timeout=0.05)
+        watch.close()
+        other.close()
+        await watcher.stop()
+        return event, [e.action for e in watch.history], missed
+
+    event, history, missed = asyncio.run(scenario())
+    assert event.exit_code == 137
+    assert history == ["start", "die"]
+    assert missed is None
+
+
+def test_wait_filters_on_container_id_and_status():
+    async def scenario():
+        source = StubEventSource()
+        watcher = DockerEventWatcher(source)
+        watch = watcher.watch("app")
+        source.push("die", "app", "old-container", exitCode=1)
+        source.push("health_status: starting", "app", "new-container")
+        source.push("health_status: healthy", "app", "new-container")
+        source.push("die", "app", "new-container", exitCode=0)
+        healthy = await watch.wait(["health_status"], timeout=1, status="healthy")
+        died = await watch.wait(["die"], timeout=1, container_id="new")
+        watch.close()
+        await watcher.stop()
+        return healthy, died
+
+    healthy, died = asyncio.run(scenario())
+    assert healthy.container_id == "new-container"
+    assert died.container_id == "new-container"
+    assert died.exit_code == 0
+
+
+def test_closed_watch_is_unregistered():
+    async def scenario():
+        watcher = DockerEventWatcher(StubEventSource())
+        watch = watcher.watch("app")
+        watch.close()
+        watched = dict(watcher._watches)
+        await watcher.stop()
+        return watched
+
+    assert asyncio.run(scenario()) == {}
+
+
+def test_event_source_must_implement_events():
+    with pytest.raises(TypeError):
+        EventSource()
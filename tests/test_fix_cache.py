@@ -0,0 +1,116 @@
+import json
+
+from knowledge.fix_cache import FixCache, error_signature
+from utils.docker_templates import PYTHON_BASE_IMAGE
+
+
+def test_signature_ignores_names_paths_and_numbers():
+    first = error_signature("Execution Error", "Error: cannot open '/app/data.csv' at line 12")
+    second = error_signature("Execution Error", "Error: cannot open '/srv/x.csv' at line 40")
+    assert first == second
+    assert first.startswith("Execution Error|")
+
+
+def test_missing_python_module_rule(tmp_path):
+    cache = FixCache(str(tmp_path / "fix_cache.json"))
+    fix = cache.lookup(
+        "Docker Execution Error",
+        "ModuleNotFoundError: No module named 'yaml'",
+        {"main.py": "import yaml\n", "requirements.txt": "requests\n"},
+    )
+    assert fix.key == "missing-python-module"
+    assert fix.patch == {"requirements.txt": "requests\nPyYAML\n"}
+
+
+def test_missing_python_module_rule_skips_stdlib_and_local_modules(tmp_path):
+    cache = FixCache(str(tmp_path / "fix_cache.json"))
+    files = {"main.py": "", "helpers.py": "", "requirements.txt": ""}
+    assert cache.lookup("Execution Error", "No module named 'json'", files) is None
+    assert cache.lookup("Execution Error", "No module named 'helpers'", files) is None
+
+
+def test_missing_node_module_rule(tmp_path):
+    cache = FixCache(str(tmp_path / "fix_cache.json"))
+    fix = cache.lookup(
+        "Docker Execution Error",
+        "Error: Cannot find module '@scope/pkg/lib'",
+        {"index.js": "", "package.json": '{"name": "app"}'},
+    )
+    assert fix.key == "missing-node-module"
+    assert json.loads(fix.patch["package.json"])["dependencies"] == {"@scope/pkg": "*"}
+
+
+def test_dockerfile_rules(tmp_path):
+    cache = FixCache(str(tmp_path / "fix_cache.json"))
+    fix = cache.lookup(
+        "Docker Configuration Error",
+        "npm ERR! ERESOLVE unable to resolve dependency tree",
+        {"Dockerfile": "FROM node:20\nWORKDIR /app\nRUN npm install\n", "package.json": "{}"},
+    )
+    assert fix.key == "npm-legacy-peer-deps"
+    assert "RUN npm install --legacy-peer-deps" in fix.patch["Dockerfile"]
+
+    fix = cache.lookup(
+        "Docker Configuration Error",
+        "pull access denied for pyton, repository does not exist",
+        {"Dockerfile": "FROM pyton:3\nWORKDIR /app\n", "main.py": ""},
+    )
+    assert fix.key == "wrong-base-image"
+    assert fix.patch["Dockerfile"].startswith(f"FROM {PYTHON_BASE_IMAGE}\n")
+
+
+def test_missing_node_module_wins_over_missing_workdir(tmp_path):
+    cache = FixCache(str(tmp_path / "fix_cache.json"))
+    fix = cache.lookup(
+        "Docker Execution Error",
+        "Error: Cannot find module 'express'",
+        {"Dockerfile": "FROM node:20\nCOPY . .\n", "package.json": '{"name": "app"}'},
+    )
+    assert fix.key == "missing-node-module"
+
+
+def test_learned_fix_is_stored_once_verified(tmp_path):
+    path = str(tmp_path / "fix_cache.json")
+    cache = FixCache(path)
+    details = "TypeError: unsupported operand"
+    files = {"main.py": "print(1 + '1')\n"}
+    learned = cache.learn("Execution Error", details, files, {"main.py": "print(1 + 1)\n"})
+    assert cache.lookup("Execution Error", details, files) is None
+
+    cache.record_outcome(learned.key, learned.signature, True)
+    # Persisted, and found again by a new cache on the same files only
+    fix = FixCache(path).lookup("Execution Error", details, files)
+    assert fix.key == learned.key
+    assert fix.patch == {"main.py": "print(1 + 1)\n"}
+    assert FixCache(path).lookup("Execution Error", details, {"main.py": "other\n"}) is None
+
+
+def test_unverified_fix_is_never_stored(tmp_path):
+    path = str(tmp_path / "fix_cache.json")
+    cache = FixCache(path)
+    details = "TypeError: unsupported operand"
+    files = {"main.py": "a\n"}
+    learned = cache.learn("Execution Error", details, files, {"main.py": "b\n"})
+    cache.record_outcome(learned.key, learned.signature, False)
+    assert cache.lookup("Execution Error", details, files) is None
+    assert not (tmp_path / "fix_cache.json").exists()
+
+
+def test_failing_fixes_are_evicted(tmp_path):
+    cache = FixCache(str(tmp_path / "fix_cache.json"))
+    details = "TypeError: unsupported operand"
+    files = {"main.py": "a\n"}
+    learned = cache.learn("Execution Error", details, files, {"main.py": "b\n"})
+    cache.record_outcome(learned.key, learned.signature, True)
+    for _ in range(3):
+        cache.record_outcome(learned.key, learned.signature, False)
+    assert cache.lookup("Execution Error", details, files) is None
+
+    # Rules are not evicted from the code, they stop being used
+    details = "No module named 'yaml'"
+    files = {"main.py": "", "requirements.txt": ""}
+    signature = error_signature("Execution Error", details)
+    for _ in range(3):
+        cache.record_outcome("missing-python-module", signature, False)
+    assert cache.lookup("Execution Error", details, files) is None
+    assert [p.name for p in tmp_path.iterdir()] == ["fix_cache.json"]
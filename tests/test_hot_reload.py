@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from executor import hot_reload
+from executor.hot_reload import rebuild_reason, sync_into_container
+
+DOCKERFILE = (
+    "FROM python:3.12-slim\nWORKDIR /app\nCOPY requirements.txt ./\n"
+    "RUN pip install -r requirements.txt\nCOPY . .\nCMD [\"python\", \"main.py\"]\n"
+)
+
+
+@pytest.mark.parametrize(
+    "filenames, dockerfile, reason",
+    [
+        (["main.py", "templates/index.html"], DOCKERFILE, None),
+        ([], DOCKERFILE, "no changed files"),
+        (["main.py", "requirements.txt"], DOCKERFILE, "requirements.txt changed"),
+        (["Dockerfile"], DOCKERFILE, "Dockerfile changed"),
+        (["Main.java"], DOCKERFILE, "Main.java has to be built"),
+        # The image holds more than the copied sources
+        (["main.py"], DOCKERFILE + "RUN python setup.py build\n",
+         "the Dockerfile does not copy the sources as they are"),
+    ],
+)
+def test_rebuild_reason(filenames, dockerfile, reason):
+    assert rebuild_reason(filenames, dockerfile) == reason
+
+
+def fake_run_command(calls, returncodes=None):
+    async def run_command(command, stdin=None, timeout=None, **kwargs):
+        calls.append(command)
+        return (returncodes or {}).get(command[1], 0), "", "failed"
+
+    return run_command
+
+
+def test_changed_sources_are_copied_and_the_container_restarted(tmp_path, monkeypatch):
+    (tmp_path / "main.py").write_text("print(2)\n", encoding="utf-8")
+    calls = []
+    monkeypatch.setattr(hot_reload, "run_command", fake_run_command(calls))
+
+    result = asyncio.run(sync_into_container(str(tmp_path), "app", ["main.py"], DOCKERFILE))
+
+    assert result.reloaded
+    assert result.synced == ["main.py"]
+    assert calls[0] == ["docker", "cp", "-", "app:/app"]
+    assert calls[1][:2] == ["docker", "restart"] and calls[1][-1] == "app"
+
+
+def test_removed_files_and_failed_copies_fall_back_to_a_rebuild(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(hot_reload, "run_command", fake_run_command(calls, {"cp": 1}))
+
+    result = asyncio.run(sync_into_container(str(tmp_path), "app", ["gone.py"], DOCKERFILE))
+    assert not result.reloaded and result.reason == "gone.py was removed"
+    assert calls == []
+
+    (tmp_path / "main.py").write_text("", encoding="utf-8")
+    result = asyncio.run(sync_into_container(str(tmp_path), "app", ["main.py"], DOCKERFILE))
+    assert not result.reloaded and result.reason == "docker cp failed: failed"
+    # Not restarted, the rebuild replaces the container
+    assert [command[1] for command in calls] == ["cp"]
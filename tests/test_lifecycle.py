@@ -0,0 +1,92 @@
+import asyncio
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import executor.lifecycle as lifecycle
+from executor.lifecycle import LifecycleManager, project_name_for
+
+OLD = "2020-01-01 10:00:00 +0000 UTC"
+
+
+def fake_docker(monkeypatch, outputs: dict):
+    """subprocess.run answering docker commands by their first words, recording them."""
+    calls = []
+
+    def run(command, **kwargs):
+        calls.append(command)
+        for prefix, stdout in outputs.items():
+            if command[: len(prefix.split())] == prefix.split():
+                return subprocess.CompletedProcess(command, 0, stdout, "")
+        return subprocess.CompletedProcess(command, 0, "", "")
+
+    monkeypatch.setattr(lifecycle.subprocess, "run", run)
+    return calls
+
+
+def test_project_names_are_docker_safe():
+    assert project_name_for("Session 1/ABC") == "codegen-session-1-abc"
+    assert project_name_for(None) == "codegen-local"
+
+
+def test_collect_orphans_removes_old_unowned_resources(monkeypatch):
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S +0000 UTC")
+    calls = fake_docker(
+        monkeypatch,
+        {
+            "docker ps": f"c-old\t{OLD}\tcodegen-gone\nc-new\t{now}\tcodegen-live\n"
+            f"c-other\t{OLD}\tsomeone-else\n",
+            "docker images": f"i-old\t{OLD}\ni-owned\t{OLD}\n",
+            "docker image inspect": "codegen-gone\ncodegen-owned\n",
+        },
+    )
+    manager = LifecycleManager(orphan_min_age=3600)
+    manager._sessions["owned"] = lifecycle.RunResources("codegen-owned", "/tmp")
+
+    assert manager.collect_orphans()
+    removed = [command for command in calls if "rm" in command]
+    assert ["docker", "rm", "-f", "-v", "c-old"] in removed
+    assert ["docker", "image", "rm", "-f", "i-old"] in removed
+    assert len(removed) == 2
+    # Images are listed without a label format, the project comes from inspect
+    images = next(command for command in calls if command[:2] == ["docker", "images"])
+    assert images[-1] == "{{.ID}}\t{{.CreatedAt}}"
+
+
+def test_only_the_lock_holder_collects(tmp_path, monkeypatch):
+    fake_docker(monkeypatch, {})
+    lock_path = str(tmp_path / "orphans.lock")
+    first = LifecycleManager(orphan_lock_path=lock_path)
+    second = LifecycleManager(orphan_lock_path=lock_path)
+    assert first.collect_orphans()
+    if lifecycle.fcntl is not None:
+        assert not second.collect_orphans()
+
+
+def test_created_at():
+    assert lifecycle._created_at(OLD) == datetime(2020, 1, 1, 10, tzinfo=timezone.utc).timestamp()
+    assert lifecycle._created_at("2024-07-01 12:34:56.123 +0200 CEST") < time.time()
+    assert lifecycle._created_at("yesterday") is None
+
+
+def test_kept_containers_are_torn_down_once_idle(monkeypatch):
+    commands = []
+
+    async def run_command(command, **kwargs):
+        commands.append(command)
+        # docker inspect: the container can be started again
+        return 0, "running\n" if command[1] == "inspect" else "", ""
+
+    monkeypatch.setattr(lifecycle, "run_command", run_command)
+    manager = LifecycleManager(idle_timeout=60)
+    for session_id in ("s1", "s2"):
+        resources = asyncio.run(manager.track(session_id, "/w"))
+        resources.containers.add(f"{session_id}-container")
+        asyncio.run(manager.release_run(session_id))
+    # Kept for the next run of their session
+    assert not any("rm" in command for command in commands)
+
+    manager.acquire("s2")
+    asyncio.run(manager.release_idle(now=time.time() + 61))
+    removed = [command for command in commands if command[:3] == ["docker", "rm", "-f"]]
+    assert removed == [["docker", "rm", "-f", "-v", "s1-container"]]
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+import yaml
+
+import executor.compose as compose
+from executor.build_context import ComposeFileError, read_compose_services
+from executor.compose import ComposeResult, _wait_for_exit, compose_up
+from executor.events import DockerEventWatcher, StubEventSource
+from executor.limits import ExecutionLimits, write_limits_override
+from executor.testing import run_tests
+
+LISTENING = (
+    "  sl  local_address rem_address   st\n"
+    "   0: 00000000:1F90 00000000:0000 0A 00000000:00000000\n"
+)
+
+
+def write_compose(directory, content: str) -> str:
+    path = directory / "compose.yaml"
+    path.write_text(content, encoding="utf-8")
+    return str(path)
+
+
+def test_limits_override_applies_to_every_service(tmp_path):
+    path = write_compose(
+        tmp_path, "services:\n  app:\n    build: .\n    restart: always\n  db:\n    image: redis\n"
+    )
+    limits = ExecutionLimits(cpus=0.5, memory="256m", pids=64)
+    with open(write_limits_override(path, limits, images={"app": "codegen-a-app"})) as f:
+        services = yaml.safe_load(f)["services"]
+    assert set(services) == {"app", "db"}
+    assert services["app"]["mem_limit"] == "256m"
+    assert services["app"]["memswap_limit"] == "256m"
+    assert services["db"]["pids_limit"] == 64
+    assert services["app"]["restart"] == "no"
+    assert services["app"]["image"] == "codegen-a-app"
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "services:\n  app:\n    build: .\n   image: x\n",
+        "- app\n- db\n",
+        "services:\n  - app\n",
+        "services:\n  app: build\n",
+    ],
+)
+def test_broken_compose_files_are_reported_as_build_errors(tmp_path, content):
+    write_compose(tmp_path, content)
+    with pytest.raises(ComposeFileError):
+        read_compose_services(str(tmp_path / "compose.yaml"))
+
+    for tracked_files in (None, ["main.py"]):
+        result = asyncio.run(compose_up(str(tmp_path), "app", tracked_files=tracked_files))
+        assert result.build_returncode != 0
+        assert "compose.yaml" in result.build_stderr
+
+    report = asyncio.run(run_tests(str(tmp_path), str(tmp_path / "tests"), "python", "app"))
+    assert report.build_failed
+
+
+def fake_docker(monkeypatch, running: bool, listening: bool):
+    commands = []
+
+    async def run_command(command, *args, **kwargs):
+        commands.append(command)
+        if command[:2] == ["docker", "inspect"] and "OOMKilled" in command[3]:
+            return 0, "false\n", ""
+        if command[:2] == ["docker", "inspect"]:
+            return 0, f"abc123 {'true' if running else 'false'} 0\n", ""
+        if command[:2] == ["docker", "exec"]:
+            return 0, LISTENING if listening else "", ""
+        return 0, "", ""
+
+    monkeypatch.setattr(compose, "run_command", run_command)
+    return commands
+
+
+def wait(limits: ExecutionLimits) -> ComposeResult:
+    async def scenario():
+        watcher = DockerEventWatcher(StubEventSource())
+        watch = watcher.watch("app")
+        result = ComposeResult(build_returncode=0)
+        await _wait_for_exit("app", limits, result, watch)
+        watch.close()
+        await watcher.stop()
+        return result
+
+    return asyncio.run(scenario())
+
+
+def test_servers_are_left_running(monkeypatch):
+    commands = fake_docker(monkeypatch, running=True, listening=True)
+    result = wait(ExecutionLimits(run_timeout=5, startup_window=0.05))
+    assert result.running and not result.timed_out
+    assert ["docker", "kill", "app"] not in commands
+
+
+def test_programs_that_never_listen_time_out(monkeypatch):
+    commands = fake_docker(monkeypatch, running=True, listening=False)
+    result = wait(ExecutionLimits(run_timeout=0.2, startup_window=0.05))
+    assert result.timed_out and not result.running
+    assert ["docker", "kill", "app"] in commands
+
+
+def test_exited_programs_report_their_exit_code(monkeypatch):
+    fake_docker(monkeypatch, running=False, listening=False)
+    result = wait(ExecutionLimits(run_timeout=5))
+    assert result.exit_code == 0 and not result.timed_out
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import queue
+import sys
+
+import pytest
+
+from executor.compose import CommandTimeout, run_command
+from utils.log_pipeline import (
+    DroppingQueueHandler,
+    RingBuffer,
+    SessionFileHandler,
+    SessionFilter,
+    excerpt,
+    session_id_var,
+)
+
+
+def test_ring_buffer_keeps_the_tail():
+    buffer = RingBuffer(10)
+    for chunk in ("abc", "defgh", "ijklmn"):
+        buffer.append(chunk)
+    assert len(buffer) == 10
+    assert buffer.dropped == 4
+    assert buffer.getvalue() == "[... 4 characters dropped ...]\nefghijklmn"
+
+
+def test_ring_buffer_with_a_chunk_larger_than_the_buffer():
+    buffer = RingBuffer(4)
+    buffer.append("ab")
+    buffer.append("0123456789")
+    assert len(buffer) == 4
+    assert buffer.dropped == 8
+    assert buffer.getvalue().endswith("\n6789")
+
+
+def test_ring_buffer_below_its_size_is_unchanged():
+    buffer = RingBuffer(100)
+    buffer.append("hello ")
+    buffer.append("")
+    buffer.append("world")
+    assert buffer.getvalue() == "hello world"
+
+
+def test_excerpt():
+    assert excerpt("short", 10) == "short"
+    assert excerpt(None) is None
+    assert excerpt("x" * 5 + "tail", 4) == "[... 5 characters omitted ...]\ntail"
+
+
+def test_command_output_is_bounded():
+    script = "import sys\nfor i in range(5000): print(i)\nsys.stderr.write('done')\n"
+    returncode, stdout, stderr = asyncio.run(
+        run_command([sys.executable, "-c", script], max_bytes=100)
+    )
+    assert returncode == 0
+    assert stdout.endswith("4998\n4999\n")
+    assert len(stdout.split("\n", 1)[1]) == 100
+    assert stderr == "done"
+
+
+def test_command_timeout_keeps_the_output():
+    script = "import time\nprint('started', flush=True)\ntime.sleep(10)\n"
+    with pytest.raises(CommandTimeout) as error:
+        asyncio.run(run_command([sys.executable, "-c", script], timeout=1))
+    assert error.value.stdout == "started\n"
+
+
+def test_full_queue_drops_records():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "message", None, None)
+    handler.enqueue(record)
+    handler.enqueue(record)
+    assert handler.dropped == 1
+
+
+def test_records_go_to_their_session_file(tmp_path):
+    handler = SessionFileHandler(str(tmp_path), max_bytes=1024, max_open=1)
+    handler.setFormatter(logging.Formatter("%(session_id)s %(message)s"))
+    session_filter = SessionFilter()
+    for session, message in (("s-1", "first"), ("s/2", "second"), ("s-1", "third")):
+        token = session_id_var.set(session)
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, message, None, None)
+        session_filter.filter(record)
+        handler.emit(record)
+        session_id_var.reset(token)
+    # Only one file is kept open at a time
+    assert len(handler._handlers) == 1
+    handler.close()
+    assert (tmp_path / "s-1.log").read_text(encoding="utf-8") == "s-1 first\ns-1 third\n"
+    assert (tmp_path / "s_2.log").read_text(encoding="utf-8") == "s/2 second\n"
@@ -0,0 +1,26 @@
+from utils import memory
+from utils.memory import RunMemory
+
+
+def test_peak_is_reset_only_for_a_run_alone_and_overlaps_are_marked(monkeypatch):
+    resets = []
+    monkeypatch.setattr(memory, "reset_peak_rss", lambda: resets.append(True))
+
+    first = RunMemory().start()
+    second = RunMemory().start()
+    second.stop()
+    first.stop()
+    assert len(resets) == 1
+    assert first.shared and second.shared
+
+    alone = RunMemory().start()
+    alone.stop()
+    assert len(resets) == 2
+    assert not alone.shared
+
+
+def test_peak_without_proc_or_resource(monkeypatch):
+    monkeypatch.setattr(memory, "_status_kb", lambda field: None)
+    monkeypatch.setattr(memory, "resource", None)
+    assert memory.peak_rss_mb() == 0.0
+    assert memory.rss_mb() == 0.0
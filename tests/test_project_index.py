@@ -0,0 +1,63 @@
+from knowledge.project_index import ProjectEntry, ProjectIndex, tokenize
+
+
+def entry(requirement: str, code: str = "print(1)", iterations: int = 0) -> ProjectEntry:
+    return ProjectEntry(
+        requirement=requirement,
+        codes={"codes": [{"filename": "main.py", "code": code}]},
+        iterations=iterations,
+    )
+
+
+def test_tokenize_drops_stop_words_and_keeps_bigrams():
+    assert tokenize("Write a program that says hello world") == [
+        "says", "hello", "world", "says hello", "hello world",
+    ]
+
+
+def test_search_ranks_the_closest_requirement_first(tmp_path):
+    index = ProjectIndex(str(tmp_path))
+    index.add(entry("hello world in python", "print('hello')"))
+    index.add(entry("fetch the weather forecast from an api", "import requests"))
+    index.add(entry("todo list web app with flask", "import flask"))
+
+    matches = index.search("print hello world")
+    assert matches[0].entry.requirement == "hello world in python"
+    assert len(matches) == 1
+    assert index.best_match("weather api").entry.codes["codes"][0]["code"] == "import requests"
+    assert index.search("the a of") == []
+
+
+def test_the_same_project_is_stored_once(tmp_path):
+    index = ProjectIndex(str(tmp_path))
+    assert index.add(entry("hello world"))
+    # A reused project comes back with the same files
+    assert not index.add(entry("say hello to the world"))
+    assert len(index.entries) == 1
+    assert len(ProjectIndex(str(tmp_path)).entries) == 1
+
+
+def test_a_new_project_for_the_same_requirement_replaces_the_old(tmp_path):
+    index = ProjectIndex(str(tmp_path))
+    index.add(entry("hello world", "print(1)", iterations=3))
+    index.add(entry("Hello  World", "print(2)", iterations=0))
+    assert len(index.entries) == 1
+    assert index.best_match("hello world").entry.codes["codes"][0]["code"] == "print(2)"
+
+    reloaded = ProjectIndex(str(tmp_path))
+    assert [e.codes["codes"][0]["code"] for e in reloaded.entries] == ["print(2)"]
+    # The superseded line was dropped from the file
+    with open(reloaded.path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+
+
+def test_document_vectors_are_computed_once_per_change(tmp_path):
+    index = ProjectIndex(str(tmp_path))
+    index.add(entry("hello world"))
+    index.search("hello")
+    postings = index._postings
+    index.search("world")
+    assert index._postings is postings
+    index.add(entry("goodbye world", "print(3)"))
+    assert index._postings is None
+    assert len(index.search("world")) == 2
@@ -0,0 +1,53 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+from prompts.rendering import PromptRenderer
+
+TEMPLATE = ChatPromptTemplate.from_messages(
+    [
+        SystemMessage(content="You fix code."),
+        ("human", "Code:\n{code}\nError:\n{error}"),
+    ]
+)
+
+
+def test_renders_like_the_template():
+    renderer = PromptRenderer()
+    variables = {"code": "print(1 + '1')", "error": "TypeError"}
+    assert renderer.render(TEMPLATE, **variables) == TEMPLATE.format_messages(**variables)
+
+
+def test_static_messages_are_reused_and_variable_ones_memoized():
+    renderer = PromptRenderer()
+    first = renderer.render(TEMPLATE, code="a", error="b")
+    second = renderer.render(TEMPLATE, code="a", error="b")
+    # The same objects, so the prefix is byte for byte the same
+    assert first[0] is second[0]
+    assert first[1] is second[1]
+    assert renderer.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+    third = renderer.render(TEMPLATE, code="a", error="c")
+    assert third[1].content.endswith("c")
+    assert renderer.stats()["misses"] == 2
+
+
+def test_least_recently_used_entries_are_evicted():
+    renderer = PromptRenderer(max_entries=2)
+    for error in ("a", "b", "a", "c"):
+        renderer.render(TEMPLATE, code="x", error=error)
+    assert renderer.stats()["entries"] == 2
+    # "b" was the least recently used
+    renderer.render(TEMPLATE, code="x", error="b")
+    assert renderer.stats() == {"hits": 1, "misses": 4, "entries": 2}
+
+
+def test_history_placeholders_are_passed_through():
+    template = ChatPromptTemplate.from_messages(
+        [("system", "Answer briefly."), MessagesPlaceholder("messages")]
+    )
+    history = [HumanMessage(content="hi"), AIMessage(content="hello")]
+    renderer = PromptRenderer()
+    assert renderer.render(template, messages=history)[1:] == history
+    with pytest.raises(KeyError):
+        renderer.render(template)
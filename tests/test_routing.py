@@ -0,0 +1,72 @@
+from agents.routing import (
+    RoutingPolicy,
+    RunBudget,
+    current_budget,
+    failed_fixes,
+    record_execution_outcome,
+)
+from schemas import ErrorMessage
+
+
+def code_error(details: str = "ValueError: bad value") -> ErrorMessage:
+    return ErrorMessage(type="Execution Error", details=details)
+
+
+def docker_error() -> ErrorMessage:
+    return ErrorMessage(type="Docker Configuration Error", details="failed to build")
+
+
+def state_after(*errors, tested_iteration=None) -> dict:
+    state = {"error_history": [], "iterations": 0, "tested_iteration": tested_iteration}
+    for error in errors:
+        state.update(record_execution_outcome(state, error))
+        state["iterations"] += 1
+    state["error"] = errors[-1] if errors else None
+    return state
+
+
+def test_success_is_tested_once_then_documented():
+    policy = RoutingPolicy()
+    state = state_after(None)
+    assert policy.decide(state) == "tester"
+    state["tested_iteration"] = state["iterations"]
+    assert policy.decide(state) == "readme"
+
+
+def test_errors_are_routed_by_class():
+    policy = RoutingPolicy()
+    assert policy.decide(state_after(code_error())) == "debug_code"
+    assert policy.decide(state_after(docker_error())) == "debug_docker"
+    infra = ErrorMessage(type="Unexpected Docker Error", details="daemon not reachable")
+    assert policy.decide(state_after(infra)) == "retry"
+    general = ErrorMessage(type="Something Else", details="")
+    assert policy.decide(state_after(general)) == "debugger"
+
+
+def test_the_same_error_repeated_ends_the_run():
+    policy = RoutingPolicy(repeat_limit=3)
+    state = state_after(code_error(), code_error(), code_error())
+    assert policy.decide(state) == "end"
+
+
+def test_class_budget_counts_earlier_errors_of_the_class():
+    policy = RoutingPolicy(class_budgets={"docker": 1, "code": 4, "infra": 1, "general": 2})
+    state = state_after(docker_error(), code_error("NameError: x"), docker_error())
+    assert policy.decide(state) == "end"
+    state = state_after(docker_error(), code_error("NameError: x"))
+    assert policy.decide(state) == "debug_code"
+
+
+def test_iterations_and_run_budget_end_the_run():
+    assert RoutingPolicy(max_iterations=1).decide(state_after(code_error())) == "end"
+
+    token = current_budget.set(RunBudget(max_seconds=1, started_at=0))
+    try:
+        assert RoutingPolicy().decide(state_after(code_error())) == "end"
+    finally:
+        current_budget.reset(token)
+
+
+def test_failed_fixes_counts_the_errors_after_the_first():
+    assert failed_fixes(state_after(code_error())) == 0
+    assert failed_fixes(state_after(None, code_error("A error"), code_error("B error"))) == 1
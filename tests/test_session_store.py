@@ -0,0 +1,104 @@
+import os
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from schemas import Code, Codes, ErrorMessage
+from sessions import store
+from sessions.store import (
+    MemorySessionStore,
+    SessionRecord,
+    SessionStore,
+    SqliteSessionStore,
+    TieredSessionStore,
+    dump_state,
+    load_state,
+)
+
+
+def make_state():
+    return {
+        "codes": Codes(
+            description="Hello world",
+            codes=[
+                Code(
+                    filename="main.py",
+                    code="print('hi')\n",
+                    description="Prints a greeting",
+                    programming_language="python",
+                    executable_code=True,
+                )
+            ],
+            execution_command="python main.py",
+        ),
+        "error": ErrorMessage(type="Execution Error", details="boom"),
+        "docker_container_name": "codegen-s1-app",
+        "changed_files": ["main.py"],
+        "iterations": 2,
+        # Per run, not stored
+        "pending_fix": {"key": "k", "signature": "s"},
+        "messages": [HumanMessage(content="hello world"), AIMessage(content="done")],
+    }
+
+
+def test_state_round_trip_keeps_the_persistent_fields():
+    state = load_state(dump_state(make_state()))
+    expected = make_state()
+    del expected["pending_fix"]
+    assert state == expected
+
+
+def test_record_round_trip():
+    record = SessionRecord("s1", "/w/src", "/w/test", make_state(), "codegen-s1")
+    loaded = SessionRecord.from_bytes(record.to_bytes(), version=3)
+    assert loaded.version == 3
+    assert loaded.container_name == "codegen-s1-app"
+    assert loaded.state["codes"] == record.state["codes"]
+
+
+def test_memory_store_versions_and_evicts():
+    memory = MemorySessionStore(max_entries=2)
+    assert memory.put(SessionRecord("a", "", "")).version == 1
+    assert memory.put(SessionRecord("a", "", "")).version == 2
+    memory.put(SessionRecord("b", "", ""))
+    memory.get("a")
+    memory.put(SessionRecord("c", "", ""))
+    # "b" was the least recently used
+    assert memory.get("b") is None
+    assert memory.version("a") == 2
+
+
+def test_tiered_store_loads_only_what_another_worker_wrote(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    first = TieredSessionStore(MemorySessionStore(), SqliteSessionStore(path))
+    second = TieredSessionStore(MemorySessionStore(), SqliteSessionStore(path))
+
+    first.put(SessionRecord("s1", "/w/src", "/w/test", make_state()))
+    assert first.get("s1").version == 1
+    assert first.stats() == {"local_hits": 1, "shared_loads": 0, "misses": 0}
+
+    # The other worker loads it, writes a new version, and the first one reloads it
+    record = second.get("s1")
+    record.state["iterations"] = 5
+    second.put(record)
+    assert first.get("s1").state["iterations"] == 5
+    assert first.stats()["shared_loads"] == 1
+
+    second.delete("s1")
+    assert first.get("s1") is None
+    assert first.local.get("s1") is None
+
+
+def test_session_files_are_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "get_setting", lambda section, key, default=None: str(tmp_path))
+    workspace, test_path = store.session_workspace("chat/1")
+    snapshots = tmp_path / "chat-1" / "snapshots"
+    for directory in (workspace, test_path, str(snapshots)):
+        os.makedirs(directory)
+    store.remove_session_files("chat/1")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
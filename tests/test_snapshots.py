@@ -0,0 +1,65 @@
+import os
+
+from executor import snapshots
+from executor.snapshots import SnapshotStore
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_restore_returns_the_files_it_changed(tmp_path):
+    workspace = str(tmp_path / "src")
+    store = SnapshotStore(str(tmp_path / "snapshots"), excludes=["node_modules"])
+    write(os.path.join(workspace, "main.py"), "print(1)\n")
+    write(os.path.join(workspace, "lib", "util.py"), "x = 1\n")
+    write(os.path.join(workspace, "node_modules", "dep.js"), "")
+    store.take(workspace, "s-00-dockerizer")
+
+    write(os.path.join(workspace, "main.py"), "print(2)\n")
+    write(os.path.join(workspace, "extra.py"), "")
+    changed = store.restore("s-00-dockerizer", workspace)
+
+    assert changed == ["extra.py", "main.py"]
+    assert read(os.path.join(workspace, "main.py")) == "print(1)\n"
+    assert not os.path.exists(os.path.join(workspace, "extra.py"))
+    # Excluded directories are neither snapshotted nor removed
+    assert os.path.exists(os.path.join(workspace, "node_modules", "dep.js"))
+    assert store.restore("s-00-dockerizer", workspace) == []
+
+
+def test_unchanged_files_share_one_blob_and_evicted_blobs_are_removed(tmp_path):
+    workspace = str(tmp_path / "src")
+    store = SnapshotStore(str(tmp_path / "snapshots"), max_snapshots=2, excludes=[])
+    write(os.path.join(workspace, "main.py"), "v1\n")
+    write(os.path.join(workspace, "data.txt"), "same\n")
+    for index in range(3):
+        write(os.path.join(workspace, "main.py"), f"v{index}\n")
+        store.take(workspace, f"s-{index:02d}-debug_code")
+
+    blobs = {
+        blob.name
+        for prefix in os.scandir(store.blob_path)
+        for blob in os.scandir(prefix.path)
+    }
+    # data.txt once, and main.py of the two snapshots left
+    assert len(blobs) == 3
+    assert list(store._manifests) == ["s-01-debug_code", "s-02-debug_code"]
+    # A new store finds the snapshots on disk
+    reloaded = SnapshotStore(store.directory, excludes=[])
+    assert reloaded.manifest("s-02-debug_code") == store.manifest("s-02-debug_code")
+
+
+def test_clone_file_copies_without_fcntl(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, "fcntl", None)
+    source, target = tmp_path / "a", tmp_path / "b"
+    source.write_bytes(b"content")
+    snapshots.clone_file(str(source), str(target))
+    assert target.read_bytes() == b"content"
@@ -0,0 +1,100 @@
+from executor import testing
+from executor.testing import (
+    PYTHON_TEST_RUNNER,
+    parse_junit,
+    parse_junit_file,
+    parse_tap,
+    with_test_runner,
+)
+
+JUNIT = """<?xml version="1.0" encoding="utf-8"?>
+<testsuites>
+  <testsuite name="pytest" tests="3">
+    <testcase classname="tests_generated.test_app" name="test_ok" />
+    <testcase classname="tests_generated.test_app" name="test_fails">
+      <failure message="assert 1 == 2">def test_fails(): assert 1 == 2</failure>
+    </testcase>
+    <testcase classname="tests_generated.test_app" name="test_errors">
+      <error message="fixture 'db' not found">setup failed</error>
+    </testcase>
+  </testsuite>
+</testsuites>
+"""
+
+TAP = """TAP version 13
+# Subtest: tests_generated/app.test.js
+    # Subtest: adds
+    ok 1 - adds
+    # Subtest: subtracts
+    not ok 2 - subtracts
+      ---
+      error: 'Expected values to be strictly equal'
+      ...
+    1..2
+not ok 1 - tests_generated/app.test.js
+# Subtest: tests_generated/broken.test.js
+not ok 2 - tests_generated/broken.test.js
+  ---
+  error: 'SyntaxError: Unexpected token'
+  ...
+ok 3 - tests_generated/skipped.test.js # SKIP
+1..3
+"""
+
+
+def test_parse_junit():
+    total, failures = parse_junit(JUNIT)
+    assert total == 3
+    assert [f.name for f in failures] == [
+        "tests_generated.test_app::test_fails",
+        "tests_generated.test_app::test_errors",
+    ]
+    assert failures[0].message == "assert 1 == 2"
+
+
+def test_parse_junit_file_matches_parse_junit(tmp_path):
+    path = tmp_path / "report.xml"
+    path.write_text(JUNIT, encoding="utf-8")
+    assert parse_junit_file(str(path)) == parse_junit(JUNIT)
+
+
+def test_parse_tap_counts_subtests_and_files_without_subtests():
+    total, failures = parse_tap(TAP)
+    # Two subtests of the first file, the other files on their own
+    assert total == 4
+    assert [f.name for f in failures] == ["subtracts", "tests_generated/broken.test.js"]
+    assert failures[0].message == "Expected values to be strictly equal"
+    assert failures[1].message == "SyntaxError: Unexpected token"
+
+
+def test_test_runner_is_installed_in_the_final_stage():
+    dockerfile = (
+        "FROM python:3.12 AS build\nRUN echo build\n"
+        "from python:3.12-slim\nWORKDIR /app\nCOPY . .\n"
+    )
+    lines = with_test_runner(dockerfile, "python").splitlines()
+    assert lines.index(PYTHON_TEST_RUNNER) == lines.index("from python:3.12-slim") + 1
+    assert with_test_runner(dockerfile, "node") == dockerfile
+
+
+def test_report_round_trip():
+    # Imported through the module, pytest would collect a Test* class
+    report = testing.TestReport(runner="pytest", total=3, passed=1, image="app-tests")
+    report.failures = parse_junit(JUNIT)[1]
+    assert testing.TestReport.from_dict(report.to_dict()) == report
+    assert not report.ok
+
+
+def test_node_runs_the_generated_test_files_by_name(tmp_path):
+    (tmp_path / "app.test.js").write_text("", encoding="utf-8")
+    (tmp_path / "helpers.mjs").write_text("", encoding="utf-8")
+    (tmp_path / "report.xml").write_text("", encoding="utf-8")
+    files = testing.generated_test_files(str(tmp_path), "node")
+    assert files == ["tests_generated/app.test.js", "tests_generated/helpers.mjs"]
+
+    command = testing._test_command("node", 2, True, files)
+    assert command[-1] == (
+        "node --test --test-reporter=tap tests_generated/app.test.js tests_generated/helpers.mjs"
+    )
+    # The project's own tests are found by node itself
+    assert testing._test_command("node", 2, False, files)[-1] == "node --test --test-reporter=tap"
@@ -0,0 +1,79 @@
+import asyncio
+import gzip
+import json
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from schemas import ErrorMessage
+from tracing import recorder
+from tracing.recorder import TraceCallbackHandler, end_trace, start_trace, traced
+
+
+def enable_tracing(monkeypatch, directory):
+    monkeypatch.setattr(recorder, "get_bool_setting", lambda section, key, default: True)
+    monkeypatch.setattr(recorder, "get_setting", lambda section, key, default: str(directory))
+
+
+async def docker_node(state):
+    return {"error": ErrorMessage(type="Execution Error", details="boom"), "iterations": 1}
+
+
+def record_run():
+    """A run of one Docker node and one LLM call, as run_requirement records it."""
+    trace = start_trace("session 1", {"messages": [HumanMessage(content="hello world")]})
+    handler = TraceCallbackHandler()
+    prompt = [HumanMessage(content="fix it")]
+
+    async def llm_node(state):
+        handler.on_chat_model_start({}, [prompt], run_id=1, invocation_params={"model": "m"})
+        message = SimpleNamespace(tool_calls=[{"name": "Code", "args": {"answer": 42}}])
+        handler.on_llm_end(
+            SimpleNamespace(generations=[[SimpleNamespace(message=message)]], llm_output={}),
+            run_id=1,
+        )
+        return {"iterations": 2}
+
+    asyncio.run(traced("executer_docker", docker_node)({"iterations": 0}))
+    asyncio.run(traced("debug_code", llm_node)({"iterations": 1}))
+    end_trace(trace)
+    return trace.path, prompt
+
+
+def test_run_is_recorded(tmp_path, monkeypatch):
+    enable_tracing(monkeypatch, tmp_path)
+    path, prompt = record_run()
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        events = [json.loads(line) for line in f]
+    assert [event["k"] for event in events] == ["run", "node", "llm", "node", "end"]
+    assert events[0]["inputs"] == {"messages": [["human", "hello world"]]}
+    assert events[1]["n"] == "executer_docker"
+    assert events[1]["out"]["error"]["details"] == "boom"
+    assert events[2]["n"] == "debug_code"
+    assert events[2]["h"] == recorder.prompt_digest(prompt)
+    assert events[2]["out"] == {"answer": 42}
+
+
+def test_recorded_run_is_replayed(tmp_path, monkeypatch):
+    # The replayer compiles the graph, which needs langgraph
+    pytest.importorskip("langgraph")
+    from tracing.replay import TraceReplayer, read_trace
+
+    enable_tracing(monkeypatch, tmp_path)
+    path, prompt = record_run()
+    replayer = TraceReplayer(read_trace(path))
+    assert replayer.recorded_nodes == ["executer_docker", "debug_code"]
+
+    token = recorder.current_replay.set(replayer)
+    try:
+        # Docker nodes return their recorded output without running
+        output = asyncio.run(traced("executer_docker", pytest.fail)({"iterations": 0}))
+    finally:
+        recorder.current_replay.reset(token)
+    assert output["error"] == ErrorMessage(type="Execution Error", details="boom")
+
+    schema = SimpleNamespace(parse_obj=lambda value: value)
+    assert replayer.llm_output("debug_code", schema, prompt) == {"answer": 42}
+    assert replayer.llm_fallbacks == 0
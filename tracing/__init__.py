@@ -0,0 +1,27 @@
+from .recorder import (
+    TraceRecorder,
+    TraceCallbackHandler,
+    current_trace,
+    current_node,
+    current_replay,
+    start_trace,
+    end_trace,
+    traced,
+    record_command,
+    prompt_digest,
+    to_jsonable,
+)
+
+__all__ = [
+    "TraceRecorder",
+    "TraceCallbackHandler",
+    "current_trace",
+    "current_node",
+    "current_replay",
+    "start_trace",
+    "end_trace",
+    "traced",
+    "record_command",
+    "prompt_digest",
+    "to_jsonable",
+]
@@ -0,0 +1,232 @@
+import contextvars
+import functools
+import gzip
+import hashlib
+import inspect
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+
+# own imports
+from utils.settings import get_bool_setting, get_setting
+
+logger = logging.getLogger(__name__)
+
+
+def to_jsonable(value: Any) -> Any:
+    """Pydantic models as dicts, messages as [type, content], the rest as JSON allows."""
+    if isinstance(value, BaseMessage):
+        return [value.type, value.content]
+    if hasattr(value, "dict") and callable(value.dict):
+        return value.dict()
+    if isinstance(value, dict):
+        return {key: to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+def prompt_digest(messages) -> str:
+    """Digest of a prompt (messages, or a string), to find an LLM call's recorded response again."""
+    if isinstance(messages, str):
+        pairs = [["human", messages]]
+    else:
+        pairs = [[m.type, m.content] for m in messages]
+    data = json.dumps(pairs, separators=(",", ":"))
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:16]
+
+
+class TraceRecorder:
+    """
+    Append-only trace of one run: gzip'd JSON lines, one per event, with the time
+    since the start of the run (`s`) and the duration (`d`) in seconds.
+
+    Events (`k`): "run" (inputs), "node" (name, digest of its input state, output),
+    "llm" (node, model, prompt, structured output), "cmd" (command, return code,
+    output) and "end".
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def offset(self) -> float:
+        return round(time.monotonic() - self._started_at, 4)
+
+    def write(self, kind: str, **fields):
+        line = json.dumps({"k": kind, **fields}, separators=(",", ":"), default=repr)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+# Recorder of the run being executed, and the graph node it is in
+current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+current_node: contextvars.ContextVar = contextvars.ContextVar("current_node", default=None)
+# Replayer running the graph against a trace (see tracing.replay)
+current_replay: contextvars.ContextVar = contextvars.ContextVar("current_replay", default=None)
+
+
+def start_trace(session_id: str, inputs: dict) -> Optional[TraceRecorder]:
+    """
+    Start recording the run when tracing is enabled.
+
+    [TRACING]
+    enabled = false
+    directory = traces
+    """
+    if not get_bool_setting("TRACING", "enabled", False) or current_replay.get() is not None:
+        return None
+    session = re.sub(r"[^A-Za-z0-9_-]+", "-", session_id or "local")
+    path = os.path.join(
+        get_setting("TRACING", "directory", "traces"),
+        f"{time.strftime('%Y%m%d-%H%M%S')}-{session}.jsonl.gz",
+    )
+    recorder = TraceRecorder(path)
+    recorder.write("run", at=time.time(), session=session_id, inputs=to_jsonable(inputs))
+    current_trace.set(recorder)
+    logger.info("Recording the run to %s", path)
+    return recorder
+
+
+def end_trace(recorder: Optional[TraceRecorder], error: Optional[str] = None):
+    if recorder is None:
+        return
+    recorder.write("end", s=recorder.offset(), error=error)
+    recorder.close()
+    current_trace.set(None)
+
+
+def traced(node: str, function: Callable) -> Callable:
+    """
+    Graph node that records its input digest, output and timing into the current
+    trace, and returns the recorded output instead of running when a replay asks so.
+    """
+
+    @functools.wraps(function)
+    async def node_function(state):
+        replay = current_replay.get()
+        if replay is not None and replay.stubs(node):
+            return replay.node_output(node)
+
+        token = current_node.set(node)
+        recorder = current_trace.get()
+        started_at = recorder.offset() if recorder else 0.0
+        try:
+            result = function(state)
+            if inspect.isawaitable(result):
+                result = await result
+        finally:
+            current_node.reset(token)
+        if recorder is not None:
+            recorder.write(
+                "node",
+                n=node,
+                s=started_at,
+                d=round(recorder.offset() - started_at, 4),
+                input=hashlib.sha1(
+                    json.dumps(to_jsonable(state), sort_keys=True, default=repr).encode()
+                ).hexdigest()[:16],
+                out=to_jsonable(result),
+            )
+            recorder.flush()
+        if replay is not None:
+            replay.node_done(node)
+        return result
+
+    return node_function
+
+
+def record_command(
+    command: List[str], started_at: float, returncode: Optional[int], stdout: str, stderr: str
+):
+    """Called by executor.compose.run_command for every subprocess it ran."""
+    recorder = current_trace.get()
+    if recorder is None:
+        return
+    duration = time.monotonic() - started_at
+    recorder.write(
+        "cmd",
+        n=current_node.get(),
+        s=round(recorder.offset() - duration, 4),
+        d=round(duration, 4),
+        c=[str(part) for part in command],
+        rc=returncode,
+        o=stdout,
+        e=stderr,
+    )
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """Records the prompt and the structured output of every chat model call."""
+
+    def __init__(self):
+        self._started: Dict[object, tuple] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        recorder = current_trace.get()
+        if recorder is None:
+            return
+        params = kwargs.get("invocation_params") or {}
+        self._started[run_id] = (
+            recorder,
+            current_node.get(),
+            params.get("model") or params.get("model_name"),
+            recorder.offset(),
+            messages[0] if messages else [],
+        )
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        recorder, node, model, started_at, prompt = started
+        message = getattr(response.generations[0][0], "message", None) if response.generations else None
+        tool_calls = getattr(message, "tool_calls", None) or []
+        recorder.write(
+            "llm",
+            n=node,
+            m=model,
+            s=started_at,
+            d=round(recorder.offset() - started_at, 4),
+            h=prompt_digest(prompt),
+            p=to_jsonable(prompt),
+            f=tool_calls[0]["name"] if tool_calls else None,
+            out=tool_calls[0]["args"] if tool_calls else getattr(message, "content", None),
+            usage=(response.llm_output or {}).get("token_usage"),
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        recorder, node, model, started_at, _ = started
+        recorder.write(
+            "llm",
+            n=node,
+            m=model,
+            s=started_at,
+            d=round(recorder.offset() - started_at, 4),
+            error=f"{type(error).__name__}: {error}",
+        )
@@ -0,0 +1,287 @@
+"""
+Re-runs the agents graph against a recorded trace, without OpenAI or Docker:
+LLM calls get their recorded structured output, and the nodes that drive Docker
+return their recorded output. Everything else (routing, prompt rendering, state
+merging, file writes, snapshots) runs for real, so the replay measures the
+orchestration layer on its own.
+
+    python -m tracing.replay traces/20240101-120000-session.jsonl.gz --repeat 5
+    python -m tracing.replay trace.jsonl.gz --profile replay.prof
+"""
+
+import argparse
+import asyncio
+import contextlib
+import cProfile
+import gzip
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
+
+# own imports
+import knowledge.fix_cache
+import knowledge.project_index
+from graph import build_graph
+from schemas import Codes, DockerFile, DockerFiles, ErrorMessage, TestSuite
+from tracing.recorder import current_node, current_replay, prompt_digest
+from utils.log_pipeline import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Nodes that run containers, replayed from their recorded output
+DOCKER_NODES = ("executer_docker", "log_docker_errors", "tester")
+
+MODEL_FIELDS = {
+    "codes": Codes,
+    "docker_files": DockerFiles,
+    "reference_docker_files": DockerFile,
+    "error": ErrorMessage,
+    "tests": TestSuite,
+}
+MESSAGE_TYPES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+
+
+class ReplayDivergence(Exception):
+    """The replayed run asked for something the trace does not have."""
+
+
+def read_trace(path: str) -> List[dict]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_value(key: str, value):
+    """Graph state value from its recorded form."""
+    if value is None:
+        return None
+    if key in MODEL_FIELDS:
+        return MODEL_FIELDS[key].parse_obj(value)
+    if key == "messages":
+        return [MESSAGE_TYPES.get(kind, HumanMessage)(content=content) for kind, content in value]
+    return value
+
+
+def load_state(data: dict) -> dict:
+    return {key: load_value(key, value) for key, value in data.items()}
+
+
+class ReplayStructuredModel:
+    def __init__(self, replayer: "TraceReplayer", schema):
+        self.replayer = replayer
+        self.schema = schema
+
+    def invoke(self, prompt, config=None, **kwargs):
+        return self.replayer.llm_output(current_node.get(), self.schema, prompt)
+
+    async def ainvoke(self, prompt, config=None, **kwargs):
+        return self.invoke(prompt, config, **kwargs)
+
+
+class ReplayModel:
+    model_name = "replay"
+
+    def __init__(self, replayer: "TraceReplayer"):
+        self.replayer = replayer
+
+    def with_structured_output(self, schema, **kwargs):
+        return ReplayStructuredModel(self.replayer, schema)
+
+
+class ReplayModelRouter:
+    """Model router whose models answer from the trace."""
+
+    def __init__(self, replayer: "TraceReplayer"):
+        self.replayer = replayer
+
+    def for_node(self, node: str, failed_fixes: int = 0) -> ReplayModel:
+        return ReplayModel(self.replayer)
+
+
+@dataclass
+class ReplayResult:
+    """
+    Attributes:
+        duration: Wall time of the replay, i.e. the orchestration overhead.
+        recorded_duration: Wall time of the recorded run.
+        nodes / recorded_nodes: Node sequence of the replay and of the recording.
+        llm_fallbacks: LLM calls whose prompt differed from the recorded one and
+            were answered by call order instead.
+        unused_llm_calls: Recorded LLM calls the replay never made (e.g. a project
+            reused or a fix taken from the cache where the recording called the LLM).
+    """
+
+    state: Optional[dict]
+    duration: float
+    recorded_duration: float
+    nodes: List[str] = field(default_factory=list)
+    recorded_nodes: List[str] = field(default_factory=list)
+    llm_fallbacks: int = 0
+    unused_llm_calls: int = 0
+
+    @property
+    def diverged(self) -> bool:
+        return (
+            self.nodes != self.recorded_nodes
+            or self.llm_fallbacks > 0
+            or self.unused_llm_calls > 0
+        )
+
+
+@contextlib.contextmanager
+def isolated_knowledge(workspace: str):
+    """
+    Empty project index and fix cache in the replay's workspace, in place of the
+    process wide ones: a replay neither reads the projects and fixes learned since
+    the recording nor writes to knowledge_base.
+    """
+    directory = os.path.join(workspace, "knowledge")
+    saved = knowledge.project_index._project_index, knowledge.fix_cache._fix_cache
+    knowledge.project_index._project_index = knowledge.project_index.ProjectIndex(directory)
+    knowledge.fix_cache._fix_cache = knowledge.fix_cache.FixCache(
+        os.path.join(directory, "fix_cache.json")
+    )
+    try:
+        yield
+    finally:
+        knowledge.project_index._project_index, knowledge.fix_cache._fix_cache = saved
+
+
+class TraceReplayer:
+    def __init__(self, events: List[dict], stub_nodes=DOCKER_NODES):
+        self.stub_nodes = set(stub_nodes)
+        runs = [event for event in events if event["k"] == "run"]
+        if not runs:
+            raise ValueError("The trace has no run event")
+        self.run_event = runs[0]
+        self.events = events
+        ends = [event for event in events if event["k"] == "end"]
+        self.recorded_duration = ends[-1]["s"] if ends else 0.0
+        self.recorded_nodes = [event["n"] for event in events if event["k"] == "node"]
+        self._reset()
+
+    @classmethod
+    def from_file(cls, path: str, stub_nodes=DOCKER_NODES) -> "TraceReplayer":
+        return cls(read_trace(path), stub_nodes)
+
+    def _reset(self):
+        self.nodes: List[str] = []
+        self.llm_fallbacks = 0
+        self._node_outputs: Dict[str, Deque[dict]] = defaultdict(deque)
+        self._llm_calls: Dict[str, List[dict]] = defaultdict(list)
+        for event in self.events:
+            if event["k"] == "node":
+                self._node_outputs[event["n"]].append(event["out"])
+            elif event["k"] == "llm" and "error" not in event:
+                self._llm_calls[event["n"]].append(event)
+
+    def stubs(self, node: str) -> bool:
+        return node in self.stub_nodes
+
+    def node_output(self, node: str) -> dict:
+        self.nodes.append(node)
+        if not self._node_outputs[node]:
+            raise ReplayDivergence(f"Node {node} ran more often than in the trace")
+        return load_state(self._node_outputs[node].popleft())
+
+    def node_done(self, node: str):
+        self.nodes.append(node)
+        if self._node_outputs[node]:
+            self._node_outputs[node].popleft()
+
+    def llm_output(self, node: Optional[str], schema, prompt):
+        calls = self._llm_calls[node]
+        if not calls:
+            raise ReplayDivergence(f"Node {node} made more LLM calls than in the trace")
+        # Concurrent calls finish in any order, so calls are matched on their prompt
+        digest = prompt_digest(prompt)
+        index = next((i for i, call in enumerate(calls) if call["h"] == digest), None)
+        if index is None:
+            self.llm_fallbacks += 1
+            logger.warning("Prompt of a %s call differs from the trace", node)
+            index = 0
+        return schema.parse_obj(calls.pop(index)["out"])
+
+    async def run(self, workspace: Optional[str] = None) -> ReplayResult:
+        """Replay the run in `workspace` (a temporary directory by default)."""
+        self._reset()
+        workspace = workspace or tempfile.mkdtemp(prefix="replay-")
+        file_path = os.path.join(workspace, "src")
+        test_path = os.path.join(workspace, "test")
+        os.makedirs(file_path, exist_ok=True)
+        os.makedirs(test_path, exist_ok=True)
+        app = build_graph(file_path, test_path, router=ReplayModelRouter(self))
+        inputs = load_state(self.run_event["inputs"])
+
+        token = current_replay.set(self)
+        started_at = time.monotonic()
+        state = None
+        try:
+            with isolated_knowledge(workspace):
+                state = await app.ainvoke(inputs, config=RunnableConfig(recursion_limit=30))
+        finally:
+            current_replay.reset(token)
+        return ReplayResult(
+            state=state,
+            duration=time.monotonic() - started_at,
+            recorded_duration=self.recorded_duration,
+            nodes=list(self.nodes),
+            recorded_nodes=self.recorded_nodes,
+            llm_fallbacks=self.llm_fallbacks,
+            unused_llm_calls=sum(len(calls) for calls in self._llm_calls.values()),
+        )
+
+
+async def replay_benchmark(path: str, repeat: int = 1) -> List[ReplayResult]:
+    replayer = TraceReplayer.from_file(path)
+    results = []
+    for _ in range(repeat):
+        results.append(await replayer.run())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded run without OpenAI or Docker")
+    parser.add_argument("trace", help="Trace file (.jsonl.gz) written with [TRACING] enabled")
+    parser.add_argument("--repeat", type=int, default=1, help="Replays to time")
+    parser.add_argument("--profile", default=None, help="Write cProfile stats of the replays here")
+    args = parser.parse_args()
+
+    setup_logging()
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    results = asyncio.run(replay_benchmark(args.trace, args.repeat))
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+
+    durations = sorted(result.duration for result in results)
+    last = results[-1]
+    print(
+        json.dumps(
+            {
+                "replays": len(results),
+                "recorded_seconds": round(last.recorded_duration, 3),
+                "replay_seconds_min": round(durations[0], 4),
+                "replay_seconds_median": round(durations[len(durations) // 2], 4),
+                "nodes": last.nodes,
+                "diverged": last.diverged,
+                "llm_fallbacks": last.llm_fallbacks,
+                "unused_llm_calls": last.unused_llm_calls,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+from .docker_templates import detect_runtime, render_docker_files
+
+__all__ = ["detect_runtime", "render_docker_files"]
@@ -0,0 +1,139 @@
+import hashlib
+import logging
+import mmap
+import os
+import re
+import shutil
+import tempfile
+from typing import Iterable, Optional, Set
+
+# own imports
+from utils.log_pipeline import excerpt
+from utils.settings import get_int_setting, get_setting
+
+logger = logging.getLogger(__name__)
+
+# First line of a file content kept in the artifact store instead of in the state
+REFERENCE_PATTERN = re.compile(
+    r"\A\[artifact sha256:(?P<digest>[0-9a-f]{64}) (?P<size>\d+) bytes\]\n"
+)
+
+
+class ArtifactStore:
+    """
+    Content-addressed store (`ab/abcd...`) of generated files too large to carry in
+    the graph state.
+
+    A large file content is written here once, and the state keeps a reference in
+    its place: a header line with the content's hash and size, followed by the first
+    `excerpt_chars` characters. The reference is what goes into messages, prompts,
+    session records and traces, so a big data file is held in memory once instead of
+    once per copy of the state. Writing the file into a workspace copies the blob
+    (in the kernel where the platform allows), without reading it into Python.
+    """
+
+    def __init__(self, directory: str, threshold_chars: int = 32768, excerpt_chars: int = 1500):
+        self.directory = directory
+        self.threshold_chars = threshold_chars
+        self.excerpt_chars = excerpt_chars
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def is_reference(text: Optional[str]) -> bool:
+        return bool(text) and REFERENCE_PATTERN.match(text) is not None
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def reference_path(self, reference: str) -> str:
+        return self.path(REFERENCE_PATTERN.match(reference).group("digest"))
+
+    def offload(self, text: str) -> str:
+        """
+        Reference to `text` when it is over the threshold (and is stored), `text`
+        itself otherwise. Escaped newlines are unescaped before storing, like the
+        agents do before writing a file.
+        """
+        if text is None or len(text) < self.threshold_chars or self.is_reference(text):
+            return text
+        data = text.replace("\\n", "\n").encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(temporary_path, 0o444)
+            os.replace(temporary_path, path)
+            logger.info("Stored a %d bytes artifact as %s", len(data), digest[:12])
+        head = data[: self.excerpt_chars * 4].decode("utf-8", "ignore")[: self.excerpt_chars]
+        return (
+            f"[artifact sha256:{digest} {len(data)} bytes]\n{head}\n"
+            f"[... rest of the file omitted ...]"
+        )
+
+    def normalized(self, text: str) -> str:
+        """File content with escaped newlines unescaped; references are kept as they are."""
+        return text if self.is_reference(text) else text.replace("\\n", "\n")
+
+    def write(self, text: str, target: str):
+        """Write a file content (or the artifact it references) to `target`."""
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        if self.is_reference(text):
+            shutil.copyfile(self.reference_path(text), target)
+            return
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(text.replace("\\n", "\n"))
+
+
+def artifact_filenames(codes: Iterable) -> Set[str]:
+    """
+    Normalized paths of the project files held as artifact references. The LLM only
+    ever sees their excerpt, so a version of them it returns must not be written.
+    """
+    return {
+        os.path.normpath(code.filename)
+        for code in codes
+        if ArtifactStore.is_reference(code.code)
+    }
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file, hashed through a memory map instead of reads into Python buffers."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+    return digest.hexdigest()
+
+
+def prompt_excerpt(text: Optional[str]) -> Optional[str]:
+    """
+    Tail of a build or program output, bounded for error messages and prompts.
+
+    [ARTIFACTS]
+    prompt_chars = 6000
+    """
+    return excerpt(text, get_int_setting("ARTIFACTS", "prompt_chars", 6000))
+
+
+_artifact_store: Optional[ArtifactStore] = None
+
+
+def get_artifact_store() -> ArtifactStore:
+    """
+    [ARTIFACTS]
+    directory = generated/artifacts
+    threshold_chars = 32768
+    excerpt_chars = 1500
+    """
+    global _artifact_store
+    if _artifact_store is None:
+        _artifact_store = ArtifactStore(
+            get_setting("ARTIFACTS", "directory", os.path.join("generated", "artifacts")),
+            get_int_setting("ARTIFACTS", "threshold_chars", 32768),
+            get_int_setting("ARTIFACTS", "excerpt_chars", 1500),
+        )
+    return _artifact_store
@@ -0,0 +1,361 @@
+import hashlib
+import json
+import os
+import re
+import shlex
+from dataclasses import dataclass
+from typing import List, Optional
+
+import yaml
+
+# own imports
+from schemas import Codes, DockerFile
+
+# Known-good base images for the runtimes we can dockerize without the LLM
+PYTHON_BASE_IMAGE = "python:3.12-slim"
+NODE_BASE_IMAGE = "node:20-alpine"
+
+# Server frameworks by dependency name, with the port they listen on by default
+PYTHON_SERVER_PORTS = {
+    "flask": 5000,
+    "fastapi": 8000,
+    "uvicorn": 8000,
+    "gunicorn": 8000,
+    "django": 8000,
+    "aiohttp": 8080,
+    "tornado": 8888,
+    "streamlit": 8501,
+}
+NODE_SERVER_PORTS = {
+    "express": 3000,
+    "fastify": 3000,
+    "koa": 3000,
+    "@hapi/hapi": 3000,
+    "@nestjs/core": 3000,
+    "next": 3000,
+}
+# Port a program sets explicitly: port=8080, --port 8080, .listen(8080), PORT || 8080
+_PORT_IN_SOURCE = re.compile(
+    r"\bport\s*[=:]\s*(\d{2,5})\b|--port[= ](\d{2,5})\b|\.listen\(\s*(\d{2,5})\b"
+    r"|\bPORT\s*(?:\|\||\?\?|,)\s*(\d{2,5})\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class RuntimeSpec:
+    """
+    Describes how a generated project should be built and started.
+
+    Attributes:
+        runtime: "python" or "node".
+        entrypoint: Filename of the executable code (relative to the project root).
+        manifests: Dependency manifests found in the project (copied before the sources).
+        command: Exec-form command used as the container CMD.
+        port: Port of a web server project (exposed by the templates), None otherwise.
+    """
+
+    runtime: str
+    entrypoint: str
+    manifests: List[str]
+    command: List[str]
+    port: Optional[int] = None
+
+
+def _find_file(codes: Codes, filename: str) -> Optional[str]:
+    for code in codes.codes:
+        if os.path.normpath(code.filename) == filename:
+            return code.filename
+    return None
+
+
+def _entrypoint(codes: Codes, executable_file_name: Optional[str]) -> Optional[str]:
+    if executable_file_name:
+        return executable_file_name
+    for code in codes.codes:
+        if code.executable_code:
+            return code.filename
+    return None
+
+
+def _command_from_execution_command(
+    execution_command: str, interpreter: str, entrypoint: str
+) -> List[str]:
+    """
+    Use the generator's execution command when it runs the entry point with the
+    expected interpreter (e.g. "python main.py --verbose"), otherwise fall back
+    to a plain "<interpreter> <entrypoint>".
+    """
+    try:
+        parts = shlex.split(execution_command or "")
+    except ValueError:
+        parts = []
+
+    if len(parts) >= 2 and os.path.basename(parts[0]).startswith(interpreter):
+        if os.path.basename(parts[1]) == os.path.basename(entrypoint):
+            return [interpreter, entrypoint] + parts[2:]
+    return [interpreter, entrypoint]
+
+
+def _dependencies(codes: Codes, runtime: str) -> List[str]:
+    """Dependency names listed in requirements.txt or package.json, lowercased."""
+    if runtime == "python":
+        filename = _find_file(codes, "requirements.txt")
+        if filename is None:
+            return []
+        content = next(c.code for c in codes.codes if c.filename == filename)
+        return [
+            re.split(r"[<>=!~\[; ]", line.strip(), 1)[0].lower()
+            for line in content.splitlines()
+            if line.strip() and not line.strip().startswith(("#", "-"))
+        ]
+    filename = _find_file(codes, "package.json")
+    if filename is None:
+        return []
+    try:
+        package = json.loads(next(c.code for c in codes.codes if c.filename == filename))
+    except ValueError:
+        return []
+    if not isinstance(package, dict):
+        return []
+    return [name.lower() for name in (package.get("dependencies") or {})]
+
+
+def _server_port(codes: Codes, runtime: str) -> Optional[int]:
+    """
+    Port of a project that depends on a web server framework: the port its sources
+    or execution command set, else the framework's default. None for other projects.
+    """
+    defaults = PYTHON_SERVER_PORTS if runtime == "python" else NODE_SERVER_PORTS
+    framework_ports = [
+        defaults[name] for name in _dependencies(codes, runtime) if name in defaults
+    ]
+    if not framework_ports:
+        return None
+    for text in [codes.execution_command or ""] + [code.code for code in codes.codes]:
+        for match in _PORT_IN_SOURCE.finditer(text):
+            port = int(next(group for group in match.groups() if group))
+            if 0 < port < 65536:
+                return port
+    return framework_ports[0]
+
+
+def detect_runtime(
+    codes: Codes, executable_file_name: Optional[str] = None
+) -> Optional[RuntimeSpec]:
+    """
+    Detect the runtime and entry point of a generated project from its files.
+    Returns None for stacks we do not have a template for.
+    """
+    entrypoint = _entrypoint(codes, executable_file_name)
+    if not entrypoint:
+        return None
+
+    extension = os.path.splitext(entrypoint)[1].lower()
+
+    if extension == ".py":
+        manifests = [
+            m for m in ("requirements.txt",) if _find_file(codes, m) is not None
+        ]
+        command = _command_from_execution_command(
+            codes.execution_command, "python", entrypoint
+        )
+        return RuntimeSpec(
+            "python", entrypoint, manifests, command, _server_port(codes, "python")
+        )
+
+    if extension in (".js", ".mjs", ".cjs"):
+        manifests = [
+            m
+            for m in ("package.json", "package-lock.json")
+            if _find_file(codes, m) is not None
+        ]
+        command = _command_from_execution_command(
+            codes.execution_command, "node", entrypoint
+        )
+        return RuntimeSpec("node", entrypoint, manifests, command, _server_port(codes, "node"))
+
+    return None
+
+
+def _exec_form(command: List[str]) -> str:
+    return json.dumps(command)
+
+
+def _python_dockerfile(spec: RuntimeSpec) -> str:
+    lines = [
+        f"FROM {PYTHON_BASE_IMAGE}",
+        "",
+        "ENV PYTHONDONTWRITEBYTECODE=1 \\",
+        "    PYTHONUNBUFFERED=1",
+        "",
+        "WORKDIR /app",
+        "",
+    ]
+    if spec.manifests:
+        # Manifests first, so dependency layers are reused when only sources change
+        lines += [
+            "COPY requirements.txt ./",
+            "RUN pip install --no-cache-dir -r requirements.txt",
+            "",
+        ]
+    lines += ["COPY . .", ""]
+    if spec.port:
+        lines += [f"EXPOSE {spec.port}", ""]
+    lines += [f"CMD {_exec_form(spec.command)}", ""]
+    return "\n".join(lines)
+
+
+def _node_dockerfile(spec: RuntimeSpec) -> str:
+    lines = [
+        f"FROM {NODE_BASE_IMAGE}",
+        "",
+        "ENV NODE_ENV=production",
+        "",
+        "WORKDIR /app",
+        "",
+    ]
+    if "package.json" in spec.manifests:
+        # Manifests first, so dependency layers are reused when only sources change
+        install = (
+            "npm ci --omit=dev"
+            if "package-lock.json" in spec.manifests
+            else "npm install --omit=dev --no-audit --no-fund"
+        )
+        lines += [
+            "COPY package*.json ./",
+            f"RUN {install}",
+            "",
+        ]
+    lines += ["COPY . .", ""]
+    if spec.port:
+        lines += [f"EXPOSE {spec.port}", ""]
+    lines += [f"CMD {_exec_form(spec.command)}", ""]
+    return "\n".join(lines)
+
+
+def _compose(image_name: str, container_name: str, port: Optional[int] = None) -> str:
+    lines = [
+        "services:",
+        "  app:",
+        "    build: .",
+        f"    image: {image_name}",
+        f"    container_name: {container_name}",
+        '    restart: "no"',
+    ]
+    if port:
+        # Published on a free host port, so sessions never compete for the same one
+        lines += ["    ports:", f'      - "{port}"']
+    return "\n".join(lines + [""])
+
+
+def _project_slug(codes: Codes, spec: RuntimeSpec) -> str:
+    """
+    Stable, docker-safe name for the project, derived from its files so the same
+    project of a session always maps to the same image (and its cached layers).
+    """
+    digest = hashlib.sha1()
+    for code in sorted(codes.codes, key=lambda c: c.filename):
+        digest.update(code.filename.encode("utf-8"))
+    digest.update(spec.entrypoint.encode("utf-8"))
+
+    base = os.path.splitext(os.path.basename(spec.entrypoint))[0].lower()
+    base = re.sub(r"[^a-z0-9_.-]+", "-", base).strip("-.") or "app"
+    return f"{spec.runtime}-{base}-{digest.hexdigest()[:8]}"
+
+
+def scoped_name(project_name: str, name: str) -> str:
+    """Container or image name prefixed with the session's compose project."""
+    if not name or name.startswith(f"{project_name}-"):
+        return name
+    return f"{project_name}-{name}".lower()
+
+
+def scope_docker_files(docker_file: DockerFile, project_name: str) -> DockerFile:
+    """
+    Prefix the container names, and the images built from the workspace, of Docker
+    files written by the LLM (or reused from a stored project) with the session's
+    compose project, so two sessions never share a container or an image tag.
+    Images pulled from a registry keep their name. When the compose file no longer
+    has the container of `docker_container_name`, the built service's container is
+    the one to watch.
+    """
+    try:
+        compose = yaml.safe_load(docker_file.docker_compose)
+    except yaml.YAMLError:
+        return docker_file
+    services = compose.get("services") if isinstance(compose, dict) else None
+    if not isinstance(services, dict):
+        return docker_file
+
+    renamed = {}
+    containers = []
+    for service in services.values():
+        if not isinstance(service, dict):
+            continue
+        keys = ["container_name"] + (["image"] if "build" in service else [])
+        for key in keys:
+            name = service.get(key)
+            if isinstance(name, str) and scoped_name(project_name, name) != name:
+                renamed[name] = service[key] = scoped_name(project_name, name)
+        name = service.get("container_name")
+        if isinstance(name, str):
+            # The containers of built services run the project, they come first
+            containers.insert(0 if "build" in service else len(containers), name)
+
+    container_name = renamed.get(
+        docker_file.docker_container_name,
+        scoped_name(project_name, docker_file.docker_container_name),
+    )
+    if containers and container_name not in containers:
+        container_name = containers[0]
+    return DockerFile(
+        description=docker_file.description,
+        dockerfile=docker_file.dockerfile,
+        docker_compose=(
+            yaml.safe_dump(compose, sort_keys=False) if renamed else docker_file.docker_compose
+        ),
+        docker_image_name=renamed.get(
+            docker_file.docker_image_name, docker_file.docker_image_name
+        ),
+        docker_container_name=container_name,
+    )
+
+
+def render_docker_files(
+    codes: Codes,
+    executable_file_name: Optional[str] = None,
+    project_name: Optional[str] = None,
+) -> Optional[DockerFile]:
+    """
+    Render a Dockerfile and compose.yaml for a recognized runtime. The container
+    and image are named after the session's compose project (`project_name`).
+    Returns None when the stack is not recognized and the LLM should be used instead.
+    """
+    spec = detect_runtime(codes, executable_file_name)
+    if spec is None:
+        return None
+
+    if spec.runtime == "python":
+        dockerfile = _python_dockerfile(spec)
+    else:
+        dockerfile = _node_dockerfile(spec)
+
+    slug = _project_slug(codes, spec)
+    prefix = project_name or "codegen"
+    image_name = f"{prefix}-{slug}:latest"
+    container_name = f"{prefix}-{slug}"
+
+    return DockerFile(
+        description=(
+            f"Template-based {spec.runtime} setup. Dependency manifests "
+            f"({', '.join(spec.manifests) or 'none'}) are copied and installed before "
+            f"the sources so dependency layers stay cached; the container runs "
+            f"`{' '.join(spec.command)}`"
+            + (f" and publishes port {spec.port}." if spec.port else ".")
+        ),
+        dockerfile=dockerfile,
+        docker_compose=_compose(image_name, container_name, spec.port),
+        docker_image_name=image_name,
+        docker_container_name=container_name,
+    )
@@ -0,0 +1,150 @@
+import abc
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Event:
+    """
+    Something the agents want the user to see.
+
+    Attributes:
+        kind: "code", "error", "status" or "step".
+        content: Text of the event.
+        language: Programming language of "code" events.
+        name: File of "code" events, graph node of "step" events.
+    """
+
+    kind: str
+    content: str
+    language: Optional[str] = None
+    name: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+
+
+class EventSink:
+    """Receives the events of a run. The default sink only logs them."""
+
+    async def send(self, event: Event):
+        logger.info("[%s] %s", event.kind, event.content[:500])
+
+
+class CollectingEventSink(EventSink):
+    """Keeps the events of a run in memory, for headless runs."""
+
+    def __init__(self):
+        self.events: List[Event] = []
+
+    async def send(self, event: Event):
+        self.events.append(event)
+        await super().send(event)
+
+
+class BatchingEventSink(EventSink, abc.ABC):
+    """
+    Queues the events of a run and delivers them from a background task, so the
+    agents never wait on the UI. Events sent within `flush_interval` seconds of the
+    first queued one (at most `max_batch`) are delivered together, in order, with
+    one call to `deliver`. Delivery errors are logged and do not reach the agents.
+    """
+
+    def __init__(self, flush_interval: float = 0.3, max_batch: int = 50):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.batches = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @abc.abstractmethod
+    async def deliver(self, events: List[Event]):
+        pass
+
+    async def send(self, event: Event):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+        self._queue.put_nowait(event)
+
+    async def _next_batch(self) -> tuple:
+        """(events, closed): the queued events of the next batch, and if close() was called."""
+        loop = asyncio.get_running_loop()
+        event = await self._queue.get()
+        if event is None:
+            return [], True
+        batch = [event]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if event is None:
+                return batch, True
+            batch.append(event)
+        return batch, False
+
+    async def _flush_loop(self):
+        closed = False
+        while not closed:
+            batch, closed = await self._next_batch()
+            if not batch:
+                continue
+            self.batches += 1
+            try:
+                await self.deliver(batch)
+            except Exception:
+                logger.exception("Could not deliver %d events", len(batch))
+
+    async def close(self):
+        """Deliver the queued events and stop the background task."""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+
+# Sink of the run being executed, set by the caller of the graph
+current_event_sink: contextvars.ContextVar = contextvars.ContextVar(
+    "current_event_sink", default=EventSink()
+)
+
+
+async def emit(
+    content: str,
+    kind: str = "status",
+    language: Optional[str] = None,
+    name: Optional[str] = None,
+):
+    await current_event_sink.get().send(Event(kind, content, language, name))
+
+
+def progress_step(node: str, function: Callable) -> Callable:
+    """Graph node that emits "step" events when it starts and when it is done."""
+
+    @functools.wraps(function)
+    async def node_function(state):
+        started_at = time.monotonic()
+        await emit("running", kind="step", name=node)
+        try:
+            result = function(state)
+            if inspect.isawaitable(result):
+                result = await result
+        except Exception:
+            await emit("failed", kind="step", name=node)
+            raise
+        await emit(f"done in {time.monotonic() - started_at:.1f}s", kind="step", name=node)
+        return result
+
+    return node_function
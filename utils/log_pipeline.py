@@ -0,0 +1,175 @@
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from collections import OrderedDict, deque
+
+# own imports
+from utils.settings import get_int_setting, get_setting
+
+# Chat session of the code that is running, attached to every log record
+session_id_var: contextvars.ContextVar = contextvars.ContextVar(
+    "session_id", default="-"
+)
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(session_id)s] %(name)s: %(message)s"
+
+
+class RingBuffer:
+    """
+    Keeps only the last `max_chars` characters written to it, so memory stays flat
+    however much output a build or a program produces.
+    """
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.dropped = 0
+        self._chunks = deque()
+        self._size = 0
+
+    def append(self, text: str):
+        if not text:
+            return
+        if len(text) > self.max_chars:
+            self.dropped += len(text) - self.max_chars
+            text = text[-self.max_chars :]
+        self._chunks.append(text)
+        self._size += len(text)
+        while self._size > self.max_chars:
+            overflow = self._size - self.max_chars
+            head = self._chunks[0]
+            if len(head) <= overflow:
+                self._chunks.popleft()
+                self._size -= len(head)
+                self.dropped += len(head)
+            else:
+                self._chunks[0] = head[overflow:]
+                self._size -= overflow
+                self.dropped += overflow
+
+    def getvalue(self) -> str:
+        text = "".join(self._chunks)
+        if self.dropped:
+            return f"[... {self.dropped} characters dropped ...]\n{text}"
+        return text
+
+    def __len__(self) -> int:
+        return self._size
+
+
+def excerpt(text: str, max_chars: int = 2000) -> str:
+    """Tail of `text` for logs and prompts (errors are usually at the end of the output)."""
+    if text is None or len(text) <= max_chars:
+        return text
+    return f"[... {len(text) - max_chars} characters omitted ...]\n{text[-max_chars:]}"
+
+
+class SessionFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "session_id"):
+            record.session_id = session_id_var.get()
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full."""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SessionFileHandler(logging.Handler):
+    """
+    Writes each session's records to its own size-capped file (logs/<session>.log).
+    Only the most recently used files are kept open.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_open: int = 32):
+        super().__init__()
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_open = max_open
+        self._handlers: "OrderedDict[str, logging.Handler]" = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+
+    def _handler_for(self, session_id: str) -> logging.Handler:
+        handler = self._handlers.pop(session_id, None)
+        if handler is None:
+            filename = "".join(c if c.isalnum() or c in "-_" else "_" for c in session_id)
+            handler = logging.handlers.RotatingFileHandler(
+                os.path.join(self.directory, f"{filename or 'main'}.log"),
+                maxBytes=self.max_bytes,
+                backupCount=1,
+                encoding="utf-8",
+            )
+            handler.setFormatter(self.formatter)
+        self._handlers[session_id] = handler
+        while len(self._handlers) > self.max_open:
+            _, evicted = self._handlers.popitem(last=False)
+            evicted.close()
+        return handler
+
+    def emit(self, record: logging.LogRecord):
+        session_id = getattr(record, "session_id", "-")
+        if session_id == "-":
+            session_id = "main"
+        self._handler_for(session_id).emit(record)
+
+    def close(self):
+        for handler in self._handlers.values():
+            handler.close()
+        self._handlers.clear()
+        super().close()
+
+
+_listener = None
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """
+    Route all log records through a bounded queue to a background thread that writes
+    them to the console and to per-session log files.
+
+    [LOGGING]
+    level = INFO
+    directory = logs
+    session_max_bytes = 5242880
+    queue_size = 10000
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(formatter)
+
+    file_handler = SessionFileHandler(
+        get_setting("LOGGING", "directory", "logs"),
+        get_int_setting("LOGGING", "session_max_bytes", 5 * 1024 * 1024),
+    )
+    file_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=get_int_setting("LOGGING", "queue_size", 10000))
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SessionFilter())
+
+    root = logging.getLogger()
+    root.setLevel(get_setting("LOGGING", "level", "INFO").upper())
+    root.handlers = [queue_handler]
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,89 @@
+import sys
+import threading
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # Windows: only /proc (not there either) or nothing
+    resource = None
+
+
+def _status_kb(field: str) -> Optional[int]:
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb() -> float:
+    """Resident memory of the process now, in MB (its peak where that is not available)."""
+    kb = _status_kb("VmRSS")
+    return kb / 1024 if kb is not None else peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident memory of the process since it started, or since `reset_peak_rss`.
+    0 where the platform does not report it.
+    """
+    kb = _status_kb("VmHWM")
+    if kb is not None:
+        return kb / 1024
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def reset_peak_rss() -> bool:
+    """Start measuring the peak again from the current RSS (Linux only)."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class RunMemory:
+    """
+    Resident memory of one run: at its start and its peak during the run.
+
+    The peak is that of the whole process. It is reset when a run starts alone, never
+    while other runs are in flight (that would lose their peak), and `shared` tells
+    that another run overlapped this one: its peak is then theirs as much as its own.
+
+        memory = RunMemory().start()
+        ...
+        memory.stop()  # memory.start_mb, memory.peak_mb, memory.shared
+    """
+
+    _active = set()
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.start_mb = 0.0
+        self.peak_mb = 0.0
+        self.shared = False
+
+    def start(self) -> "RunMemory":
+        with self._lock:
+            if self._active:
+                self.shared = True
+                for other in self._active:
+                    other.shared = True
+            else:
+                reset_peak_rss()
+            self._active.add(self)
+        self.start_mb = rss_mb()
+        return self
+
+    def stop(self):
+        self.peak_mb = peak_rss_mb()
+        with self._lock:
+            self._active.discard(self)
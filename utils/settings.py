@@ -0,0 +1,28 @@
+import configparser
+from typing import List, Optional
+
+# Settings are read from the same config.ini as the LLM model name
+config = configparser.ConfigParser()
+config.read("config.ini")
+
+
+def get_setting(section: str, key: str, fallback: Optional[str] = None) -> Optional[str]:
+    return config.get(section, key, fallback=fallback)
+
+
+def get_int_setting(section: str, key: str, fallback: int) -> int:
+    return config.getint(section, key, fallback=fallback)
+
+
+def get_float_setting(section: str, key: str, fallback: float) -> float:
+    return config.getfloat(section, key, fallback=fallback)
+
+
+def get_bool_setting(section: str, key: str, fallback: bool) -> bool:
+    return config.getboolean(section, key, fallback=fallback)
+
+
+def get_list_setting(section: str, key: str, fallback: str = "") -> List[str]:
+    """Comma separated list, e.g. `workers = 127.0.0.1:7001, 127.0.0.1:7002`."""
+    value = config.get(section, key, fallback=fallback)
+    return [item.strip() for item in value.split(",") if item.strip()]